@@ -8,6 +8,24 @@ DB_NAME = "legal_rag_db"
 # Hugging Face Token for Free Inference API
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+# Base URL for the inference models (override to point at a local stand-in)
+HF_API_BASE = os.getenv("HF_API_BASE", "https://router.huggingface.co/hf-inference/models").rstrip("/")
+
+# Outbound inference budget for the whole deployment. HF_CLI_RATE_LIMIT of it
+# (at most half) is reserved for a bulk CLI (app.ingest / app.reindex) running
+# next to the server; each of the WEB_CONCURRENCY workers gets an equal share
+# of the rest (see utils/scheduler.py). Run one CLI at a time to stay within it.
+# HF_RATE_LIMIT=0 disables rate limiting (only HF_MAX_CONCURRENCY applies).
+HF_RATE_LIMIT = max(float(os.getenv("HF_RATE_LIMIT", "10")), 0.0)  # requests per second
+HF_BURST = int(os.getenv("HF_BURST", "20"))
+HF_MAX_CONCURRENCY = int(os.getenv("HF_MAX_CONCURRENCY", "8"))
+HF_CLI_RATE_LIMIT = min(max(float(os.getenv("HF_CLI_RATE_LIMIT", "2")), 0.1), HF_RATE_LIMIT / 2)  # requests per second
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Admin-only surfaces (request profiler) are disabled unless this is set;
+# clients send it in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Create directories ensuring they exist
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("data", exist_ok=True)
\ No newline at end of file
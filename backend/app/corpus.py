@@ -0,0 +1,74 @@
+"""Export or import the whole corpus (laws, sections, vectors) as NDJSON.
+
+Moves a corpus between environments, or from file-based storage into
+MongoDB, without re-uploading the PDFs or paying for the embeddings again.
+Files ending in .gz are gzip-compressed; imports detect gzip by themselves.
+
+    cd backend
+    python -m app.corpus export corpus.ndjson.gz
+    MONGO_URL=mongodb://... python -m app.corpus import corpus.ndjson.gz
+"""
+import sys
+import time
+import argparse
+import logging
+
+from . import database as db
+from .database import connect_db
+from .utils import transfer
+
+def export_corpus(path: str, compress: bool) -> int:
+    lines = 0
+    size = 0
+    with open(path, 'wb') as f:
+        def counted():
+            nonlocal lines
+            for line in transfer.export_lines():
+                lines += 1
+                yield line
+        for chunk in transfer.encode_chunks(counted(), compress=compress):
+            f.write(chunk)
+            size += len(chunk)
+    print(f"  {lines - 2} records, {size / 1024 / 1024:.1f} MB")
+    return 0
+
+def import_corpus(path: str) -> int:
+    with open(path, 'rb') as f:
+        try:
+            result = transfer.import_lines(transfer.decode_lines(f))
+        except transfer.TransferError as e:
+            print(f"❌ {e}")
+            return 1
+    imported, skipped = result["imported"], result["skipped"]
+    print(f"  {imported['law']} laws, {imported['section']} sections, {imported['vector']} vectors (counts verified)")
+    if any(skipped.values()):
+        print(f"⚠️  Skipped records whose law was missing from the export: {skipped}")
+    if result["dangling_duplicates"]:
+        print(f"⚠️  {result['dangling_duplicates']} sections reference a canonical section missing from the export")
+    if result["vector_index_version"] is not None:
+        print(f"  Published vector index v{result['vector_index_version']}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the corpus as NDJSON")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="NDJSON file (.gz for gzip)")
+    parser.add_argument("--gzip", action="store_true", help="Compress the export even without a .gz suffix")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    connect_db()
+    store = "MongoDB" if db.db is not None else "file-based storage"
+
+    started = time.perf_counter()
+    if args.command == "export":
+        print(f"📤 Exporting from {store} to {args.path}...")
+        code = export_corpus(args.path, args.gzip or args.path.endswith(".gz"))
+    else:
+        print(f"📥 Importing {args.path} into {store}...")
+        code = import_corpus(args.path)
+    print(f"{'✅' if code == 0 else '❌'} {args.command.capitalize()} finished in {time.perf_counter() - started:.1f}s")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
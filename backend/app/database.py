@@ -1,4 +1,4 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING, TEXT
 from datetime import datetime
 import logging
 from .config import MONGO_URL, DB_NAME
@@ -11,11 +11,17 @@ laws = None
 sections = None
 queries = None
 vectors = None
+summaries = None
 
 logger = logging.getLogger(__name__)
 
-def connect_db():
-    global client, db, users, laws, sections, queries, vectors
+def connect_db(build_indexes: bool = True):
+    """Connect to MongoDB (file-based storage when unreachable).
+
+    The API builds indexes in the background (build_indexes=False, then
+    create_indexes()); the CLIs build them up front.
+    """
+    global client, db, users, laws, sections, queries, vectors, summaries
     try:
         print("🔄 Attempting to connect to MongoDB...")
         # Connect using the Atlas URL or Localhost
@@ -33,19 +39,10 @@ def connect_db():
         sections = db.sections
         queries = db.queries
         vectors = db.vectors
+        summaries = db.summaries
         
-        # Create indexes
-        print("🔄 Creating database indexes...")
-        try:
-            users.create_index([("email", ASCENDING)], unique=True)
-            laws.create_index([("title", TEXT), ("description", TEXT)], default_language="english")
-            sections.create_index([("content", TEXT)], default_language="english")
-            sections.create_index([("law_id", ASCENDING)])
-            vectors.create_index([("section_id", ASCENDING)])
-            queries.create_index([("timestamp", DESCENDING)])
-            print("✅ Database indexes created!")
-        except Exception as e:
-            print(f"⚠️  Index creation warning: {e}")
+        if build_indexes:
+            create_indexes()
             
         return True
     except Exception as e:
@@ -53,6 +50,37 @@ def connect_db():
         print("  Switching to file-based storage...")
         return False
 
+def create_indexes():
+    """Create all indexes (one round trip per collection)"""
+    print("🔄 Creating database indexes...")
+    try:
+        users.create_indexes([IndexModel([("email", ASCENDING)], unique=True)])
+        laws.create_indexes([
+            IndexModel([("title", TEXT), ("description", TEXT)], default_language="english"),
+            IndexModel([("category", ASCENDING)]),
+            IndexModel([("jurisdiction", ASCENDING), ("year", ASCENDING)])
+        ])
+        create_section_indexes(sections)
+        create_vector_indexes(vectors)
+        queries.create_indexes([IndexModel([("timestamp", DESCENDING)])])
+        summaries.create_indexes([IndexModel([("key", ASCENDING)], unique=True)])
+        print("✅ Database indexes created!")
+    except Exception as e:
+        print(f"⚠️  Index creation warning: {e}")
+
+def create_section_indexes(collection):
+    """Also applied to the shadow collections built by app.reindex"""
+    collection.create_indexes([
+        IndexModel([("content", TEXT)], default_language="english"),
+        # Also serves law_id-only lookups; order pages a law's sections
+        IndexModel([("law_id", ASCENDING), ("order", ASCENDING)]),
+        IndexModel([("duplicate_of", ASCENDING)])
+    ])
+
+def create_vector_indexes(collection):
+    # law_id: the jurisdiction shard of a vector is its law's (cascade deletes, shard-scoped scans)
+    collection.create_indexes([IndexModel([("section_id", ASCENDING)]), IndexModel([("law_id", ASCENDING)])])
+
 def create_admin_user():
     """Create default admin user if DB is connected"""
     if db is not None:
@@ -0,0 +1,161 @@
+"""Bulk corpus ingestion.
+
+Walks a directory of PDFs, extracts and parses them in a process pool,
+embeds sections in batches and bulk-writes to the active store (MongoDB or
+file-based). Completed files are recorded in a checkpoint so an interrupted
+run can simply be restarted.
+
+    cd backend
+    python -m app.ingest /path/to/gazette --workers 4 --category Legal --jurisdiction Punjab
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+
+from .database import connect_db
+from .utils.nlp import extract_text_from_pdf, parse_legal_document, EMBED_BATCH_SIZE
+from .utils import storage, vector_index, dedup
+from .utils.scheduler import priority, use_cli_budget, INGEST
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = "data/ingest_checkpoint.json"
+
+def find_pdfs(root: str) -> List[str]:
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(".pdf"):
+                paths.append(os.path.abspath(os.path.join(dirpath, name)))
+    return sorted(paths)
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def extract_and_parse(path: str) -> Tuple[str, List[Dict[str, Any]], int]:
+    """Process-pool worker: PDF text, parsed sections and file size"""
+    text = extract_text_from_pdf(path)
+    return text, parse_legal_document(text), os.path.getsize(path)
+
+class BulkIngester:
+    def __init__(self, args):
+        self.args = args
+        self.checkpoint = load_checkpoint(args.checkpoint)
+        self.pending: List[Tuple[str, Dict[str, Any]]] = []
+        self.docs_done = 0
+        self.sections_done = 0
+        self.duplicates_done = 0
+        self.failed: List[str] = []
+        self.started = time.perf_counter()
+
+    async def flush(self):
+        """Write buffered documents, then mark them complete in the checkpoint"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        law_ids = await dedup.store_documents([doc for _, doc in pending], self.args.batch_size, publish=False)
+        for (path, doc), law_id in zip(pending, law_ids):
+            self.checkpoint[path] = {
+                "law_id": law_id,
+                "sections": len(doc["sections"]),
+                "ingested_at": datetime.utcnow().isoformat()
+            }
+            self.docs_done += 1
+            self.sections_done += len(doc["sections"])
+            self.duplicates_done += sum(1 for ref in doc["duplicates"] if ref is not None)
+        storage.save_json(self.args.checkpoint, self.checkpoint)
+
+        elapsed = time.perf_counter() - self.started
+        print(f"  {self.docs_done} docs, {self.sections_done} sections "
+              f"({self.docs_done / elapsed:.2f} docs/s, {self.sections_done / elapsed:.1f} sections/s)")
+
+    async def process(self, path: str, pool: ProcessPoolExecutor, slots: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        async with slots:
+            try:
+                text, sections, file_size = await loop.run_in_executor(pool, extract_and_parse, path)
+                # Duplicates are matched against stored sections, so copies within one flush are embedded
+                embedded = await dedup.embed_sections(sections, self.args.batch_size)
+            except Exception as e:
+                logger.error(f"Failed to ingest {path}: {e}")
+                self.failed.append(path)
+                return
+
+        filename = os.path.basename(path)
+        law = {
+            "title": filename[:-4].replace("_", " "),
+            "original_filename": filename,
+            "file_path": path,
+            "category": self.args.category,
+            "jurisdiction": self.args.jurisdiction,
+            "year": self.args.year or datetime.now().year,
+            "description": "",
+            "file_size": file_size
+        }
+        self.pending.append((path, {"law": law, "text": text, "sections": sections, **embedded}))
+        if len(self.pending) >= self.args.flush_every:
+            await self.flush()
+
+    async def run(self, paths: List[str]):
+        # Laws written before a crash but never checkpointed are removed and redone
+        stale = storage.find_law_ids_by_file_path(paths)
+        if stale:
+            print(f"  Removing {len(stale)} partially ingested documents")
+            storage.delete_documents(stale, publish=False)
+
+        slots = asyncio.Semaphore(self.args.workers * 2)
+        with ProcessPoolExecutor(max_workers=self.args.workers) as pool:
+            await asyncio.gather(*(self.process(path, pool, slots) for path in paths))
+        await self.flush()
+
+        # One snapshot for the whole run instead of one per flush
+        if paths:
+            version = vector_index.rebuild()
+            if version is not None:
+                print(f"  Published vector index v{version}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of PDFs")
+    parser.add_argument("directory", help="Directory searched recursively for *.pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="PDF extraction processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Sections per embedding call")
+    parser.add_argument("--flush-every", type=int, default=16, help="Documents per bulk write")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file of completed PDFs")
+    parser.add_argument("--category", default="Legal")
+    parser.add_argument("--jurisdiction", default="Pakistan")
+    parser.add_argument("--year", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    use_cli_budget()
+    connect_db()
+
+    all_paths = find_pdfs(args.directory)
+    ingester = BulkIngester(args)
+    paths = [p for p in all_paths if p not in ingester.checkpoint]
+    print(f"📂 {len(all_paths)} PDFs found, {len(all_paths) - len(paths)} already ingested, {len(paths)} to go")
+
+    with priority(INGEST):
+        asyncio.run(ingester.run(paths))
+
+    elapsed = time.perf_counter() - ingester.started
+    print(f"✅ Ingested {ingester.docs_done} documents / {ingester.sections_done} sections in {elapsed:.1f}s "
+          f"({ingester.docs_done / elapsed:.2f} docs/sec, {ingester.sections_done / elapsed:.1f} sections/sec)")
+    if ingester.duplicates_done:
+        print(f"♻️  {ingester.duplicates_done} near-duplicate sections reused an existing embedding")
+    if ingester.failed:
+        print(f"⚠️  {len(ingester.failed)} files failed and will be retried on the next run")
+    return 1 if ingester.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
 import logging
+import time
 
-from .database import connect_db, create_admin_user, db
-from .routers import auth, documents, search, rag, stats
+from . import startup
+from .routers import auth, documents, search, rag, stats, admin
+from .utils.metrics import begin_request, observe_request, server_timing_header
+from .utils.profiler import ProfilingMiddleware
 
 # Logging Setup
 logging.basicConfig(level=logging.INFO)
@@ -18,22 +23,21 @@ async def lifespan(app: FastAPI):
     print("🚀 LEGAL RAG SYSTEM (CLOUD/LIGHTWEIGHT MODE)")
     print("="*70)
 
-    # Connect to MongoDB
-    connect_db()
-    
-    database_status = "MongoDB Connected" if db is not None else "File-based Storage"
-    print(f" Database: {database_status}")
-
-    # Create default admin user
-    create_admin_user()
+    # Connect, build indexes and warm caches in the background so the
+    # server accepts connections at once (see /api/ready)
+    startup.reset()
+    warm_up = asyncio.create_task(startup.warm_up())
 
     print(" API Server: http://localhost:8000")
     print(" API Documentation: http://localhost:8000/docs")
+    print(" Readiness: http://localhost:8000/api/ready")
     print("="*70 + "\n")
     
     yield
     
     print("\n🔴 Shutting down Legal RAG System...")
+    if not warm_up.done():
+        warm_up.cancel()
 
 app = FastAPI(
     title="Legal RAG System",
@@ -42,12 +46,45 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Must stay inside the @app.middleware ones: it has to run in the endpoint's task
+app.add_middleware(ProfilingMiddleware)
+
+@app.middleware("http")
+async def storage_middleware(request: Request, call_next):
+    """Hold requests that need storage until the database connection is settled"""
+    if request.method == "OPTIONS" or request.url.path in startup.NO_STORAGE_PATHS:
+        return await call_next(request)
+    if not await startup.wait_for_storage():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Service is starting up, please retry"},
+            headers={"Retry-After": "5"}
+        )
+    return await call_next(request)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Record request latency and echo per-stage timings in Server-Timing"""
+    timings = begin_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    
+    # Use the route template so /api/documents/{doc_id} is one series
+    route = request.scope.get("route")
+    observe_request(getattr(route, "path", "unmatched"), elapsed)
+    response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+# Added last so it is outermost: the startup 503 and every other response get
+# CORS headers, and preflights are answered without waiting for storage
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
 
 # Include Routers
@@ -56,6 +93,7 @@ app.include_router(documents.router)
 app.include_router(search.router)
 app.include_router(rag.router)
 app.include_router(stats.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
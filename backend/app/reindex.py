@@ -0,0 +1,382 @@
+"""Offline corpus re-index.
+
+Re-parses every stored law and re-embeds its sections after a change to
+parse_legal_document or the embedding backend. Text comes from the stored
+full text (MongoDB) or the uploaded PDF. Results are written to a shadow
+set of sections/vectors (collections suffixed "_reindex", or
+data/*.reindex.json files) while the API keeps serving the live set; once
+complete, the shadow set is renamed into place together with a vector index
+built from it.
+
+Laws added, edited or deleted while the re-index runs are picked up in
+catch-up rounds before the switch, and anything that slipped in during the
+switch itself is repaired in place afterwards.
+
+    cd backend
+    python -m app.reindex --workers 4
+    python -m app.reindex --source files    # re-extract text from the PDFs too
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Optional
+
+from bson import ObjectId
+from . import database as db
+from .database import connect_db, create_section_indexes, create_vector_indexes
+from .utils.nlp import extract_text_from_pdf, parse_legal_document, create_vector_embeddings, content_hash, EMBED_BATCH_SIZE
+from .utils import storage, vector_index, dedup
+from .utils.scheduler import priority, use_cli_budget, MAINTENANCE
+
+logger = logging.getLogger(__name__)
+
+SHADOW_SUFFIX = "_reindex"
+SHADOW_SECTIONS_FILE = "data/sections.reindex.json"
+SHADOW_VECTORS_FILE = "data/vectors.reindex.json"
+MAX_CATCH_UP_ROUNDS = 3
+
+def list_laws() -> Dict[str, Dict[str, Any]]:
+    """law id -> the fields needed to re-parse it"""
+    if db.db is not None:
+        fields = {"full_text": 1, "file_path": 1, "created_at": 1, "updated_at": 1}
+        return {str(law["_id"]): law for law in db.laws.find({}, fields)}
+    return {law["id"]: law for law in storage.load_json(storage.LAWS_FILE)}
+
+def law_version(law: Dict[str, Any]) -> str:
+    return str(law.get("updated_at") or law.get("created_at") or "")
+
+def read_and_parse(text: Optional[str], file_path: Optional[str], source: str) -> Tuple[str, List[Dict[str, Any]], bool]:
+    """Process-pool worker: (text, parsed sections, whether the text was re-extracted from the PDF)"""
+    from_file = source == "files" or (source == "auto" and not text)
+    if not from_file and not text:
+        raise ValueError("No stored text (use --source files)")
+    if from_file:
+        if not file_path or not os.path.exists(file_path):
+            raise FileNotFoundError(f"Source PDF not found: {file_path}")
+        text = extract_text_from_pdf(file_path)
+    return text or "", parse_legal_document(text or ""), from_file
+
+class ShadowStore:
+    """Sections and vectors being rebuilt, invisible to the API until switch()"""
+
+    def __init__(self):
+        self.index = dedup.SimHashIndex()
+        self.law_updates: Dict[str, Dict[str, Any]] = {}
+        if db.db is not None:
+            self.sections = db.db[f"sections{SHADOW_SUFFIX}"]
+            self.vectors = db.db[f"vectors{SHADOW_SUFFIX}"]
+            # Leftovers of an interrupted run
+            self.sections.drop()
+            self.vectors.drop()
+        else:
+            self.sections_data: List[Dict[str, Any]] = []
+            self.vectors_data: List[Dict[str, Any]] = []
+            self.section_seq = self.vector_seq = 1
+
+    def new_ids(self, count: int) -> List[str]:
+        if db.db is not None:
+            return [str(ObjectId()) for _ in range(count)]
+        ids = [str(self.section_seq + i) for i in range(count)]
+        self.section_seq += count
+        return ids
+
+    def assign_duplicates(self, section_ids: List[str], sections: List[Dict[str, Any]]):
+        """Near-duplicates among the sections re-indexed so far. Returns (duplicate_of, simhash) lists."""
+        duplicate_of, hashes = [], []
+        for section_id, section in zip(section_ids, sections):
+            value = dedup.simhash(section['content'])
+            match = self.index.query(value) if value is not None else None
+            if match is None and value is not None:
+                self.index.add(section_id, value)
+            duplicate_of.append(match)
+            hashes.append(value)
+        return duplicate_of, hashes
+
+    def write(self, law_id: str, section_ids: List[str], sections: List[Dict[str, Any]],
+              duplicate_of: List[Optional[str]], hashes: List[Optional[int]], vectors: List[Optional[List[float]]]):
+        records = [
+            {
+                "id": section_id,
+                "law_id": law_id,
+                "section_number": section.get('section_number', str(i + 1)),
+                "title": section.get('title', f"Section {i + 1}"),
+                "content": section['content'],
+                "content_hash": content_hash(section['content']),
+                "simhash": dedup.to_hex(hashes[i]),
+                "duplicate_of": duplicate_of[i],
+                "order": i
+            }
+            for i, (section_id, section) in enumerate(zip(section_ids, sections))
+        ]
+        vector_docs = [
+            {"section_id": section_id, "law_id": law_id, "vector": vector}
+            for section_id, vector, ref in zip(section_ids, vectors, duplicate_of) if ref is None
+        ]
+        if db.db is not None:
+            if records:
+                self.sections.insert_many([
+                    {"_id": ObjectId(record.pop("id")), **record, "created_at": datetime.utcnow()} for record in records
+                ])
+            if vector_docs:
+                self.vectors.insert_many([{**doc, "created_at": datetime.utcnow()} for doc in vector_docs])
+        else:
+            self.sections_data.extend(records)
+            for doc in vector_docs:
+                self.vectors_data.append({"id": str(self.vector_seq), **doc})
+                self.vector_seq += 1
+
+    def drop_laws(self, law_ids: List[str]):
+        """Remove laws re-processed in a catch-up round, promoting duplicates of their canonical sections"""
+        if not law_ids:
+            return
+        ids = set(law_ids)
+        if db.db is not None:
+            dropped = [str(sec["_id"]) for sec in self.sections.find({"law_id": {"$in": law_ids}}, {"_id": 1})]
+            dependents = [
+                {**sec, "id": str(sec["_id"])}
+                for sec in self.sections.find({"duplicate_of": {"$in": dropped}}, {"law_id": 1, "duplicate_of": 1, "simhash": 1})
+                if sec["law_id"] not in ids
+            ]
+            vectors = {
+                doc["section_id"]: doc["vector"]
+                for doc in self.vectors.find({"section_id": {"$in": dropped}}, {"section_id": 1, "vector": 1})
+            }
+        else:
+            dropped = [sec["id"] for sec in self.sections_data if sec["law_id"] in ids]
+            wanted = set(dropped)
+            dependents = [sec for sec in self.sections_data if sec.get("duplicate_of") in wanted and sec["law_id"] not in ids]
+            vectors = {doc["section_id"]: doc["vector"] for doc in self.vectors_data if doc["section_id"] in wanted}
+        self.index.remove(dropped)
+
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for sec in dependents:
+            groups.setdefault(sec["duplicate_of"], []).append(sec)
+        for canonical_id, members in groups.items():
+            promoted, others = members[0], [sec["id"] for sec in members[1:]]
+            if db.db is not None:
+                self.sections.update_one({"_id": promoted["_id"]}, {"$set": {"duplicate_of": None}})
+                if others:
+                    self.sections.update_many({"_id": {"$in": [ObjectId(i) for i in others]}}, {"$set": {"duplicate_of": promoted["id"]}})
+                self.vectors.insert_one({
+                    "section_id": promoted["id"], "law_id": promoted["law_id"],
+                    "vector": vectors[canonical_id], "created_at": datetime.utcnow()
+                })
+            else:
+                promoted["duplicate_of"] = None
+                for sec in members[1:]:
+                    sec["duplicate_of"] = promoted["id"]
+                self.vectors_data.append({
+                    "id": str(self.vector_seq), "section_id": promoted["id"],
+                    "law_id": promoted["law_id"], "vector": vectors[canonical_id]
+                })
+                self.vector_seq += 1
+            if promoted.get("simhash"):
+                self.index.add(promoted["id"], dedup.from_hex(promoted["simhash"]))
+
+        if db.db is not None:
+            self.sections.delete_many({"law_id": {"$in": law_ids}})
+            self.vectors.delete_many({"law_id": {"$in": law_ids}})
+        else:
+            self.sections_data = [sec for sec in self.sections_data if sec["law_id"] not in ids]
+            self.vectors_data = [doc for doc in self.vectors_data if doc["law_id"] not in ids]
+        for law_id in law_ids:
+            self.law_updates.pop(law_id, None)
+
+    def iter_vector_rows(self):
+        """Stream (section_id, law_id, vector) for every shadow vector"""
+        if db.db is not None:
+            vector_docs = self.vectors.find({}, {"section_id": 1, "law_id": 1, "vector": 1})
+        else:
+            vector_docs = self.vectors_data
+        for doc in vector_docs:
+            yield doc["section_id"], doc["law_id"], doc["vector"]
+
+    def iter_duplicate_sections(self):
+        """Stream (section_id, law_id, canonical section_id) for every shadow near-duplicate"""
+        if db.db is not None:
+            for sec in self.sections.find({"duplicate_of": {"$ne": None}}, {"law_id": 1, "duplicate_of": 1}):
+                yield str(sec["_id"]), sec["law_id"], sec["duplicate_of"]
+        else:
+            for sec in self.sections_data:
+                if sec.get("duplicate_of"):
+                    yield sec["id"], sec["law_id"], sec["duplicate_of"]
+
+    def switch(self):
+        """Replace the live sections and vectors with the shadow set (run by vector_index.rebuild
+        under the exclusive store write lock and the publish lock)"""
+        if db.db is not None:
+            create_section_indexes(self.sections)
+            create_vector_indexes(self.vectors)
+            self.sections.rename("sections", dropTarget=True)
+            self.vectors.rename("vectors", dropTarget=True)
+            for law_id, fields in self.law_updates.items():
+                db.laws.update_one({"_id": ObjectId(law_id)}, {"$set": fields})
+        else:
+            storage.save_json(SHADOW_SECTIONS_FILE, self.sections_data)
+            storage.save_json(SHADOW_VECTORS_FILE, self.vectors_data)
+            os.replace(SHADOW_SECTIONS_FILE, storage.SECTIONS_FILE)
+            os.replace(SHADOW_VECTORS_FILE, storage.VECTORS_FILE)
+            laws_data = storage.load_json(storage.LAWS_FILE)
+            for law in laws_data:
+                law.update(self.law_updates.get(law["id"], {}))
+            storage.save_json(storage.LAWS_FILE, laws_data)
+        storage.bump_store_generation()
+
+class Reindexer:
+    def __init__(self, args):
+        self.args = args
+        self.shadow = ShadowStore()
+        self.processed: Dict[str, str] = {}
+        self.failed: List[str] = []
+        self.docs_done = 0
+        self.sections_done = 0
+        self.embedded = 0
+        self.started = time.perf_counter()
+
+    async def process(self, law_id: str, law: Dict[str, Any], pool: ProcessPoolExecutor, slots: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        async with slots:
+            if self.failed:
+                # The switch is already off; stop spending the inference budget
+                return
+            try:
+                text, sections, from_file = await loop.run_in_executor(
+                    pool, read_and_parse, law.get("full_text"), law.get("file_path"), self.args.source
+                )
+                section_ids = self.shadow.new_ids(len(sections))
+                # Assigned before any await so concurrent laws see each other's canonical sections
+                duplicate_of, hashes = self.shadow.assign_duplicates(section_ids, sections)
+                unique = [i for i, ref in enumerate(duplicate_of) if ref is None]
+                # Strict: a fallback vector would be switched live next to real embeddings
+                embedded = await create_vector_embeddings([sections[i]['content'] for i in unique], self.args.batch_size, strict=True)
+            except Exception as e:
+                logger.error(f"Failed to re-index law {law_id}: {e}")
+                self.failed.append(law_id)
+                return
+
+        vectors: List[Optional[List[float]]] = [None] * len(sections)
+        for i, vector in zip(unique, embedded):
+            vectors[i] = vector
+        self.shadow.write(law_id, section_ids, sections, duplicate_of, hashes, vectors)
+
+        fields: Dict[str, Any] = {"sections_count": len(sections)}
+        if from_file and db.db is not None:
+            fields.update({"full_text": text, "text_preview": text[:500] + "..." if len(text) > 500 else text})
+        self.shadow.law_updates[law_id] = fields
+        self.processed[law_id] = law_version(law)
+        self.docs_done += 1
+        self.sections_done += len(sections)
+        self.embedded += len(unique)
+        if self.docs_done % self.args.report_every == 0:
+            self.report()
+
+    def changes_since_processed(self) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """(laws added or edited, law ids deleted) since they were re-indexed"""
+        current = list_laws()
+        removed = [law_id for law_id in self.processed if law_id not in current]
+        changed = {
+            law_id: law for law_id, law in current.items()
+            if law_id not in self.failed and self.processed.get(law_id) != law_version(law)
+        }
+        return changed, removed
+
+    async def repair(self, laws: Dict[str, Dict[str, Any]], pool: ProcessPoolExecutor):
+        """Re-parse laws written to the old set during the switch, diffing against the live store"""
+        loop = asyncio.get_running_loop()
+        for law_id, law in laws.items():
+            try:
+                _, sections, _ = await loop.run_in_executor(
+                    pool, read_and_parse, law.get("full_text"), law.get("file_path"), self.args.source
+                )
+                plan = storage.plan_section_update(storage.get_sections(law_id), sections)
+                changed = [section['content'] for _, section, _, _ in plan["update"]]
+                added = [section['content'] for section, _, _ in plan["insert"]]
+                vectors = await create_vector_embeddings(changed + added, self.args.batch_size, strict=True)
+                storage.apply_section_update(
+                    law_id, plan, vectors[:len(changed)], vectors[len(changed):], {"sections_count": len(sections)}
+                )
+            except Exception as e:
+                logger.error(f"Failed to repair law {law_id}: {e}")
+                self.failed.append(law_id)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"  {self.docs_done} docs, {self.sections_done} sections, {self.embedded} embeddings "
+              f"({self.docs_done / elapsed:.2f} docs/s, {self.sections_done / elapsed:.1f} sections/s)")
+
+    async def process_all(self, laws: Dict[str, Dict[str, Any]], pool: ProcessPoolExecutor):
+        slots = asyncio.Semaphore(self.args.workers * 2)
+        await asyncio.gather(*(self.process(law_id, law, pool, slots) for law_id, law in laws.items()))
+
+    async def run(self) -> bool:
+        with ProcessPoolExecutor(max_workers=self.args.workers) as pool:
+            await self.process_all(list_laws(), pool)
+
+            # Uploads, edits and deletes that happened during the pass
+            for _ in range(MAX_CATCH_UP_ROUNDS):
+                changed, removed = self.changes_since_processed()
+                if not removed and not changed:
+                    break
+                print(f"  Catching up: {len(changed)} changed, {len(removed)} deleted during re-index")
+                self.shadow.drop_laws(removed + [law_id for law_id in changed if law_id in self.processed])
+                for law_id in removed:
+                    self.processed.pop(law_id)
+                await self.process_all(changed, pool)
+
+            if self.failed:
+                return False
+
+            # Switch store and vector index together; the shadow set is renamed under the index publish lock
+            print("🔄 Switching to the re-indexed sections...")
+            # API writes wait for the switch, and changes they wrote to the old set are not published
+            version = vector_index.rebuild(self.shadow.iter_vector_rows(), storage.get_law_metadata(),
+                                           self.shadow.iter_duplicate_sections(), before_swap=self.shadow.switch,
+                                           swap_lock=lambda: storage.write_lock(exclusive=True))
+            if version is not None:
+                print(f"  Published vector index v{version}")
+
+            changed, removed = self.changes_since_processed()
+            if changed or removed:
+                print(f"  Repairing {len(changed) + len(removed)} documents written during the switch")
+                storage.delete_documents(removed)
+                await self.repair(changed, pool)
+        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild sections and vectors of every stored law")
+    parser.add_argument("--source", choices=["auto", "text", "files"], default="auto",
+                        help="auto: stored text, or the PDF when no text is stored; files: always the PDF")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parsing processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Sections per embedding call")
+    parser.add_argument("--report-every", type=int, default=50, help="Progress line every N documents")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    use_cli_budget()
+    connect_db()
+
+    reindexer = Reindexer(args)
+    print(f"📚 Re-indexing into shadow {'collections' if db.db is not None else 'files'}...")
+    with priority(MAINTENANCE):
+        switched = asyncio.run(reindexer.run())
+
+    elapsed = time.perf_counter() - reindexer.started
+    print(f"{'✅' if switched else '❌'} Re-indexed {reindexer.docs_done} documents / {reindexer.sections_done} sections "
+          f"({reindexer.embedded} embeddings) in {elapsed:.1f}s "
+          f"({reindexer.docs_done / elapsed:.2f} docs/sec, {reindexer.sections_done / elapsed:.1f} sections/sec)")
+    if not switched:
+        print(f"⚠️  {len(reindexer.failed)} documents failed; the live index was left unchanged")
+        return 1
+    if reindexer.failed:
+        print(f"⚠️  {len(reindexer.failed)} documents written during the switch could not be repaired "
+              f"and keep their previous sections: {', '.join(reindexer.failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
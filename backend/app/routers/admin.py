@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, Form, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from ..utils.security import require_admin
+from ..utils.profiler import profiler, render_collapsed, summarize, DEFAULT_INTERVAL_MS
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+def render_profile(stacks, format: str):
+    if format == "collapsed":
+        return PlainTextResponse(render_collapsed(stacks))
+    return summarize(stacks)
+
+@router.get("/profiler")
+async def profiler_status():
+    return profiler.status()
+
+@router.post("/profiler")
+async def arm_profiler(
+    sample_rate: float = Form(..., ge=0.0, le=1.0),
+    route_prefix: str = Form(""),
+    interval_ms: float = Form(DEFAULT_INTERVAL_MS, ge=1.0, le=1000.0),
+    duration_seconds: float = Form(300.0, gt=0.0, le=3600.0)
+):
+    """Profile a fraction of requests (optionally only paths starting with route_prefix) for a while"""
+    profiler.configure(sample_rate, route_prefix, interval_ms, duration_seconds)
+    return profiler.status()
+
+@router.delete("/profiler")
+async def disarm_profiler(clear: bool = Query(False, description="Also drop collected profiles")):
+    profiler.disarm()
+    if clear:
+        profiler.reset()
+    return profiler.status()
+
+@router.get("/profiler/profile")
+async def get_route_profile(
+    route: Optional[str] = Query(None, description="Route template, e.g. /api/search; all routes when omitted"),
+    format: str = Query("summary", pattern="^(summary|collapsed)$")
+):
+    """Sampled stacks of a route: hottest functions, or collapsed stacks for flamegraph.pl / speedscope"""
+    return render_profile(profiler.route_stacks(route), format)
+
+@router.get("/profiler/captures/{capture_id}")
+async def get_capture(capture_id: str, format: str = Query("summary", pattern="^(summary|collapsed)$")):
+    """Profile of one request sent with X-Profile: 1 (its id is in the X-Profile-Id response header)"""
+    capture = profiler.capture(capture_id)
+    if capture is None:
+        raise HTTPException(404, "Capture not found")
+    if format == "collapsed":
+        return render_profile(capture["stacks"], format)
+    return {**{key: value for key, value in capture.items() if key != "stacks"}, **render_profile(capture["stacks"], format)}
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
 from typing import Optional, List, Dict
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import os
 import json
+import asyncio
+import hashlib
 import aiofiles
 from bson import ObjectId
 from .. import database as db
-from ..utils.nlp import extract_text_from_pdf, parse_legal_document, create_vector_embedding
+from ..utils.nlp import extract_text_from_pdf, parse_legal_document, create_vector_embeddings
+from ..utils import storage, dedup, transfer
+from ..utils.scheduler import priority, INGEST
+from ..utils.metrics import timed
 from pymongo import DESCENDING
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
@@ -30,126 +38,45 @@ async def upload_document(
         safe_filename = file.filename.replace(" ", "_")
         file_path = f"uploads/{timestamp}_{safe_filename}"
         
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        with timed("save_upload"):
+            async with aiofiles.open(file_path, 'wb') as f:
+                content = await file.read()
+                await f.write(content)
         
         # 3. Extract and Parse Text (Lightweight CPU operations)
         text = extract_text_from_pdf(file_path)
-        sections_list = parse_legal_document(text)
+        with timed("parse"):
+            sections_list = parse_legal_document(text)
         
-        # 4. Database Insertion
-        if db.db is not None:
-            # --- MONGODB PATH ---
-            law = {
-                "title": title or file.filename.replace('.pdf', ''),
-                "original_filename": file.filename,
-                "file_path": file_path,
-                "category": category,
-                "jurisdiction": jurisdiction,
-                "year": year or datetime.now().year,
-                "description": description,
-                "text_preview": text[:500] + "..." if len(text) > 500 else text,
-                "full_text": text,
-                "sections_count": len(sections_list),
-                "file_size": len(content),
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
-            result = db.laws.insert_one(law)
-            law_id = str(result.inserted_id)
-            
-            # Process sections and generate embeddings via API
-            for i, section in enumerate(sections_list):
-                section_doc = {
-                    "law_id": law_id,
-                    "section_number": section.get('section_number', str(i + 1)),
-                    "title": section.get('title', f"Section {i + 1}"),
-                    "content": section['content'],
-                    "order": i,
-                    "created_at": datetime.utcnow()
-                }
-                
-                section_result = db.sections.insert_one(section_doc)
-                section_id = str(section_result.inserted_id)
-                
-                # IMPORTANT: await the async API call here to prevent RAM crash
-                vector = await create_vector_embedding(section['content'])
-                
-                vector_doc = {
-                    "section_id": section_id,
-                    "law_id": law_id,
-                    "vector": vector,
-                    "created_at": datetime.utcnow()
-                }
-                db.vectors.insert_one(vector_doc)
-        else:
-            # --- FILE-BASED FALLBACK PATH ---
-            laws_file = "data/laws.json"
-            sections_file = "data/sections.json"
-            vectors_file = "data/vectors.json"
-            
-            laws_data = []
-            if os.path.exists(laws_file):
-                with open(laws_file, 'r', encoding='utf-8') as f: laws_data = json.load(f)
-            
-            sections_data = []
-            if os.path.exists(sections_file):
-                with open(sections_file, 'r', encoding='utf-8') as f: sections_data = json.load(f)
-            
-            vectors_data = []
-            if os.path.exists(vectors_file):
-                with open(vectors_file, 'r', encoding='utf-8') as f: vectors_data = json.load(f)
-            
-            law_id = str(len(laws_data) + 1)
-            law = {
-                "id": law_id,
-                "title": title or file.filename.replace('.pdf', ''),
-                "original_filename": file.filename,
-                "file_path": file_path,
-                "category": category,
-                "jurisdiction": jurisdiction,
-                "year": year or datetime.now().year,
-                "description": description,
-                "sections_count": len(sections_list),
-                "file_size": len(content),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            laws_data.append(law)
-            
-            for i, section in enumerate(sections_list):
-                section_id = str(len(sections_data) + 1)
-                section_doc = {
-                    "id": section_id,
-                    "law_id": law_id,
-                    "section_number": section.get('section_number', str(i + 1)),
-                    "title": section.get('title', f"Section {i + 1}"),
-                    "content": section['content'],
-                    "order": i
-                }
-                sections_data.append(section_doc)
-                
-                # IMPORTANT: await the async API call here
-                vector = await create_vector_embedding(section['content'])
-                
-                vector_doc = {
-                    "id": str(len(vectors_data) + 1),
-                    "section_id": section_id,
-                    "law_id": law_id,
-                    "vector": vector
-                }
-                vectors_data.append(vector_doc)
-            
-            with open(laws_file, 'w', encoding='utf-8') as f: json.dump(laws_data, f, indent=2, ensure_ascii=False)
-            with open(sections_file, 'w', encoding='utf-8') as f: json.dump(sections_data, f, indent=2, ensure_ascii=False)
-            with open(vectors_file, 'w', encoding='utf-8') as f: json.dump(vectors_data, f, indent=2, ensure_ascii=False)
+        # 4. Embed sections (batched API calls), skipping near-duplicates of stored sections.
+        #    Ingest priority: interactive searches are served first when the rate limit is tight.
+        with timed("embed"), priority(INGEST):
+            embedded = await dedup.embed_sections(sections_list)
+        duplicates = sum(1 for ref in embedded["duplicates"] if ref is not None)
+        
+        # 5. Database Insertion (MongoDB or file-based fallback)
+        law = {
+            "title": title or file.filename.replace('.pdf', ''),
+            "original_filename": file.filename,
+            "file_path": file_path,
+            "category": category,
+            "jurisdiction": jurisdiction,
+            "year": year or datetime.now().year,
+            "description": description,
+            "file_size": len(content)
+        }
+        with timed("db_write"), priority(INGEST):
+            law_id = (await dedup.store_documents([
+                {"law": law, "text": text, "sections": sections_list, **embedded}
+            ]))[0]
         
         return {
             "message": "Document uploaded successfully",
             "document_id": law_id,
-            "title": law.get("title") or law.get("id"),
+            "title": law["title"],
             "sections": len(sections_list),
+            "duplicate_sections": duplicates,
+            "embeddings_computed": len(sections_list) - duplicates,
             "file_size": len(content),
             "file_path": file_path
         }
@@ -159,6 +86,108 @@ async def upload_document(
     except Exception as e:
         raise HTTPException(500, f"Upload failed: {str(e)}")
 
+@router.get("/export")
+async def export_corpus(gzip: bool = Query(False, description="Gzip-compress the stream")):
+    """Stream every law, section and vector as NDJSON (see app.transfer for the CLI)"""
+    filename = f"corpus_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        transfer.encode_chunks(transfer.export_lines(), compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import")
+async def import_corpus(file: UploadFile = File(...)):
+    """Import an NDJSON export (plain or gzip) into the active store; nothing is kept if it fails"""
+    try:
+        # Bulk writes block, so they run off the event loop
+        with timed("db_write"):
+            result = await asyncio.to_thread(transfer.import_lines, transfer.decode_lines(file.file))
+        return {"message": "Corpus imported successfully", **result}
+    except transfer.TransferError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Import failed: {str(e)}")
+
+@router.put("/{doc_id}")
+async def update_document(
+    doc_id: str,
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    jurisdiction: Optional[str] = Form(None),
+    year: Optional[int] = Form(None),
+    description: Optional[str] = Form(None)
+):
+    """Re-ingest an amended PDF, re-embedding only sections whose content changed"""
+    try:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(400, "Only PDF files are allowed")
+        stored = storage.get_law(doc_id, {"_id": 1, "revision": 1})
+        if not stored:
+            raise HTTPException(404, "Document not found")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = f"uploads/{timestamp}_{file.filename.replace(' ', '_')}"
+        with timed("save_upload"):
+            async with aiofiles.open(file_path, 'wb') as f:
+                content = await file.read()
+                await f.write(content)
+        
+        text = extract_text_from_pdf(file_path)
+        with timed("parse"):
+            sections_list = parse_legal_document(text)
+        if not sections_list:
+            # An unreadable or scanned PDF would otherwise plan every stored section for deletion
+            raise HTTPException(400, "No sections could be extracted from the PDF; the document was left unchanged")
+        
+        # Diff against stored sections by content hash
+        with timed("diff"):
+            plan = storage.plan_section_update(storage.get_sections(doc_id), sections_list)
+        
+        # Only changed and new sections are embedded
+        with timed("embed"), priority(INGEST):
+            changed = [section['content'] for _, section, _, _ in plan["update"]]
+            added = [section['content'] for section, _, _ in plan["insert"]]
+            vectors = await create_vector_embeddings(changed + added)
+        
+        law_fields = {
+            "original_filename": file.filename,
+            "file_path": file_path,
+            "file_size": len(content),
+            "sections_count": len(sections_list)
+        }
+        if db.db is not None:
+            law_fields["full_text"] = text
+            law_fields["text_preview"] = text[:500] + "..." if len(text) > 500 else text
+        for field, value in {"title": title, "category": category, "jurisdiction": jurisdiction,
+                             "year": year, "description": description}.items():
+            if value is not None:
+                law_fields[field] = value
+        
+        with timed("db_write"):
+            try:
+                storage.apply_section_update(doc_id, plan, vectors[:len(changed)], vectors[len(changed):], law_fields,
+                                             revision=stored.get("revision", 0))
+            except storage.StaleUpdate:
+                raise HTTPException(409, "The document was changed by another update; please retry")
+        
+        return {
+            "message": "Document updated successfully",
+            "document_id": doc_id,
+            "sections": len(sections_list),
+            "unchanged": len(plan["keep"]),
+            "updated": len(plan["update"]),
+            "inserted": len(plan["insert"]),
+            "deleted": len(plan["delete"]),
+            "embeddings_computed": len(vectors),
+            "file_path": file_path
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Update failed: {str(e)}")
+
 @router.get("")
 async def get_documents(
     page: int = Query(1, ge=1),
@@ -204,50 +233,76 @@ async def get_documents(
     except Exception as e:
         raise HTTPException(500, f"Failed to get documents: {str(e)}")
 
+def document_validators(law: dict, doc_id: str, variant: str):
+    """(ETag, Last-Modified) of a document view: they change with the law and with re-indexes"""
+    modified = law.get("updated_at") or law.get("created_at")
+    if isinstance(modified, str):
+        modified = datetime.fromisoformat(modified)
+    reindexed = storage.store_generation_time()
+    if reindexed is not None and (modified is None or reindexed > modified):
+        modified = reindexed
+    version = f"{doc_id}:{modified.isoformat() if modified else ''}:{storage.store_generation()}:{variant}"
+    etag = f'W/"{hashlib.md5(version.encode()).hexdigest()}"'
+    return etag, modified.replace(microsecond=0) if modified else None
+
+def not_modified(request: Request, etag: str, modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as for GET
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return modified <= since
+    return False
+
 @router.get("/{doc_id}")
-async def get_document(doc_id: str):
+async def get_document(
+    doc_id: str,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    include_text: bool = Query(False, description="Include the extracted full text (MongoDB only)")
+):
     try:
+        # 1. Law metadata only; its version decides whether anything else is needed
         if db.db is not None:
-            document = db.laws.find_one({"_id": ObjectId(doc_id)})
-            if not document:
+            if not ObjectId.is_valid(doc_id):
                 raise HTTPException(404, "Document not found")
-            
-            document["id"] = str(document["_id"])
-            del document["_id"]
-            
-            sections_list = list(db.sections.find({"law_id": doc_id}))
-            document["sections"] = [
-                {
-                    "id": str(sec["_id"]),
-                    "section_number": sec.get("section_number"),
-                    "title": sec.get("title"),
-                    "content_preview": sec.get("content", "")[:200] + "..." if len(sec.get("content", "")) > 200 else sec.get("content", "")
-                }
-                for sec in sections_list
-            ]
+            document = storage.get_law(doc_id, None if include_text else {"full_text": 0})
         else:
-            laws_file = "data/laws.json"
-            sections_file = "data/sections.json"
-            if not os.path.exists(laws_file): raise HTTPException(404, "Document not found")
-            
-            with open(laws_file, 'r', encoding='utf-8') as f: all_docs = json.load(f)
-            document = next((doc for doc in all_docs if doc["id"] == doc_id), None)
-            if not document: raise HTTPException(404, "Document not found")
-            
-            if os.path.exists(sections_file):
-                with open(sections_file, 'r', encoding='utf-8') as f: all_sections = json.load(f)
-                document_sections = [sec for sec in all_sections if sec["law_id"] == doc_id]
-                document["sections"] = [
-                    {
-                        "id": sec["id"],
-                        "section_number": sec.get("section_number"),
-                        "title": sec.get("title"),
-                        "content_preview": sec.get("content", "")[:200] + "..." if len(sec.get("content", "")) > 200 else sec.get("content", "")
-                    }
-                    for sec in document_sections
-                ]
-        
-        return document
+            document = storage.get_law(doc_id)
+        if not document:
+            raise HTTPException(404, "Document not found")
+
+        etag, modified = document_validators(document, doc_id, f"{page}:{limit}:{include_text}")
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if modified is not None:
+            headers["Last-Modified"] = format_datetime(modified.replace(tzinfo=timezone.utc), usegmt=True)
+        if not_modified(request, etag, modified):
+            return Response(status_code=304, headers=headers)
+
+        # 2. One page of sections, previews cut by the query
+        with timed("hydrate"):
+            sections = storage.get_section_page(doc_id, (page - 1) * limit, limit)
+            total = document.get("sections_count")
+            if total is None:
+                total = storage.count_sections(doc_id)
+
+        if "_id" in document:
+            document["id"] = str(document.pop("_id"))
+        document["sections"] = sections
+        document["sections_page"] = {
+            "page": page,
+            "limit": limit,
+            "total": total,
+            "pages": (total + limit - 1) // limit
+        }
+        return JSONResponse(jsonable_encoder(document), headers=headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -256,48 +311,13 @@ async def get_document(doc_id: str):
 @router.delete("/{doc_id}")
 async def delete_document(doc_id: str):
     try:
-        if db.db is not None:
-            result = db.laws.delete_one({"_id": ObjectId(doc_id)})
-            if result.deleted_count == 0:
-                raise HTTPException(404, "Document not found")
-            
-            # Cascade delete sections and vectors
-            db.sections.delete_many({"law_id": doc_id})
-            db.vectors.delete_many({"law_id": doc_id})
-            
-            return {"message": "Document deleted successfully"}
-        else:
-            # File based delete
-            laws_file = "data/laws.json"
-            if not os.path.exists(laws_file): raise HTTPException(404, "Document not found")
-            
-            with open(laws_file, 'r', encoding='utf-8') as f: laws_data = json.load(f)
-            
-            # Filter out the document to be deleted
-            new_laws_data = [d for d in laws_data if d["id"] != doc_id]
-            
-            if len(new_laws_data) == len(laws_data):
-                raise HTTPException(404, "Document not found")
-                
-            with open(laws_file, 'w', encoding='utf-8') as f: json.dump(new_laws_data, f, indent=2, ensure_ascii=False)
-            
-            # Clean up sections
-            sections_file = "data/sections.json"
-            if os.path.exists(sections_file):
-                with open(sections_file, 'r', encoding='utf-8') as f: sections_data = json.load(f)
-                new_sections_data = [s for s in sections_data if s["law_id"] != doc_id]
-                with open(sections_file, 'w', encoding='utf-8') as f: json.dump(new_sections_data, f, indent=2, ensure_ascii=False)
-
-            # Clean up vectors
-            vectors_file = "data/vectors.json"
-            if os.path.exists(vectors_file):
-                with open(vectors_file, 'r', encoding='utf-8') as f: vectors_data = json.load(f)
-                new_vectors_data = [v for v in vectors_data if v["law_id"] != doc_id]
-                with open(vectors_file, 'w', encoding='utf-8') as f: json.dump(new_vectors_data, f, indent=2, ensure_ascii=False)
-
-            return {"message": "Document deleted successfully"}
+        # Cascade delete sections and vectors
+        if storage.delete_documents([doc_id]) == 0:
+            raise HTTPException(404, "Document not found")
+        
+        return {"message": "Document deleted successfully"}
             
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(500, f"Failed to delete document: {str(e)}")
\ No newline at end of file
+        raise HTTPException(500, f"Failed to delete document: {str(e)}")
@@ -1,24 +1,69 @@
 from fastapi import APIRouter, Query, Form, HTTPException
-from typing import Optional, List, Dict
+from typing import List, Dict
 from datetime import datetime
-import os
-import json
-from bson import ObjectId
-from .. import database as db
-from ..utils.nlp import generate_llm_answer, summarize_text, logger
-from .search import search_documents
+import asyncio
+from ..utils.nlp import generate_llm_answer, extract_answer, summarize_text, logger
+from ..utils.metrics import timed
+from .search import perform_search, overloaded
+from ..utils import storage
+from ..utils.summarize import summarize_long_document
+from ..utils.scheduler import InferenceOverloaded
 
 router = APIRouter(tags=["AI & RAG"])
 
+# Per-passage answering: concurrent QA calls and the default deadline for stragglers
+MAX_CONCURRENT_QA = 4
+DEFAULT_QA_DEADLINE_MS = 8000
+
+async def answer_per_passage(question: str, results: List[Dict], max_passage_length: int, deadline_s: float) -> Dict:
+    """Ask the QA model about each passage concurrently and keep the best-scoring span"""
+    # Search results carry 300-char previews; read the full section text instead
+    sections_by_id = storage.get_sections_by_ids([result["id"] for result in results])
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QA)
+    
+    async def ask(result):
+        section = sections_by_id.get(result["id"]) or {}
+        passage = (section.get("content") or result.get("content", ""))[:max_passage_length]
+        async with semaphore:
+            return result, await extract_answer(question, passage)
+    
+    tasks = [asyncio.create_task(ask(result)) for result in results]
+    done, pending = await asyncio.wait(tasks, timeout=deadline_s)
+    for task in pending:
+        task.cancel()
+    
+    answered = [task.result() for task in done if not task.cancelled() and task.exception() is None]
+    answered = [(result, response) for result, response in answered if response]
+    stats = {"passages_read": len(answered), "passages_dropped": len(pending)}
+    if not answered:
+        return {"answer": "I couldn't generate an answer from the provided context.", "answer_source": None, **stats}
+    
+    result, response = max(answered, key=lambda item: item[1].get("score", 0))
+    return {
+        "answer": f"AI Answer: {response['answer']} (Score: {response.get('score', 0):.2f})",
+        "answer_source": {
+            "id": result["id"],
+            "law_title": result.get("law_title"),
+            "section_number": result.get("section_number"),
+            "score": response.get("score", 0),
+            "start": response.get("start"),
+            "end": response.get("end")
+        },
+        **stats
+    }
+
 @router.get("/api/rag/ask")
 async def ask_question(
     question: str = Query(..., min_length=3),
     detailed: bool = Query(False),
-    max_context_length: int = Query(2000, ge=500, le=5000)
+    max_context_length: int = Query(2000, ge=500, le=5000),
+    mode: str = Query("context", pattern="^(context|per_passage)$",
+                      description="context (one QA call over joined results) or per_passage"),
+    top_k: int = Query(5, ge=1, le=20, description="Passages to read"),
+    deadline_ms: int = Query(DEFAULT_QA_DEADLINE_MS, ge=500, le=30000, description="Per-passage mode time budget")
 ):
     try:
-        # search_documents is async
-        search_results = await search_documents(q=question, search_type="hybrid", limit=5)
+        search_results = await perform_search(question, search_type="hybrid", limit=top_k, collapse_duplicates=True)
         
         if not search_results["results"]:
             return {
@@ -27,6 +72,18 @@ async def ask_question(
                 "sources": []
             }
         
+        if mode == "per_passage":
+            # max_context_length bounds each passage rather than the joined context
+            with timed("qa_passages"):
+                answer = await answer_per_passage(question, search_results["results"], max_context_length, deadline_ms / 1000)
+            return {
+                "question": question,
+                "mode": mode,
+                **answer,
+                "sources": search_results["results"],
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        
         context_parts = []
         sources = []
         current_len = 0
@@ -49,24 +106,37 @@ async def ask_question(
             "sources": sources,
             "timestamp": datetime.utcnow().isoformat()
         }
+    except InferenceOverloaded as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"RAG Error: {e}")
         raise HTTPException(500, f"Error: {str(e)}")
 
 @router.get("/api/documents/{doc_id}/summarize")
-async def summarize_document(doc_id: str):
+async def summarize_document(
+    doc_id: str,
+    mode: str = Query("hierarchical", pattern="^(hierarchical|quick)$",
+                      description="hierarchical (whole document) or quick (opening text only)")
+):
     try:
-        text = ""
-        if db.db is not None:
-            document = db.laws.find_one({"_id": ObjectId(doc_id)})
-            if document: text = document.get("full_text", "")
+        document = storage.get_law(doc_id)
+        if not document: raise HTTPException(404, "Document not found")
         
-        if not text: raise HTTPException(404, "Document not found")
+        if mode == "quick":
+            text = document.get("full_text", "") or "\n".join(s.get("content", "") for s in storage.get_sections(doc_id))
+            if not text: raise HTTPException(404, "Document has no text")
+            summary = await summarize_text(text[:3000]) # Limit text for API
+            return {"document_id": doc_id, "summary": summary, "mode": mode}
         
-        # ADDED await here
-        summary = await summarize_text(text[:3000]) # Limit text for API
+        # Summarize every section chunk concurrently, then reduce; partial summaries are cached by content hash
+        sections_list = storage.get_sections(doc_id)
+        if not sections_list and document.get("full_text"):
+            sections_list = [{"title": "", "content": document["full_text"]}]
+        result = await summarize_long_document(doc_id, sections_list)
         
-        return {"document_id": doc_id, "summary": summary}
+        return {"document_id": doc_id, "mode": mode, **result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Summarization failed: {str(e)}")
 
@@ -3,119 +3,227 @@ from typing import Optional
 from datetime import datetime
 import os
 import json
+import time
+import asyncio
 from bson import ObjectId
 from .. import database as db
+from .. import startup
 from ..utils.nlp import create_vector_embedding, cosine_similarity, logger
+from ..utils.metrics import timed
+from ..utils.scheduler import InferenceOverloaded, SHED_RETRY_AFTER_SECONDS
+from ..utils import storage, vector_index, autocomplete
 
 router = APIRouter(prefix="/api/search", tags=["Search"])
 
-@router.get("")
-async def search_documents(
-    q: str = Query(..., min_length=2, description="Search query"),
-    search_type: str = Query("hybrid", description="Search type: text, vector, or hybrid"),
-    category: Optional[str] = Query(None, description="Filter by category"),
-    limit: int = Query(20, ge=1, le=100, description="Number of results")
-):
-    try:
-        results = []
-        
-        # --- 1. TEXT SEARCH ---
-        if search_type in ["text", "hybrid"]:
-            if db.db is not None:
-                text_query = {"$text": {"$search": q}}
-                if category:
-                    text_query["category"] = category
-                
-                # Fetch slightly more than limit to allow for filtering/merging
-                text_results = list(db.sections.find(text_query).limit(limit * 2))
-                
-                for section in text_results:
-                    law = db.laws.find_one({"_id": ObjectId(section["law_id"])})
-                    result = {
-                        "id": str(section["_id"]),
-                        "section_number": section.get("section_number", "N/A"),
-                        "title": section.get("title", ""),
-                        "content": section.get("content", "")[:300] + "...",
-                        "law_title": law.get("title", "Unknown") if law else "Unknown",
-                        "category": law.get("category", "Legal") if law else "Legal",
-                        "score": 1.0, # Base score for text match
-                        "search_type": "text"
-                    }
-                    results.append(result)
-            else:
-                # File-based fallback (simplified)
-                pass
-        
-        # --- 2. VECTOR SEARCH ---
-        if search_type in ["vector", "hybrid"]:
-            # IMPORTANT: await the async API call here
+# Text hits fetched per result when a filter is too broad to push into the query
+FILTER_OVERFETCH = 5
+
+def overloaded(e: InferenceOverloaded) -> HTTPException:
+    """503 for a query whose embedding call was shed"""
+    logger.warning(str(e))
+    return HTTPException(503, "Search is overloaded, please retry", headers={"Retry-After": str(SHED_RETRY_AFTER_SECONDS)})
+
+def build_result(section_id: str, section: dict, law: Optional[dict], score: float, search_type: str) -> dict:
+    return {
+        "id": section_id,
+        "law_id": section.get("law_id"),
+        "duplicate_of": section.get("duplicate_of"),
+        "section_number": section.get("section_number", "N/A"),
+        "title": section.get("title", ""),
+        "content": section.get("content", "")[:300] + "...",
+        "law_title": law.get("title", "Unknown") if law else "Unknown",
+        "category": law.get("category", "Legal") if law else "Legal",
+        "score": score,
+        "search_type": search_type
+    }
+
+async def perform_search(
+    q: str,
+    search_type: str = "hybrid",
+    limit: int = 20,
+    category: Optional[str] = None,
+    jurisdiction: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    collapse_duplicates: bool = False
+) -> dict:
+    """Hybrid search with metadata filters applied before scoring (shared by the API routes).
+
+    collapse_duplicates returns one result per near-duplicate group instead of
+    every copy of a repeated provision.
+    """
+    # An empty ?category= or ?jurisdiction= means no filter
+    category = (category or "").strip() or None
+    jurisdiction = (jurisdiction or "").strip() or None
+    filters = {"category": category, "jurisdiction": jurisdiction, "year_from": year_from, "year_to": year_to}
+    has_filters = any(value is not None for value in filters.values())
+    results = []
+    
+    # --- 1. TEXT SEARCH ---
+    if search_type in ["text", "hybrid"]:
+        if db.db is not None:
+            text_query = {"$text": {"$search": q}}
+            fetch = limit * 2
+            law_ids = None
+            if has_filters:
+                # Restrict the text query to matching laws instead of filtering its results
+                with timed("filter"):
+                    law_ids = storage.find_law_ids(**filters, limit=storage.MAX_FILTER_LAW_IDS)
+                if law_ids is not None:
+                    text_query["law_id"] = {"$in": law_ids}
+                else:
+                    # Too many matching laws for one query: filter the results instead
+                    fetch *= FILTER_OVERFETCH
+            
+            # Fetch slightly more than limit to allow for merging
+            with timed("mongo_text"):
+                text_results = list(db.sections.find(text_query).limit(fetch))
+            
+            with timed("hydrate"):
+                laws_by_id = storage.get_laws_by_ids([section["law_id"] for section in text_results])
+                if has_filters and law_ids is None:
+                    text_results = [section for section in text_results
+                                    if storage.law_matches(laws_by_id.get(section["law_id"]), **filters)]
+                for section in text_results[:limit * 2]:
+                    # Base score 1.0 for a text match
+                    results.append(build_result(str(section["_id"]), section, laws_by_id.get(section["law_id"]), 1.0, "text"))
+        else:
+            # File-based fallback (simplified)
+            pass
+    
+    # --- 2. VECTOR SEARCH ---
+    if search_type in ["vector", "hybrid"]:
+        # IMPORTANT: await the async API call here
+        with timed("embed"):
             query_vector = await create_vector_embedding(q)
+        
+        scored_items = []
+        # Remapping a new version and scoring the shards run off the event loop
+        snapshot = await asyncio.to_thread(vector_index.get_snapshot)
+        if snapshot is not None:
+            # Shared memory-mapped index: metadata bitmaps select rows, then one matrix-vector product
+            with timed("vector_scan"):
+                hits = await asyncio.to_thread(snapshot.search, query_vector, limit, threshold=0.15,
+                                               collapse=collapse_duplicates, **filters)
             
-            if db.db is not None:
-                # Note: In a production App with Atlas, you should use $vectorSearch aggregation.
-                # For this free tier/demo setup, we fetch a subset of vectors and calculate manually.
-                all_vectors = list(db.vectors.find().limit(200)) # Limit to 200 to prevent slow calculation
-                scored_items = []
-                
+            with timed("hydrate"):
+                sections_by_id = storage.get_sections_by_ids([section_id for section_id, _, _ in hits])
+                laws_by_id = storage.get_laws_by_ids([law_id for _, law_id, _ in hits])
+                for section_id, law_id, similarity in hits:
+                    section = sections_by_id.get(section_id)
+                    if section:
+                        scored_items.append({"id": section_id, "section": section, "law": laws_by_id.get(law_id), "score": similarity})
+        elif db.db is not None:
+            # Note: In a production App with Atlas, you should use $vectorSearch aggregation.
+            # Without numpy there is no shared index, so we fetch a subset of vectors and calculate manually.
+            vector_query = {}
+            law_ids = None
+            if has_filters:
+                # Scan only vectors of matching laws, so the 200-vector cap never drops filtered matches
+                with timed("filter"):
+                    law_ids = storage.find_law_ids(**filters, limit=storage.MAX_FILTER_LAW_IDS)
+                if law_ids is not None:
+                    vector_query["law_id"] = {"$in": law_ids}
+            with timed("vector_scan"):
+                all_vectors = list(db.vectors.find(vector_query).limit(200)) # Limit to 200 to prevent slow calculation
+                candidates = []
                 for vec_doc in all_vectors:
                     similarity = cosine_similarity(query_vector, vec_doc["vector"])
                     if similarity > 0.15: # slightly higher threshold
-                        section = db.sections.find_one({"_id": ObjectId(vec_doc["section_id"])})
-                        if section:
-                            law = db.laws.find_one({"_id": ObjectId(section["law_id"])})
-                            
-                            # Apply category filter if requested
-                            if category and law and law.get("category") != category:
-                                continue
-                                
-                            scored_items.append({"section": section, "law": law, "score": similarity})
-                
-                # Sort by vector similarity
-                scored_items.sort(key=lambda x: x["score"], reverse=True)
-                
-                for item in scored_items[:limit]:
-                    result = {
-                        "id": str(item["section"]["_id"]),
-                        "section_number": item["section"].get("section_number", "N/A"),
-                        "title": item["section"].get("title", ""),
-                        "content": item["section"].get("content", "")[:300] + "...",
-                        "law_title": item["law"].get("title", "Unknown") if item["law"] else "Unknown",
-                        "category": item["law"].get("category", "Legal") if item["law"] else "Legal",
-                        "score": item["score"],
-                        "search_type": "vector"
-                    }
-                    results.append(result)
-
-        # --- 3. DEDUPLICATION & RANKING ---
-        seen_ids = set()
-        unique_results = []
-        
-        # Sort combined results by score before deduplication
-        results.sort(key=lambda x: x["score"], reverse=True)
+                        candidates.append((vec_doc, similarity))
+            
+            with timed("hydrate"):
+                for vec_doc, similarity in candidates:
+                    section = db.sections.find_one({"_id": ObjectId(vec_doc["section_id"])})
+                    if section:
+                        law = db.laws.find_one({"_id": ObjectId(section["law_id"])})
+                        if has_filters and law_ids is None and not storage.law_matches(law, **filters):
+                            continue
+                        scored_items.append({"id": str(section["_id"]), "section": section, "law": law, "score": similarity})
         
-        for result in results:
-            if result["id"] not in seen_ids:
-                seen_ids.add(result["id"])
-                unique_results.append(result)
+        # Sort by vector similarity
+        scored_items.sort(key=lambda x: x["score"], reverse=True)
         
-        # Log query stats
-        if db.db is not None:
+        for item in scored_items[:limit]:
+            results.append(build_result(item["id"], item["section"], item["law"], item["score"], "vector"))
+
+    # --- 3. DEDUPLICATION & RANKING ---
+    seen_ids = set()
+    unique_results = []
+    
+    # Sort combined results by score before deduplication
+    results.sort(key=lambda x: x["score"], reverse=True)
+    
+    for result in results:
+        key = (result["duplicate_of"] or result["id"]) if collapse_duplicates else result["id"]
+        if key not in seen_ids:
+            seen_ids.add(key)
+            unique_results.append(result)
+    
+    index = autocomplete.current()
+    if index is not None:
+        index.record_query(q)
+
+    # Log query stats
+    if db.db is not None:
+        with timed("log_query"):
             db.queries.insert_one({
                 "query": q,
                 "search_type": search_type,
                 "results_count": len(unique_results[:limit]),
                 "timestamp": datetime.utcnow()
             })
-        
+    
+    return {
+        "query": q,
+        "results": unique_results[:limit],
+        "count": len(unique_results[:limit]),
+        "search_type": search_type
+    }
+
+@router.get("")
+async def search_documents(
+    q: str = Query(..., min_length=2, description="Search query"),
+    search_type: str = Query("hybrid", description="Search type: text, vector, or hybrid"),
+    category: Optional[str] = Query(None, description="Filter by category"),
+    jurisdiction: Optional[str] = Query(None, description="Filter by jurisdiction"),
+    year_from: Optional[int] = Query(None, description="Earliest law year"),
+    year_to: Optional[int] = Query(None, description="Latest law year"),
+    collapse_duplicates: bool = Query(False, description="One result per group of near-duplicate sections"),
+    limit: int = Query(20, ge=1, le=100, description="Number of results")
+):
+    try:
+        return await perform_search(q, search_type, limit, category, jurisdiction, year_from, year_to, collapse_duplicates)
+    except InferenceOverloaded as e:
+        raise overloaded(e)
+    except Exception as e:
+        logger.error(f"Search Error: {e}")
+        raise HTTPException(500, f"Search failed: {str(e)}")
+
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1, description="Text typed so far"),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Prefix suggestions from law titles, section headings and frequent queries (no inference calls)"""
+    try:
+        started = time.perf_counter()
+        index = autocomplete.current()
+        if index is None:
+            if not startup.is_ready():
+                # The warm-up is still building it: answer now instead of blocking the event loop
+                return {"query": q, "suggestions": [], "took_ms": 0.0}
+            # The warm-up stage failed: build off the event loop
+            index = await asyncio.to_thread(autocomplete.get_index)
+        suggestions = index.suggest(q, limit)
         return {
             "query": q,
-            "results": unique_results[:limit],
-            "count": len(unique_results[:limit]),
-            "search_type": search_type
+            "suggestions": suggestions,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3)
         }
     except Exception as e:
-        logger.error(f"Search Error: {e}")
-        raise HTTPException(500, f"Search failed: {str(e)}")
+        logger.error(f"Suggest Error: {e}")
+        raise HTTPException(500, f"Suggestions failed: {str(e)}")
 
 @router.get("/advanced")
 async def advanced_search(
@@ -125,38 +233,24 @@ async def advanced_search(
     jurisdiction: Optional[str] = None,
     year_from: Optional[int] = Query(None),
     year_to: Optional[int] = Query(None),
+    collapse_duplicates: bool = Query(False),
     limit: int = Query(20, ge=1, le=100)
 ):
     try:
-        # Get base results using the main search function
-        basic_results = await search_documents(q=q, search_type=search_type, category=category, limit=limit * 2)
-        results = basic_results["results"]
-        filtered_results = []
+        # Filters are applied inside the search (before scoring), so no over-fetching is needed
+        basic_results = await perform_search(
+            q, search_type, limit, category, jurisdiction, year_from, year_to, collapse_duplicates
+        )
+        filtered_results = basic_results["results"]
         
-        # Apply metadata filters (Jurisdiction, Year, etc.)
-        for result in results:
-            if db.db is not None:
-                # We need to fetch the law details to check metadata
-                # (Optimized: In a real app, these fields should be denormalized into the Section document)
-                section = db.sections.find_one({"_id": ObjectId(result["id"])})
-                if section:
-                    law = db.laws.find_one({"_id": ObjectId(section["law_id"])})
-                    if law:
-                        if jurisdiction and law.get("jurisdiction") != jurisdiction:
-                            continue
-                        if year_from and law.get("year", 0) < year_from:
-                            continue
-                        if year_to and law.get("year", 0) > year_to:
-                            continue
-                        
-                        # Add extra metadata to result
-                        result["jurisdiction"] = law.get("jurisdiction")
-                        result["year"] = law.get("year")
-                        result["document_description"] = law.get("description", "")[:200]
-                        filtered_results.append(result)
-            else:
-                # Pass through if file-based (or no DB connection)
-                filtered_results.append(result)
+        # Add extra metadata to results (one batched law lookup)
+        laws_by_id = storage.get_laws_by_ids([result["law_id"] for result in filtered_results if result.get("law_id")])
+        for result in filtered_results:
+            law = laws_by_id.get(result.get("law_id"))
+            if law:
+                result["jurisdiction"] = law.get("jurisdiction")
+                result["year"] = law.get("year")
+                result["document_description"] = (law.get("description") or "")[:200]
         
         # Note: Local LLM re-ranking (qa_pipeline) removed to save RAM for Free Tier.
         # We rely solely on Vector cosine similarity and Text score.
@@ -172,6 +266,8 @@ async def advanced_search(
                 "year_range": f"{year_from}-{year_to}" if year_from or year_to else None
             }
         }
+    except InferenceOverloaded as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"Advanced Search Error: {e}")
         raise HTTPException(500, f"Advanced search failed: {str(e)}")
\ No newline at end of file
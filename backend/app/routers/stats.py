@@ -1,10 +1,15 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse, JSONResponse
 from datetime import datetime
 import os
 import json
 from .. import database as db
 from pymongo import DESCENDING
 from ..config import HF_TOKEN
+from ..utils.metrics import render_prometheus
+from ..utils import vector_index, storage
+from ..utils.scheduler import scheduler
+from .. import startup
 
 router = APIRouter(tags=["System Info"])
 
@@ -12,11 +17,27 @@ router = APIRouter(tags=["System Info"])
 async def health_check():
     return {
         "status": "healthy",
+        "ready": startup.is_ready(),
         "timestamp": datetime.now().isoformat(),
         "database": "connected" if db.db is not None else "file-based",
-        "ai_mode": "cloud_inference" if HF_TOKEN else "fallback_hashing"
+        "ai_mode": "cloud_inference" if HF_TOKEN else "fallback_hashing",
+        "vector_index": vector_index.status(),
+        "inference_scheduler": scheduler.status()
     }
 
+@router.get("/api/ready")
+async def readiness_check():
+    """200 once the background warm-up has finished, 503 until then"""
+    status = startup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@router.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage and request latency histograms in Prometheus text format (per worker)"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @router.get("/api/stats")
 async def get_statistics():
     try:
@@ -41,12 +62,18 @@ async def get_statistics():
                 "total_queries": total_queries,
                 "vector_count": total_vectors,
                 "ai_queries": ai_queries,
+                "deduplication": storage.dedup_stats(),
                 "recent_documents": recent_documents,
                 "timestamp": datetime.utcnow().isoformat()
             }
         else:
             # File-based stats fallback
-            return {"status": "running", "mode": "file-based", "note": "Connect MongoDB for full stats"}
+            return {
+                "status": "running",
+                "mode": "file-based",
+                "deduplication": storage.dedup_stats(),
+                "note": "Connect MongoDB for full stats"
+            }
             
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
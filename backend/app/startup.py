@@ -0,0 +1,101 @@
+"""Background warm-up.
+
+The app starts accepting connections immediately; the database connection,
+MongoDB indexes and the in-memory indexes are built by warm_up() in a
+background task. Requests that need storage wait (briefly) until the
+database connection has been settled, since until then file-based storage
+would be chosen by mistake. /api/ready reports when everything is warm.
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+from . import database
+from .utils import vector_index, autocomplete, dedup
+
+logger = logging.getLogger(__name__)
+
+# How long a request may wait for the database connection before a 503
+STORAGE_WAIT_SECONDS = 10.0
+# Served without waiting for storage
+NO_STORAGE_PATHS = ("/", "/api/health", "/api/ready", "/api/metrics", "/docs", "/redoc", "/openapi.json")
+
+# name -> {"status": "pending" | "done" | "failed", "seconds": float, "error": str}
+stages: Dict[str, Dict[str, Any]] = {}
+_storage_ready: Optional[asyncio.Event] = None
+_ready = False
+_started: Optional[float] = None
+
+def storage_event() -> asyncio.Event:
+    global _storage_ready
+    if _storage_ready is None:
+        _storage_ready = asyncio.Event()
+    return _storage_ready
+
+def reset():
+    """Fresh state for a new event loop (the app may be started more than once per process)"""
+    global _storage_ready, _ready, _started
+    _storage_ready = asyncio.Event()
+    _ready = False
+    _started = time.monotonic()
+    stages.clear()
+
+def is_ready() -> bool:
+    return _ready
+
+def status() -> Dict[str, Any]:
+    return {
+        "ready": _ready,
+        "storage_ready": _storage_ready is not None and _storage_ready.is_set(),
+        "uptime_seconds": round(time.monotonic() - _started, 1) if _started else 0.0,
+        "stages": stages
+    }
+
+async def run_stage(name: str, func, *args):
+    """Run a blocking warm-up step in a worker thread and record how it went"""
+    stages[name] = {"status": "pending"}
+    start = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(func, *args)
+        stages[name] = {"status": "done", "seconds": round(time.perf_counter() - start, 3)}
+        return result
+    except Exception as e:
+        logger.error(f"Warm-up stage {name} failed: {e}")
+        stages[name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+        return None
+
+async def warm_up():
+    global _ready
+    # 1. Connect (or fall back to files); storage-backed requests wait for this
+    await run_stage("database", database.connect_db, False)
+    storage_event().set()
+    print(f" Database: {'MongoDB Connected' if database.db is not None else 'File-based Storage'}")
+
+    # 2. Everything else is independent and runs concurrently
+    warm_stages = [
+        run_stage("admin_user", database.create_admin_user),
+        run_stage("vector_index", vector_index.ensure_snapshot),
+        run_stage("autocomplete", autocomplete.get_index),
+        run_stage("dedup_index", dedup.get_index),
+    ]
+    if database.db is not None:
+        warm_stages.append(run_stage("db_indexes", database.create_indexes))
+    await asyncio.gather(*warm_stages)
+
+    _ready = True
+    failed = [name for name, stage in stages.items() if stage["status"] == "failed"]
+    print(f"✅ Warm-up finished in {time.monotonic() - _started:.2f}s"
+          + (f" (failed: {', '.join(failed)})" if failed else ""))
+    print(f" Vector Index: {vector_index.status()}")
+
+async def wait_for_storage() -> bool:
+    """False when the database connection is still unsettled after STORAGE_WAIT_SECONDS"""
+    event = storage_event()
+    if event.is_set():
+        return True
+    try:
+        await asyncio.wait_for(event.wait(), STORAGE_WAIT_SECONDS)
+        return True
+    except asyncio.TimeoutError:
+        return False
@@ -0,0 +1,271 @@
+import re
+import math
+import bisect
+import heapq
+import time
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Search-as-you-type suggestions over law titles, section headings and
+# frequent past queries. Terms are indexed under their full text and under
+# every later word start ("penal code" also matches "Pakistan Penal Code"),
+# in one sorted array searched with bisect. Results per prefix are cached
+# and invalidated only for the prefixes of terms that change.
+KIND_WEIGHTS = {"title": 3.0, "query": 2.0, "heading": 1.0}
+# Matching at the start of a term ranks above matching a later word
+START_BONUS = 2.0
+MAX_WORD_OFFSETS = 6
+MAX_TERM_CHARS = 80
+# A past query is suggested once it has been searched this often
+MIN_QUERY_COUNT = 2
+MAX_QUERY_TERMS = 5000
+MAX_PENDING_QUERIES = 50000
+MAX_CACHED_PREFIXES = 20000
+SEPARATOR = "\x00"
+# Parsed section numbers are the first 20 characters of the heading line
+SECTION_NUMBER_CHARS = 20
+# How often a request compares the index with the published version
+STALE_CHECK_SECONDS = 1.0
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+def heading_text(section: Dict[str, Any]) -> str:
+    """Heading words of a parsed section ("Section 4 Penalty for..." -> "Penalty for")"""
+    number = (section.get("section_number") or "").strip()
+    words = re.sub(r"^(Section|Article)\s*[\w.\-()]*\s*", "", number, flags=re.IGNORECASE).split()
+    if len(number) >= SECTION_NUMBER_CHARS and words:
+        # Drop the word cut off by the parser
+        words = words[:-1]
+    heading = " ".join(words)
+    return heading if len(heading) >= 3 else ""
+
+class Term:
+    __slots__ = ("text", "kind", "laws", "count")
+
+    def __init__(self, text: str, kind: str):
+        self.text = text
+        self.kind = kind
+        self.laws: Counter = Counter()
+        self.count = 0
+
+    def score(self, at_start: bool) -> float:
+        return KIND_WEIGHTS[self.kind] * (1 + math.log(self.count)) * (START_BONUS if at_start else 1.0)
+
+class PrefixIndex:
+    def __init__(self):
+        self.terms: Dict[str, Term] = {}
+        self.law_terms: Dict[str, set] = {}
+        self.keys: List[str] = []
+        self.cache: Dict[str, List[Tuple[float, str, bool]]] = {}
+        self.pending_queries: Counter = Counter()
+        self.lock = threading.Lock()
+        # Vector index version this index reflects (another worker publishing means it is stale)
+        self.version: Optional[int] = None
+        # While building, keys are appended and sorted once at the end
+        self.bulk = False
+
+    def __len__(self):
+        return len(self.terms)
+
+    @staticmethod
+    def match_keys(term_key: str) -> List[str]:
+        words = term_key.split(SEPARATOR, 1)[1].split()
+        return [
+            f"{' '.join(words[i:])}{SEPARATOR}{i}{SEPARATOR}{term_key}"
+            for i in range(min(len(words), MAX_WORD_OFFSETS))
+        ]
+
+    def _invalidate(self, term_key: str):
+        if not self.cache:
+            return
+        for key in self.match_keys(term_key):
+            text = key.split(SEPARATOR, 1)[0]
+            for end in range(1, len(text) + 1):
+                self.cache.pop(text[:end], None)
+
+    def _add(self, kind: str, text: str, law_id: Optional[str] = None, count: int = 1):
+        text = text.strip()[:MAX_TERM_CHARS]
+        normalized = normalize(text)
+        if len(normalized) < 2:
+            return
+        term_key = f"{kind}{SEPARATOR}{normalized}"
+        term = self.terms.get(term_key)
+        if term is None:
+            term = self.terms[term_key] = Term(text, kind)
+            for key in self.match_keys(term_key):
+                if self.bulk:
+                    self.keys.append(key)
+                else:
+                    bisect.insort(self.keys, key)
+        term.count += count
+        if law_id:
+            term.laws[law_id] += count
+            self.law_terms.setdefault(law_id, set()).add(term_key)
+        self._invalidate(term_key)
+
+    def _remove_law(self, law_id: str):
+        for term_key in self.law_terms.pop(law_id, ()):
+            term = self.terms[term_key]
+            term.count -= term.laws.pop(law_id)
+            if term.count <= 0:
+                del self.terms[term_key]
+                for key in self.match_keys(term_key):
+                    i = bisect.bisect_left(self.keys, key)
+                    if i < len(self.keys) and self.keys[i] == key:
+                        del self.keys[i]
+            self._invalidate(term_key)
+
+    def add_law(self, law_id: str, title: str, sections: Iterable[Dict[str, Any]]):
+        with self.lock:
+            self._add("title", title, law_id)
+            for section in sections:
+                heading = heading_text(section)
+                if heading:
+                    self._add("heading", heading, law_id)
+
+    def remove_law(self, law_id: str):
+        with self.lock:
+            self._remove_law(law_id)
+
+    def record_query(self, query: str):
+        normalized = normalize(query)
+        if len(normalized) < 2:
+            return
+        with self.lock:
+            term_key = f"query{SEPARATOR}{normalized}"
+            if term_key in self.terms:
+                self._add("query", query)
+                return
+            self.pending_queries[normalized] += 1
+            if self.pending_queries[normalized] >= MIN_QUERY_COUNT:
+                self._add("query", query, count=self.pending_queries.pop(normalized))
+            elif len(self.pending_queries) > MAX_PENDING_QUERIES:
+                # One-off queries are forgotten rather than kept without bound
+                self.pending_queries.clear()
+
+    def _ranked(self, prefix: str) -> List[Tuple[float, str, bool]]:
+        """(score, term key, matched at start) for every term matching prefix, best first"""
+        cached = self.cache.get(prefix)
+        if cached is not None:
+            return cached
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\uffff")
+        best: Dict[str, Tuple[float, bool]] = {}
+        for key in self.keys[lo:hi]:
+            text, offset, term_key = key.split(SEPARATOR, 2)
+            term = self.terms.get(term_key)
+            if term is None:
+                continue
+            at_start = offset == "0"
+            score = term.score(at_start)
+            if term_key not in best or score > best[term_key][0]:
+                best[term_key] = (score, at_start)
+        ranked = heapq.nlargest(50, ((score, term_key, at_start) for term_key, (score, at_start) in best.items()))
+        if len(self.cache) >= MAX_CACHED_PREFIXES:
+            self.cache.clear()
+        self.cache[prefix] = ranked
+        return ranked
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        prefix = normalize(query)
+        if len(prefix) < 2:
+            return []
+        if query[-1:].isspace():
+            # "penal " should not match "penalty"
+            prefix += " "
+        with self.lock:
+            ranked = self._ranked(prefix)
+            suggestions, seen = [], set()
+            for score, term_key, _ in ranked:
+                term = self.terms[term_key]
+                normalized = term_key.split(SEPARATOR, 1)[1]
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+                suggestion = {"text": term.text, "kind": term.kind, "score": round(score, 3)}
+                if term.kind == "title" and len(term.laws) == 1:
+                    suggestion["law_id"] = next(iter(term.laws))
+                suggestions.append(suggestion)
+                if len(suggestions) == limit:
+                    break
+            return suggestions
+
+_index: Optional[PrefixIndex] = None
+_index_lock = threading.Lock()
+_reloading = False
+_checked_at = 0.0
+
+def build_index() -> PrefixIndex:
+    from .storage import iter_autocomplete_sources, frequent_queries
+    from . import vector_index
+    index = PrefixIndex()
+    index.version = vector_index.read_current_version()
+    index.bulk = True
+    for law_id, title, sections in iter_autocomplete_sources():
+        index.add_law(law_id, title, sections)
+    for query, count in frequent_queries(MIN_QUERY_COUNT, MAX_QUERY_TERMS):
+        index._add("query", query, count=count)
+    index.keys.sort()
+    index.bulk = False
+    logger.info(f"Built autocomplete index with {len(index)} terms")
+    return index
+
+def get_index() -> PrefixIndex:
+    """Per-process index, built on first use and rebuilt in the background when
+    another worker has changed the corpus"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+        return _index
+    return current()
+
+def current() -> Optional[PrefixIndex]:
+    """The index if this process has built one, never blocking on a build.
+
+    At most once per STALE_CHECK_SECONDS the published version is compared
+    with the one the index reflects, and a stale index is rebuilt in the
+    background while this one keeps answering.
+    """
+    global _checked_at
+    index = _index
+    now = time.monotonic()
+    if index is not None and now - _checked_at >= STALE_CHECK_SECONDS:
+        _checked_at = now
+        from . import vector_index
+        if vector_index.read_current_version() != index.version:
+            _reload_in_background()
+    return index
+
+def _reload_in_background():
+    global _reloading
+    with _index_lock:
+        if _reloading:
+            return
+        _reloading = True
+
+    def reload():
+        global _index, _reloading
+        try:
+            _index = build_index()
+        except Exception as e:
+            logger.error(f"Autocomplete reload failed: {e}")
+        finally:
+            _reloading = False
+
+    threading.Thread(target=reload, name="autocomplete-reload", daemon=True).start()
+
+def loaded() -> Optional[PrefixIndex]:
+    """The index if this process has built one (write paths skip unbuilt indexes)"""
+    return _index
+
+def mark_current(index: PrefixIndex):
+    """Record that local incremental updates brought the index up to the published version"""
+    from . import vector_index
+    index.version = vector_index.read_current_version()
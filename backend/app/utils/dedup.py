@@ -0,0 +1,210 @@
+import re
+import hashlib
+import threading
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+from .nlp import create_vector_embeddings, EMBED_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 64-bit SimHash over word 3-shingles. Sections within MAX_DISTANCE bits are
+# near-duplicates; with 4 bands of 16 bits any such pair shares at least one
+# band exactly (pigeonhole), so band lookups find every candidate.
+SIMHASH_BITS = 64
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+MAX_DISTANCE = 3
+# Short clauses ("Omitted.") hash too coarsely to be compared reliably
+MIN_TOKENS = 8
+
+# Write attempts when canonical sections keep disappearing under a write
+MAX_STORE_ATTEMPTS = 3
+
+# Reference to the section whose embedding a duplicate shares:
+# {"section_id": stored id} or {"local": position earlier in the same document}
+DuplicateRef = Optional[Dict[str, Any]]
+
+class CanonicalMissing(Exception):
+    """Near-duplicates reference stored sections that have since been deleted"""
+
+    def __init__(self, section_ids: List[str]):
+        super().__init__(f"{len(section_ids)} canonical sections are no longer stored")
+        self.section_ids = section_ids
+
+def simhash(text: str) -> Optional[int]:
+    tokens = re.findall(r"\w+", text.lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    weights = [0] * SIMHASH_BITS
+    for i in range(len(tokens) - 2):
+        shingle = " ".join(tokens[i:i + 3]).encode()
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def to_hex(value: Optional[int]) -> Optional[str]:
+    # Stored as hex: MongoDB integers are signed 64-bit
+    return None if value is None else f"{value:016x}"
+
+def from_hex(value: Optional[str]) -> Optional[int]:
+    return None if not value else int(value, 16)
+
+def _bands(value: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+class SimHashIndex:
+    """Banded lookup table from SimHash to canonical (embedded) section ids"""
+
+    def __init__(self):
+        self.tables: List[Dict[int, set]] = [{} for _ in range(BANDS)]
+        self.hashes: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, section_id: str, value: int):
+        self.remove([section_id])
+        self.hashes[section_id] = value
+        for band, key in enumerate(_bands(value)):
+            self.tables[band].setdefault(key, set()).add(section_id)
+
+    def remove(self, section_ids: Iterable[str]):
+        for section_id in section_ids:
+            value = self.hashes.pop(section_id, None)
+            if value is None:
+                continue
+            for band, key in enumerate(_bands(value)):
+                bucket = self.tables[band].get(key)
+                if bucket:
+                    bucket.discard(section_id)
+                    if not bucket:
+                        del self.tables[band][key]
+
+    def query(self, value: int) -> Optional[str]:
+        """Closest indexed section within MAX_DISTANCE bits, if any"""
+        best, best_distance = None, MAX_DISTANCE + 1
+        for band, key in enumerate(_bands(value)):
+            for section_id in self.tables[band].get(key, ()):
+                distance = hamming(value, self.hashes[section_id])
+                if distance < best_distance:
+                    best, best_distance = section_id, distance
+        return best
+
+_index: Optional[SimHashIndex] = None
+_index_generation: Optional[int] = None
+_index_lock = threading.Lock()
+
+def get_index() -> SimHashIndex:
+    """Per-process index of canonical sections, loaded from the store on first use
+    and reloaded after a re-index has replaced the stored sections"""
+    global _index, _index_generation
+    from .storage import iter_simhashes, store_generation
+    generation = store_generation()
+    if _index is None or generation != _index_generation:
+        with _index_lock:
+            if _index is None or generation != _index_generation:
+                index = SimHashIndex()
+                for section_id, value in iter_simhashes():
+                    index.add(section_id, from_hex(value))
+                _index, _index_generation = index, generation
+                logger.info(f"Loaded SimHash index with {len(index)} sections")
+    return _index
+
+def reset_index():
+    global _index
+    _index = None
+
+def assign_duplicates(sections: List[Dict[str, Any]]) -> Tuple[List[DuplicateRef], List[Optional[int]]]:
+    """Find near-duplicates among stored sections and earlier sections of the same document.
+
+    Returns one reference per section (None = needs its own embedding) and
+    the SimHash of each section.
+    """
+    from .storage import get_sections_by_ids
+    index = get_index()
+    hashes = [simhash(section.get('content', '')) for section in sections]
+    refs: List[DuplicateRef] = [None] * len(sections)
+    local: List[Tuple[int, int]] = []
+    stored_candidates: Dict[int, str] = {}
+
+    for i, value in enumerate(hashes):
+        if value is None:
+            continue
+        match = next((j for j, other in local if hamming(value, other) <= MAX_DISTANCE), None)
+        if match is not None:
+            refs[i] = {"local": match}
+            continue
+        candidate = index.query(value)
+        if candidate is not None:
+            stored_candidates[i] = candidate
+        else:
+            local.append((i, value))
+
+    # Another worker may have deleted a canonical section since this index was loaded
+    if stored_candidates:
+        existing = get_sections_by_ids(list(set(stored_candidates.values())))
+        for i, candidate in stored_candidates.items():
+            if candidate in existing and not existing[candidate].get("duplicate_of"):
+                refs[i] = {"section_id": candidate}
+            else:
+                index.remove([candidate])
+    return refs, hashes
+
+async def embed_sections(sections: List[Dict[str, Any]], batch_size: int = EMBED_BATCH_SIZE) -> Dict[str, list]:
+    """Embed only the sections that are not near-duplicates.
+
+    Returns the insert_documents fields "vectors" (None for duplicates),
+    "duplicates" and "simhashes".
+    """
+    refs, hashes = assign_duplicates(sections)
+    unique = [i for i, ref in enumerate(refs) if ref is None]
+    embedded = await create_vector_embeddings([sections[i]['content'] for i in unique], batch_size)
+    vectors: List[Optional[List[float]]] = [None] * len(sections)
+    for i, vector in zip(unique, embedded):
+        vectors[i] = vector
+    return {"vectors": vectors, "duplicates": refs, "simhashes": hashes}
+
+async def embed_orphans(documents: List[Dict[str, Any]], batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """Embed near-duplicates whose stored canonical was deleted after embed_sections.
+    They become canonical sections themselves. Returns how many were embedded."""
+    from .storage import get_vectors_by_section_ids
+    stored_refs = {
+        ref["section_id"] for doc in documents for ref in doc.get("duplicates") or [] if ref and "section_id" in ref
+    }
+    stored = get_vectors_by_section_ids(list(stored_refs))
+    orphans = [
+        (doc, i) for doc in documents for i, ref in enumerate(doc.get("duplicates") or [])
+        if ref and "section_id" in ref and ref["section_id"] not in stored
+    ]
+    if not orphans:
+        return 0
+    vectors = await create_vector_embeddings([doc["sections"][i]['content'] for doc, i in orphans], batch_size)
+    for (doc, i), vector in zip(orphans, vectors):
+        doc["duplicates"][i] = None
+        doc["vectors"][i] = vector
+    return len(orphans)
+
+async def store_documents(documents: List[Dict[str, Any]], batch_size: int = EMBED_BATCH_SIZE,
+                          publish: bool = True) -> List[str]:
+    """storage.insert_documents for documents prepared with embed_sections.
+
+    Duplicates of a canonical deleted in the meantime are embedded rather
+    than stored without a usable vector. The check and the write do not yield
+    to the event loop; a delete by another process in between makes
+    insert_documents raise CanonicalMissing before writing, and is retried.
+    """
+    from .storage import insert_documents
+    for attempt in range(MAX_STORE_ATTEMPTS):
+        orphans = await embed_orphans(documents, batch_size)
+        if orphans:
+            logger.warning(f"Embedded {orphans} sections whose canonical section was deleted")
+        try:
+            return insert_documents(documents, publish=publish)
+        except CanonicalMissing:
+            if attempt == MAX_STORE_ATTEMPTS - 1:
+                raise
@@ -0,0 +1,89 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Histogram buckets in seconds (HF cold starts can take tens of seconds)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative histogram in the Prometheus layout"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+# Metric families: name -> (help text, label name, {label value: Histogram})
+_families: Dict[str, Tuple[str, str, Dict[str, Histogram]]] = {
+    "legal_rag_stage_duration_seconds": ("Time spent in an instrumented stage", "stage", {}),
+    "legal_rag_request_duration_seconds": ("Total HTTP request time per route", "route", {}),
+}
+_lock = threading.Lock()
+
+# Per-request stage totals, set by the HTTP middleware (None outside a request)
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def _observe(family: str, label: str, seconds: float):
+    with _lock:
+        histograms = _families[family][2]
+        hist = histograms.get(label)
+        if hist is None:
+            hist = histograms[label] = Histogram()
+        hist.observe(seconds)
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration globally and against the current request"""
+    _observe("legal_rag_stage_duration_seconds", stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def observe_request(route: str, seconds: float):
+    _observe("legal_rag_request_duration_seconds", route, seconds)
+
+@contextmanager
+def timed(stage: str):
+    """Time the wrapped block as `stage` (works in sync and async code)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def begin_request() -> Dict[str, float]:
+    """Start collecting stage timings for the current request"""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Format stage totals as a Server-Timing header value (durations in ms)"""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def render_prometheus() -> str:
+    """Render all histograms in the Prometheus text exposition format"""
+    lines: List[str] = []
+    with _lock:
+        for name, (help_text, label_name, histograms) in _families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for label, hist in sorted(histograms.items()):
+                label_value = label.replace("\\", "\\\\").replace('"', '\\"')
+                for bound, count in zip(BUCKETS, hist.bucket_counts):
+                    lines.append(f'{name}_bucket{{{label_name}="{label_value}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label_name}="{label_value}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{label_name}="{label_value}"}} {hist.total}')
+                lines.append(f'{name}_count{{{label_name}="{label_value}"}} {hist.count}')
+    return "\n".join(lines) + "\n"
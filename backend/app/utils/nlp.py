@@ -2,43 +2,83 @@ import os
 import hashlib
 import logging
 import httpx
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import pypdf
 import re
-from ..config import HF_TOKEN
+from ..config import HF_TOKEN, HF_API_BASE
+from .metrics import timed
+from .scheduler import scheduler, InferenceOverloaded
 
 logger = logging.getLogger(__name__)
 
 # Hugging Face API URLs
-API_URL_QA = "https://router.huggingface.co/hf-inference/models/deepset/roberta-base-squad2"
-API_URL_SUM = "https://router.huggingface.co/hf-inference/models/facebook/bart-large-cnn"
-API_URL_EMBED = "https://router.huggingface.co/hf-inference/models/sentence-transformers/all-MiniLM-L6-v2"
+API_URL_QA = f"{HF_API_BASE}/deepset/roberta-base-squad2"
+API_URL_SUM = f"{HF_API_BASE}/facebook/bart-large-cnn"
+API_URL_EMBED = f"{HF_API_BASE}/sentence-transformers/all-MiniLM-L6-v2"
 
 HEADERS = {"Authorization": f"Bearer {HF_TOKEN}"}
 
+# Stage names used for latency metrics
+API_STAGES = {API_URL_QA: "hf_qa", API_URL_SUM: "hf_summarize", API_URL_EMBED: "hf_embed"}
+
+class InferenceError(Exception):
+    """The inference API did not return a usable result"""
+
+async def post_hf_api(url: str, payload: dict) -> Any:
+    """Query the Hugging Face API, raising InferenceError (InferenceOverloaded when shed) on failure"""
+    try:
+        # Admission by priority class within the shared rate limit
+        async with scheduler.slot():
+            # Increased timeout to 30s as cold models take time to load
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                with timed(API_STAGES.get(url, "hf_api")):
+                    response = await client.post(url, headers=HEADERS, json=payload)
+            
+            if response.status_code == 429:
+                scheduler.throttled()
+            if response.status_code != 200:
+                raise InferenceError(f"HF API Error {response.status_code}: {response.text}")
+            return response.json()
+    except (InferenceError, InferenceOverloaded):
+        raise
+    except Exception as e:
+        raise InferenceError(f"HF API Connection Error: {e}") from e
+
 async def query_hf_api(url: str, payload: dict) -> Any:
-    """Helper to query Hugging Face API asynchronously"""
+    """Helper to query Hugging Face API asynchronously (None on any failure)"""
     if not HF_TOKEN:
         logger.warning("HF_TOKEN not set. AI features will fail or fallback.")
         return None
         
     try:
-        # Increased timeout to 30s as cold models take time to load
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=HEADERS, json=payload)
-            
-            if response.status_code != 200:
-                logger.error(f"HF API Error {response.status_code}: {response.text}")
-                return None
-            return response.json()
-    except Exception as e:
-        logger.error(f"HF API Connection Error: {e}")
+        return await post_hf_api(url, payload)
+    except InferenceOverloaded as e:
+        logger.warning(str(e))
+        return None
+    except InferenceError as e:
+        logger.error(str(e))
         return None
 
+EMBED_BATCH_SIZE = 32
+VECTOR_SIZE = 384
+
+def hash_embedding(text: str) -> List[float]:
+    """Fallback embedding from a SHA256 hash (Low RAM usage)"""
+    hash_str = hashlib.sha256(text.encode()).hexdigest()
+    vector = []
+    for i in range(0, min(len(hash_str), VECTOR_SIZE * 2), 2):
+        value = (int(hash_str[i:i + 2], 16) / 255.0) * 2 - 1
+        vector.append(value)
+    while len(vector) < VECTOR_SIZE:
+        vector.append(0.0)
+    return vector[:VECTOR_SIZE]
+
 async def create_vector_embedding(text: str) -> List[float]:
-    """Get embeddings via API or fallback to hashing if API fails"""
-    vector_size = 384
-    
+    """Get embeddings via API or fallback to hashing if API fails.
+
+    Raises InferenceOverloaded when the call is shed: a hash vector never
+    matches the stored embeddings, so the caller reports the overload instead.
+    """
     # 1. Try API
     if HF_TOKEN:
         # FIX: Input must be a LIST ["text"] to force Feature Extraction mode.
@@ -48,7 +88,11 @@ async def create_vector_embedding(text: str) -> List[float]:
             "options": {"wait_for_model": True}
         }
         
-        result = await query_hf_api(API_URL_EMBED, payload)
+        try:
+            result = await post_hf_api(API_URL_EMBED, payload)
+        except InferenceError as e:
+            logger.error(str(e))
+            result = None
         
         if result:
             # Result format is usually [[float, float, ...]] for a batch of 1
@@ -61,14 +105,38 @@ async def create_vector_embedding(text: str) -> List[float]:
             
     # 2. Fallback: Hashing (Low RAM usage)
     logger.info("Using fallback hashing for embedding.")
-    hash_str = hashlib.sha256(text.encode()).hexdigest()
-    vector = []
-    for i in range(0, min(len(hash_str), vector_size * 2), 2):
-        value = (int(hash_str[i:i + 2], 16) / 255.0) * 2 - 1
-        vector.append(value)
-    while len(vector) < vector_size:
-        vector.append(0.0)
-    return vector[:vector_size]
+    return hash_embedding(text)
+
+def _is_embedding_batch(result: Any, size: int) -> bool:
+    return (isinstance(result, list) and len(result) == size
+            and all(isinstance(v, list) and v and not isinstance(v[0], list) for v in result))
+
+async def create_vector_embeddings(texts: List[str], batch_size: int = EMBED_BATCH_SIZE, strict: bool = False) -> List[List[float]]:
+    """Embed many texts with one API call per batch (hash fallback per failed batch).
+
+    strict raises InferenceError (or InferenceOverloaded) instead of falling
+    back, for callers that must not store fallback vectors next to real
+    ones. Without HF_TOKEN hashing is the configured backend in both modes.
+    """
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        result = None
+        if HF_TOKEN:
+            payload = {
+                "inputs": batch,
+                "options": {"wait_for_model": True}
+            }
+            result = await (post_hf_api if strict else query_hf_api)(API_URL_EMBED, payload)
+        
+        if _is_embedding_batch(result, len(batch)):
+            vectors.extend(result)
+        elif strict and HF_TOKEN:
+            raise InferenceError(f"Unexpected embedding response for a batch of {len(batch)}")
+        else:
+            logger.info(f"Using fallback hashing for a batch of {len(batch)} embeddings.")
+            vectors.extend(hash_embedding(t) for t in batch)
+    return vectors
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     import math
@@ -82,7 +150,7 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
 def extract_text_from_pdf(file_path: str) -> str:
     try:
         text = ""
-        with open(file_path, "rb") as f:
+        with timed("pdf_extract"), open(file_path, "rb") as f:
             reader = pypdf.PdfReader(f)
             for page in reader.pages:
                 text += (page.extract_text() or "") + "\n"
@@ -91,6 +159,10 @@ def extract_text_from_pdf(file_path: str) -> str:
         logger.error(f"Error reading PDF: {e}")
         return ""
 
+def content_hash(text: str) -> str:
+    """Stable hash of section content (whitespace-normalized) used to detect changes"""
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
 def parse_legal_document(text: str) -> List[Dict[str, Any]]:
     sections = []
     lines = text.split("\n")
@@ -125,6 +197,23 @@ def parse_legal_document(text: str) -> List[Dict[str, Any]]:
         
     return sections
 
+async def extract_answer(question: str, context: str) -> Optional[Dict[str, Any]]:
+    """Raw extractive QA result ({"answer", "score", "start", "end"}) or None"""
+    if not HF_TOKEN:
+        return None
+        
+    payload = {
+        "inputs": {
+            "question": question,
+            "context": context
+        },
+        "options": {"wait_for_model": True}
+    }
+    response = await query_hf_api(API_URL_QA, payload)
+    if isinstance(response, dict) and 'answer' in response:
+        return response
+    return None
+
 async def generate_llm_answer(question: str, context: str) -> str:
     """Ask Question via API"""
     if not HF_TOKEN:
@@ -148,10 +237,10 @@ async def generate_llm_answer(question: str, context: str) -> str:
 
     return "I couldn't generate an answer from the provided context."
 
-async def summarize_text(text: str) -> str:
-    """Summarize via API"""
+async def query_summary(text: str) -> Optional[str]:
+    """Summary from the API, or None when it is unavailable (so callers can avoid caching fallbacks)"""
     if not HF_TOKEN:
-        return text[:200] + "..."
+        return None
         
     payload = {
         "inputs": text,
@@ -161,5 +250,9 @@ async def summarize_text(text: str) -> str:
     
     if response and isinstance(response, list) and 'summary_text' in response[0]:
         return response[0]['summary_text']
-        
-    return text[:200] + "..."
\ No newline at end of file
+    return None
+
+async def summarize_text(text: str) -> str:
+    """Summarize via API"""
+    summary = await query_summary(text)
+    return summary if summary is not None else text[:200] + "..."
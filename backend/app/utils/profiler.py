@@ -0,0 +1,271 @@
+"""Opt-in sampling profiler for live requests.
+
+Profiled requests are sampled by a background thread that reads the event
+loop thread's stack every few milliseconds (sys._current_frames) while the
+request's task is the one running. Stacks are aggregated per route as
+collapsed stacks ("frame;frame;frame count"), ready for flamegraph.pl or
+speedscope. Requests are profiled when an admin arms sampling for a
+fraction of requests, or when a single request carries X-Profile: 1 and
+the admin token; its profile is then kept as a capture whose id is
+returned in the X-Profile-Id response header.
+
+When nothing is armed the middleware costs one header lookup per request
+and no sampler thread runs. Work handed to worker threads (sync endpoints,
+asyncio.to_thread) is not attributed. Profiles are per worker process.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import hmac
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Optional, List
+from ..config import ADMIN_TOKEN
+
+PROFILE_HEADER = b"x-profile"
+TOKEN_HEADER = b"x-admin-token"
+DEFAULT_INTERVAL_MS = 5.0
+MIN_INTERVAL_MS = 1.0
+MAX_DURATION_SECONDS = 3600.0
+MAX_CAPTURES = 20
+# Distinct stacks kept per route (the rarest are dropped beyond this)
+MAX_STACKS = 5000
+MAX_DEPTH = 128
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def token_valid(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+class RequestProfile:
+    __slots__ = ("path", "tagged", "stacks", "samples", "started")
+
+    def __init__(self, path: str, tagged: bool):
+        self.path = path
+        self.tagged = tagged
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+
+class RouteProfile:
+    __slots__ = ("requests", "samples", "seconds", "stacks")
+
+    def __init__(self):
+        self.requests = 0
+        self.samples = 0
+        self.seconds = 0.0
+        self.stacks: Counter = Counter()
+
+    def add(self, profile: RequestProfile, seconds: float):
+        self.requests += 1
+        self.samples += profile.samples
+        self.seconds += seconds
+        self.stacks.update(profile.stacks)
+        if len(self.stacks) > MAX_STACKS:
+            self.stacks = Counter(dict(self.stacks.most_common(MAX_STACKS)))
+
+def _frame_label(code, cache: Dict[Any, str]) -> str:
+    label = cache.get(code)
+    if label is None:
+        path = os.path.abspath(code.co_filename)
+        if path.startswith(APP_DIR):
+            path = "app" + path[len(APP_DIR):]
+        else:
+            path = "/".join(path.split(os.sep)[-2:])
+        label = cache[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+def collapse(frame, cache: Dict[Any, str]) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame.f_code, cache))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sample_rate = 0.0
+        self.route_prefix: Optional[str] = None
+        self.interval = DEFAULT_INTERVAL_MS / 1000
+        self.until = 0.0
+        # Task running a profiled request -> its profile
+        self.active: Dict[asyncio.Task, RequestProfile] = {}
+        self.routes: Dict[str, RouteProfile] = {}
+        self.captures: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    def configure(self, sample_rate: float, route_prefix: Optional[str] = None,
+                  interval_ms: float = DEFAULT_INTERVAL_MS, duration_seconds: float = 300.0):
+        with self.lock:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            self.route_prefix = route_prefix or None
+            self.interval = max(interval_ms, MIN_INTERVAL_MS) / 1000
+            self.until = time.monotonic() + min(duration_seconds, MAX_DURATION_SECONDS)
+
+    def disarm(self):
+        with self.lock:
+            self.sample_rate = 0.0
+            self.until = 0.0
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.captures.clear()
+
+    def armed(self) -> bool:
+        return self.sample_rate > 0 and time.monotonic() < self.until
+
+    def should_sample(self, path: str) -> bool:
+        if not self.armed():
+            return False
+        if self.route_prefix and not path.startswith(self.route_prefix):
+            return False
+        return random.random() < self.sample_rate
+
+    def begin(self, path: str, tagged: bool) -> RequestProfile:
+        """Start profiling the current task (called on the event loop thread)"""
+        profile = RequestProfile(path, tagged)
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.loop_thread = threading.get_ident()
+            self.active[asyncio.current_task()] = profile
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def end(self, profile: RequestProfile, route: str, capture_id: Optional[str] = None):
+        """Fold the request into its route's profile, and keep it as a capture when tagged"""
+        seconds = time.perf_counter() - profile.started
+        with self.lock:
+            self.active.pop(asyncio.current_task(), None)
+            self.routes.setdefault(route, RouteProfile()).add(profile, seconds)
+            if capture_id is None:
+                return
+            self.captures[capture_id] = {
+                "route": route,
+                "path": profile.path,
+                "duration_ms": round(seconds * 1000, 2),
+                "samples": profile.samples,
+                "interval_ms": self.interval * 1000,
+                "stacks": profile.stacks
+            }
+            while len(self.captures) > MAX_CAPTURES:
+                self.captures.popitem(last=False)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    self._sampler = None
+                    return
+                task = asyncio.current_task(self.loop)
+                profile = self.active.get(task) if task is not None else None
+                if profile is None:
+                    # Loop idle or running another request
+                    continue
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    profile.stacks[collapse(frame, self._labels)] += 1
+                    profile.samples += 1
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "enabled": bool(ADMIN_TOKEN),
+                "armed": self.armed(),
+                "sample_rate": self.sample_rate,
+                "route_prefix": self.route_prefix,
+                "interval_ms": self.interval * 1000,
+                "seconds_left": round(max(self.until - time.monotonic(), 0.0), 1) if self.armed() else 0.0,
+                "in_flight": len(self.active),
+                "routes": {
+                    route: {
+                        "requests": stats.requests,
+                        "samples": stats.samples,
+                        "avg_ms": round(stats.seconds / stats.requests * 1000, 2) if stats.requests else 0.0
+                    }
+                    for route, stats in self.routes.items()
+                },
+                "captures": list(self.captures)
+            }
+
+    def route_stacks(self, route: Optional[str] = None) -> Counter:
+        """Collapsed stacks of one route, or of every route with the route as the root frame"""
+        with self.lock:
+            if route is not None:
+                stats = self.routes.get(route)
+                return Counter(stats.stacks) if stats else Counter()
+            merged: Counter = Counter()
+            for name, stats in self.routes.items():
+                for stack, count in stats.stacks.items():
+                    merged[f"{name};{stack}"] += count
+            return merged
+
+    def capture(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.captures.get(capture_id)
+
+def render_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def summarize(stacks: Counter, top: int = 25) -> Dict[str, Any]:
+    """Hottest functions by self (leaf) and total (anywhere on the stack) samples"""
+    total = sum(stacks.values())
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    def ranked(counts: Counter) -> List[Dict[str, Any]]:
+        return [
+            {"frame": frame, "samples": count, "percent": round(count / total * 100, 1)}
+            for frame, count in counts.most_common(top)
+        ]
+
+    return {"samples": total, "self": ranked(self_counts), "total": ranked(total_counts)}
+
+class ProfilingMiddleware:
+    """ASGI middleware: runs in the same task as the endpoint, so samples can be attributed to it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMIN_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        tagged = False
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) == b"1":
+            tagged = token_valid(headers.get(TOKEN_HEADER, b"").decode("latin-1"))
+        if not tagged and not profiler.should_sample(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.begin(scope["path"], tagged)
+        capture_id = uuid.uuid4().hex[:12] if tagged else None
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start" and capture_id:
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", capture_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            profiler.end(profile, route, capture_id)
+
+profiler = Profiler()
@@ -0,0 +1,218 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Deque, Tuple, Optional
+from ..config import HF_RATE_LIMIT, HF_BURST, HF_MAX_CONCURRENCY, HF_CLI_RATE_LIMIT, WEB_CONCURRENCY
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Priority classes for outbound inference, highest first
+INTERACTIVE = "interactive"
+INGEST = "ingest"
+MAINTENANCE = "maintenance"
+CLASSES = (INTERACTIVE, INGEST, MAINTENANCE)
+
+# Load shedding: a call is rejected when its class already has this many
+# waiters, or has waited longer than MAX_WAIT_SECONDS. Rejected calls return
+# None from query_hf_api, so callers take their usual fallback, except the
+# query embedding of a search, which answers 503 instead. Ingest and
+# maintenance are never shed (a fallback embedding would be stored for good);
+# they just wait behind interactive calls.
+SHED_DEPTH: Dict[str, Optional[int]] = {INTERACTIVE: 64, INGEST: None, MAINTENANCE: None}
+MAX_WAIT_SECONDS: Dict[str, Optional[float]] = {INTERACTIVE: 10.0, INGEST: None, MAINTENANCE: None}
+# After a 429 the bucket is drained this far below zero
+THROTTLE_PENALTY_SECONDS = 1.0
+# Retry-After sent with a 503 for a shed call
+SHED_RETRY_AFTER_SECONDS = 5
+RECENT_WAITS = 256
+
+_priority: ContextVar[str] = ContextVar("inference_priority", default=INTERACTIVE)
+
+class InferenceOverloaded(Exception):
+    pass
+
+@contextmanager
+def priority(cls: str):
+    """Run inference calls made in this block (and tasks it starts) at priority `cls`"""
+    token = _priority.set(cls)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class ClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.shed = 0
+        self.max_wait = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=RECENT_WAITS)
+
+    def record_wait(self, seconds: float):
+        self.admitted += 1
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent_waits.append(seconds)
+
+class InferenceScheduler:
+    """Admission control for outbound inference calls in this worker.
+
+    A token bucket enforces the request rate (a rate of 0 means unlimited)
+    and a concurrency cap bounds calls in flight. Waiters are granted strictly by priority class, FIFO
+    within a class, so a large upload cannot starve interactive queries.
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {cls: deque() for cls in CLASSES}
+        self.stats = {cls: ClassStats() for cls in CLASSES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self.updated = now
+
+    def _shed(self, cls: str, reason: str):
+        self.stats[cls].shed += 1
+        return InferenceOverloaded(f"{cls} inference call shed: {reason}")
+
+    def _dispatch(self):
+        """Grant waiting calls while tokens and concurrency allow"""
+        self._refill()
+        now = time.monotonic()
+        for cls in CLASSES:
+            queue = self.queues[cls]
+            while queue and (queue[0][0].done() or (MAX_WAIT_SECONDS[cls] is not None and now - queue[0][1] > MAX_WAIT_SECONDS[cls])):
+                future, _ = queue.popleft()
+                if not future.done():
+                    future.set_exception(self._shed(cls, f"waited over {MAX_WAIT_SECONDS[cls]:.0f}s"))
+
+        while self.in_flight < self.max_concurrency and self.tokens >= 1:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            cls, future, enqueued = waiter
+            self.tokens -= 1
+            self.in_flight += 1
+            self.stats[cls].record_wait(now - enqueued)
+            future.set_result(None)
+
+        loop = asyncio.get_running_loop()
+        if self._timer is not None and self._timer_loop is not loop:
+            # Left over from an event loop that has since closed
+            self._timer = None
+        if self._timer is None and self.rate > 0 and self.in_flight < self.max_concurrency and any(self.queues.values()):
+            # Wake up when the next token is due
+            delay = max((1 - self.tokens) / self.rate, 0.001)
+            self._timer = loop.call_later(delay, self._on_timer)
+            self._timer_loop = loop
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _waiting(self, cls: str) -> int:
+        """Waiters of `cls` still queued (cancelled ones stay in the deque until dispatch)"""
+        return sum(1 for future, _ in self.queues[cls] if not future.done())
+
+    def _next_waiter(self):
+        for cls in CLASSES:
+            queue = self.queues[cls]
+            while queue:
+                future, enqueued = queue.popleft()
+                if not future.done():
+                    return cls, future, enqueued
+        return None
+
+    async def acquire(self, cls: str):
+        depth = SHED_DEPTH[cls]
+        if depth is not None and self._waiting(cls) >= depth:
+            raise self._shed(cls, f"{depth} calls already queued")
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues[cls].append((future, time.monotonic()))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled just after being granted: hand the slot back
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            raise
+
+    def set_budget(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.tokens = min(self.tokens, float(burst))
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def throttled(self):
+        """The provider answered 429: stop granting for a while"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - THROTTLE_PENALTY_SECONDS * self.rate
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one admitted call at the current priority (see priority())"""
+        with timed("hf_queue"):
+            await self.acquire(_priority.get())
+        try:
+            yield
+        finally:
+            self.release()
+
+    def status(self) -> Dict[str, Any]:
+        self._refill()
+        classes = {}
+        for cls in CLASSES:
+            stats = self.stats[cls]
+            waits = sorted(stats.recent_waits)
+            classes[cls] = {
+                "queued": self._waiting(cls),
+                "admitted": stats.admitted,
+                "shed": stats.shed,
+                "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                "max_wait_ms": round(stats.max_wait * 1000, 1)
+            }
+        return {
+            "rate_per_sec": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "classes": classes
+        }
+
+def _share(fraction: float, parts: int = 1) -> Tuple[float, int, int]:
+    """(rate, burst, max_concurrency) for `parts` equal holders of `fraction` of the budget"""
+    return (
+        HF_RATE_LIMIT * fraction / parts,
+        max(1, int(HF_BURST * fraction) // parts),
+        max(1, int(HF_MAX_CONCURRENCY * fraction) // parts)
+    )
+
+CLI_FRACTION = HF_CLI_RATE_LIMIT / HF_RATE_LIMIT if HF_RATE_LIMIT > 0 else 0.0
+
+# One scheduler per worker process with its share of the deployment's budget
+scheduler = InferenceScheduler(*_share(1 - CLI_FRACTION, WEB_CONCURRENCY))
+
+def use_cli_budget():
+    """Switch this process to the budget reserved for the bulk CLIs (HF_CLI_RATE_LIMIT)"""
+    scheduler.set_budget(*_share(CLI_FRACTION))
@@ -1,5 +1,16 @@
 import hashlib
+from typing import Optional
+from fastapi import Header, HTTPException
+from ..config import ADMIN_TOKEN
+from .profiler import token_valid
 
 def hash_password(password: str) -> str:
     """Hash password using SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for admin-only endpoints (hidden entirely when ADMIN_TOKEN is unset)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not token_valid(x_admin_token):
+        raise HTTPException(403, "Invalid admin token")
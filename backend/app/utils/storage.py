@@ -0,0 +1,860 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, DeleteMany, ASCENDING
+from .. import database as db
+from ..config import MONGO_URL
+from .nlp import content_hash, VECTOR_SIZE
+from . import vector_index, dedup, autocomplete
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: writes are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# File-based fallback storage
+LAWS_FILE = "data/laws.json"
+SECTIONS_FILE = "data/sections.json"
+VECTORS_FILE = "data/vectors.json"
+SUMMARIES_FILE = "data/summaries.json"
+# Bumped by app.reindex when it swaps in a rebuilt sections/vectors set
+GENERATION_FILE = "data/store_generation"
+WRITE_LOCK_FILE = "data/.write.lock"
+# Most law ids a metadata filter passes to one $in query (about 2 MB, far below
+# MongoDB's 16 MB document limit); broader filters are applied to the results
+MAX_FILTER_LAW_IDS = 50000
+
+class StaleUpdate(Exception):
+    """The law was updated since the section plan was computed"""
+
+def load_json(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_json(path: str, data: Any):
+    """Write via a temp file + rename so readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def next_id(items: List[Dict[str, Any]]) -> int:
+    """Next numeric id for file-based records (safe after deletions)"""
+    return max((int(item["id"]) for item in items if str(item.get("id", "")).isdigit()), default=0) + 1
+
+def store_generation() -> int:
+    try:
+        with open(GENERATION_FILE, 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def store_generation_time() -> Optional[datetime]:
+    """When the store generation was last bumped (UTC)"""
+    try:
+        return datetime.utcfromtimestamp(os.path.getmtime(GENERATION_FILE))
+    except OSError:
+        return None
+
+def bump_store_generation():
+    tmp_path = f"{GENERATION_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(str(store_generation() + 1))
+    os.replace(tmp_path, GENERATION_FILE)
+
+@contextmanager
+def write_lock(exclusive: bool = False):
+    """Cross-process lock around store writes.
+
+    Writers hold it shared with MongoDB and exclusively in file mode, where
+    a write rewrites whole files; app.reindex holds it exclusively while it
+    switches the store, so no write lands half in the old set.
+    """
+    os.makedirs(os.path.dirname(WRITE_LOCK_FILE), exist_ok=True)
+    with open(WRITE_LOCK_FILE, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive or db.db is None else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def store_write(func):
+    """Run a store write (and its inline publish) under write_lock()"""
+    @functools.wraps(func)
+    def locked(*args, **kwargs):
+        with write_lock():
+            return func(*args, **kwargs)
+    return locked
+
+def store_identity() -> str:
+    """Names the active store; derived indexes record it so they are never reused against another one"""
+    if db.db is not None:
+        # The connection string may hold credentials, so only a digest of it is kept
+        server = hashlib.sha256((MONGO_URL or "").encode()).hexdigest()[:12]
+        return f"mongodb:{server}/{db.db.name}"
+    return "files"
+
+_publisher: Optional[ThreadPoolExecutor] = None
+_publisher_lock = threading.Lock()
+
+def _publish(changes: Dict[str, Any]):
+    try:
+        vector_index.publish_changes(**changes)
+    except Exception as e:
+        logger.error(f"Vector index publish failed: {e}")
+        return
+    index = autocomplete.loaded()
+    if index is not None:
+        # The write is already in this worker's index: don't rebuild it for its own publish
+        autocomplete.mark_current(index)
+
+def publish_index(**changes):
+    """Publish store changes to the shared vector index (never fails the write).
+
+    Inside an event loop (the API) the publish is handed to one background
+    thread, so publishes stay in order and a request never waits on the
+    cross-process publish lock; outside one (CLIs, tests) it runs inline.
+    The change is tagged with the store generation it was written to, so it
+    is dropped if app.reindex switches the store before it is published.
+    """
+    global _publisher
+    changes["generation"] = store_generation()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _publish(changes)
+        return
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-publish")
+    _publisher.submit(_publish, changes)
+
+def wait_for_publishes():
+    """Block until publishes handed to the background thread have finished"""
+    if _publisher is not None:
+        _publisher.submit(lambda: None).result()
+
+def update_autocomplete(added=(), removed_law_ids=()):
+    """Keep this worker's autocomplete index in step with a write (other workers rebuild theirs)"""
+    index = autocomplete.loaded()
+    if index is None:
+        return
+    for law_id in removed_law_ids:
+        index.remove_law(law_id)
+    for law_id, title, sections in added:
+        index.add_law(law_id, title, sections)
+    autocomplete.mark_current(index)
+
+@store_write
+def insert_documents(documents: List[Dict[str, Any]], publish: bool = True) -> List[str]:
+    """Bulk-write laws with their sections and vectors to the active store.
+
+    Each entry holds "law" (metadata fields), "text" (extracted full text),
+    "sections" (parse_legal_document output) and "vectors" (one per section).
+    Entries may also carry "duplicates" and "simhashes" from
+    dedup.assign_duplicates: a near-duplicate section stores no vector of its
+    own (its vector is None) and references the section it shares one with.
+    Raises dedup.CanonicalMissing, before writing anything, when a referenced
+    stored section is gone (see dedup.store_documents).
+    Returns the new law ids in input order.
+    """
+    law_ids = []
+    added = []
+    laws_meta = {}
+    duplicate_of_map: Dict[str, str] = {}
+    new_canonicals = []
+
+    stored_refs = {
+        ref["section_id"] for doc in documents for ref in doc.get("duplicates") or [] if ref and "section_id" in ref
+    }
+    canonical_vectors = get_vectors_by_section_ids(list(stored_refs))
+    missing = stored_refs - set(canonical_vectors)
+    if missing:
+        raise dedup.CanonicalMissing(sorted(missing))
+
+    def resolve(doc, section_ids):
+        """(duplicate_of, vector) per section; the vector is the shared one for duplicates"""
+        refs = doc.get("duplicates") or [None] * len(doc["sections"])
+        resolved = []
+        for i, ref in enumerate(refs):
+            if ref is None:
+                resolved.append((None, doc["vectors"][i]))
+            elif "local" in ref:
+                resolved.append((section_ids[ref["local"]], doc["vectors"][ref["local"]]))
+            else:
+                resolved.append((ref["section_id"], canonical_vectors[ref["section_id"]]))
+        return resolved
+
+    def section_record(law_id, i, section, simhash_value, duplicate_of):
+        return {
+            "law_id": law_id,
+            "section_number": section.get('section_number', str(i + 1)),
+            "title": section.get('title', f"Section {i + 1}"),
+            "content": section['content'],
+            "content_hash": content_hash(section['content']),
+            "simhash": dedup.to_hex(simhash_value),
+            "duplicate_of": duplicate_of,
+            "order": i
+        }
+
+    def track(law_id, section_ids, resolved, hashes):
+        for section_id, (duplicate_of, vector), simhash_value in zip(section_ids, resolved, hashes):
+            added.append((section_id, law_id, vector))
+            if duplicate_of:
+                duplicate_of_map[section_id] = duplicate_of
+            elif simhash_value is not None:
+                new_canonicals.append((section_id, simhash_value))
+
+    if db.db is not None:
+        for doc in documents:
+            law = dict(doc["law"])
+            text = doc["text"]
+            law.update({
+                "text_preview": text[:500] + "..." if len(text) > 500 else text,
+                "full_text": text,
+                "sections_count": len(doc["sections"]),
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            })
+            law_id = str(db.laws.insert_one(law).inserted_id)
+            law_ids.append(law_id)
+            laws_meta[law_id] = law
+            if not doc["sections"]:
+                continue
+
+            # Ids are assigned up front so duplicates can reference sections of the same batch
+            object_ids = [ObjectId() for _ in doc["sections"]]
+            section_ids = [str(oid) for oid in object_ids]
+            hashes = doc.get("simhashes") or [None] * len(doc["sections"])
+            resolved = resolve(doc, section_ids)
+            db.sections.insert_many([
+                {"_id": oid, **section_record(law_id, i, section, hashes[i], resolved[i][0]), "created_at": datetime.utcnow()}
+                for i, (oid, section) in enumerate(zip(object_ids, doc["sections"]))
+            ])
+            vector_docs = [
+                {
+                    "section_id": section_id,
+                    "law_id": law_id,
+                    "vector": vector,
+                    "created_at": datetime.utcnow()
+                }
+                for section_id, (duplicate_of, vector) in zip(section_ids, resolved) if duplicate_of is None
+            ]
+            if vector_docs:
+                db.vectors.insert_many(vector_docs)
+            track(law_id, section_ids, resolved, hashes)
+    else:
+        laws_data = load_json(LAWS_FILE)
+        sections_data = load_json(SECTIONS_FILE)
+        vectors_data = load_json(VECTORS_FILE)
+        law_seq, section_seq, vector_seq = next_id(laws_data), next_id(sections_data), next_id(vectors_data)
+
+        for doc in documents:
+            law_id = str(law_seq)
+            law_seq += 1
+            law = {"id": law_id, **doc["law"]}
+            law.update({
+                "sections_count": len(doc["sections"]),
+                "created_at": datetime.utcnow().isoformat()
+            })
+            laws_data.append(law)
+            law_ids.append(law_id)
+            laws_meta[law_id] = law
+
+            section_ids = [str(section_seq + i) for i in range(len(doc["sections"]))]
+            section_seq += len(section_ids)
+            hashes = doc.get("simhashes") or [None] * len(doc["sections"])
+            resolved = resolve(doc, section_ids)
+            for i, (section_id, section) in enumerate(zip(section_ids, doc["sections"])):
+                sections_data.append({"id": section_id, **section_record(law_id, i, section, hashes[i], resolved[i][0])})
+                duplicate_of, vector = resolved[i]
+                if duplicate_of is None:
+                    vectors_data.append({
+                        "id": str(vector_seq),
+                        "section_id": section_id,
+                        "law_id": law_id,
+                        "vector": vector
+                    })
+                    vector_seq += 1
+            track(law_id, section_ids, resolved, hashes)
+
+        save_json(LAWS_FILE, laws_data)
+        save_json(SECTIONS_FILE, sections_data)
+        save_json(VECTORS_FILE, vectors_data)
+
+    index = dedup.get_index()
+    for section_id, simhash_value in new_canonicals:
+        index.add(section_id, simhash_value)
+    if publish:
+        publish_index(added=added, laws={i: law_metadata(law) for i, law in laws_meta.items()}, duplicates=duplicate_of_map)
+    update_autocomplete(added=[(law_id, doc["law"].get("title", ""), doc["sections"]) for law_id, doc in zip(law_ids, documents)])
+    return law_ids
+
+def _promote_duplicates(canonical_ids: List[str], excluded_section_ids: set = frozenset(),
+                        excluded_law_ids: set = frozenset(), sections_data=None, vectors_data=None):
+    """Hand the embedding of canonical sections about to be removed or rewritten to a surviving duplicate.
+
+    The first surviving duplicate of each canonical gets a copy of its vector
+    and the others are repointed to it. File-based callers pass their loaded
+    lists, which are modified in place. Returns (index rows, duplicate map)
+    for the promoted sections.
+    """
+    rows, duplicate_of_map = [], {}
+    if not canonical_ids:
+        return rows, duplicate_of_map
+    wanted = set(canonical_ids)
+
+    if db.db is not None:
+        dependents = [
+            sec for sec in db.sections.find({"duplicate_of": {"$in": list(wanted)}}, {"law_id": 1, "duplicate_of": 1, "simhash": 1})
+            if str(sec["_id"]) not in excluded_section_ids and sec["law_id"] not in excluded_law_ids
+        ]
+        for sec in dependents:
+            sec["id"] = str(sec["_id"])
+    else:
+        dependents = [
+            sec for sec in sections_data
+            if sec.get("duplicate_of") in wanted and sec["id"] not in excluded_section_ids and sec["law_id"] not in excluded_law_ids
+        ]
+    if not dependents:
+        return rows, duplicate_of_map
+
+    vectors = get_vectors_by_section_ids(list({sec["duplicate_of"] for sec in dependents}), vectors_data)
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for sec in dependents:
+        groups.setdefault(sec["duplicate_of"], []).append(sec)
+
+    index = dedup.get_index()
+    for canonical_id, members in groups.items():
+        vector = vectors.get(canonical_id)
+        if vector is None:
+            continue
+        promoted, others = members[0], members[1:]
+        other_ids = [sec["id"] for sec in others]
+        if db.db is not None:
+            db.sections.update_one({"_id": promoted["_id"]}, {"$set": {"duplicate_of": None}})
+            if other_ids:
+                db.sections.update_many({"_id": {"$in": [ObjectId(i) for i in other_ids]}}, {"$set": {"duplicate_of": promoted["id"]}})
+            db.vectors.insert_one({"section_id": promoted["id"], "law_id": promoted["law_id"], "vector": vector, "created_at": datetime.utcnow()})
+        else:
+            promoted["duplicate_of"] = None
+            for sec in others:
+                sec["duplicate_of"] = promoted["id"]
+            vectors_data.append({"id": str(next_id(vectors_data)), "section_id": promoted["id"], "law_id": promoted["law_id"], "vector": vector})
+
+        index.remove([canonical_id])
+        if promoted.get("simhash"):
+            index.add(promoted["id"], dedup.from_hex(promoted["simhash"]))
+        rows.append((promoted["id"], promoted["law_id"], vector))
+        for sec in others:
+            rows.append((sec["id"], sec["law_id"], vector))
+            duplicate_of_map[sec["id"]] = promoted["id"]
+    return rows, duplicate_of_map
+
+@store_write
+def delete_documents(law_ids: List[str], publish: bool = True) -> int:
+    """Delete laws and cascade to their sections and vectors. Returns laws removed."""
+    if not law_ids:
+        return 0
+    ids = set(law_ids)
+    if db.db is not None:
+        law_sections = list(db.sections.find({"law_id": {"$in": law_ids}}, {"duplicate_of": 1}))
+        removed_section_ids = [str(sec["_id"]) for sec in law_sections]
+        canonical_ids = [str(sec["_id"]) for sec in law_sections if not sec.get("duplicate_of")]
+        promoted_rows, promoted_map = _promote_duplicates(canonical_ids, excluded_law_ids=ids)
+
+        result = db.laws.delete_many({"_id": {"$in": [ObjectId(i) for i in law_ids]}})
+        db.sections.delete_many({"law_id": {"$in": law_ids}})
+        db.vectors.delete_many({"law_id": {"$in": law_ids}})
+        deleted = result.deleted_count
+    else:
+        laws_data = load_json(LAWS_FILE)
+        remaining = [d for d in laws_data if d["id"] not in ids]
+        if len(remaining) == len(laws_data):
+            return 0
+        sections_data = load_json(SECTIONS_FILE)
+        vectors_data = load_json(VECTORS_FILE)
+        law_sections = [s for s in sections_data if s["law_id"] in ids]
+        removed_section_ids = [s["id"] for s in law_sections]
+        canonical_ids = [s["id"] for s in law_sections if not s.get("duplicate_of")]
+        promoted_rows, promoted_map = _promote_duplicates(
+            canonical_ids, excluded_law_ids=ids, sections_data=sections_data, vectors_data=vectors_data
+        )
+
+        save_json(LAWS_FILE, remaining)
+        save_json(SECTIONS_FILE, [s for s in sections_data if s["law_id"] not in ids])
+        save_json(VECTORS_FILE, [v for v in vectors_data if v["law_id"] not in ids])
+        deleted = len(laws_data) - len(remaining)
+
+    dedup.get_index().remove(removed_section_ids)
+    delete_law_summaries(law_ids)
+    if (deleted or promoted_rows) and publish:
+        publish_index(added=promoted_rows, removed_law_ids=law_ids, duplicates=promoted_map)
+    update_autocomplete(removed_law_ids=law_ids)
+    return deleted
+
+def find_law_ids_by_file_path(paths: List[str]) -> List[str]:
+    if db.db is not None:
+        return [str(d["_id"]) for d in db.laws.find({"file_path": {"$in": paths}}, {"_id": 1})]
+    wanted = set(paths)
+    return [d["id"] for d in load_json(LAWS_FILE) if d.get("file_path") in wanted]
+
+def get_law(law_id: str, projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+    """The projection applies to MongoDB only (file-based laws are small)"""
+    if db.db is not None:
+        if not ObjectId.is_valid(law_id):
+            return None
+        return db.laws.find_one({"_id": ObjectId(law_id)}, projection)
+    return next((d for d in load_json(LAWS_FILE) if d["id"] == law_id), None)
+
+def get_section_page(law_id: str, skip: int, limit: int, preview_chars: int = 200) -> List[Dict[str, Any]]:
+    """One page of a law's sections in document order, with a content preview instead of the content"""
+    if db.db is not None:
+        pipeline = [
+            {"$match": {"law_id": law_id}},
+            {"$sort": {"order": ASCENDING}},
+            {"$skip": skip},
+            {"$limit": limit},
+            # Cut by the server so full section content never leaves the database
+            # (one extra character tells whether the preview was truncated)
+            {"$project": {
+                "section_number": 1,
+                "title": 1,
+                "content_preview": {"$substrCP": [{"$ifNull": ["$content", ""]}, 0, preview_chars + 1]}
+            }}
+        ]
+        sections = list(db.sections.aggregate(pipeline))
+        for sec in sections:
+            sec["id"] = str(sec.pop("_id"))
+            if len(sec["content_preview"]) > preview_chars:
+                sec["content_preview"] = sec["content_preview"][:preview_chars] + "..."
+        return sections
+    sections = sorted((s for s in load_json(SECTIONS_FILE) if s["law_id"] == law_id), key=lambda s: s.get("order", 0))
+    return [
+        {
+            "id": sec["id"],
+            "section_number": sec.get("section_number"),
+            "title": sec.get("title"),
+            "content_preview": sec.get("content", "")[:preview_chars] + "..." if len(sec.get("content", "")) > preview_chars else sec.get("content", "")
+        }
+        for sec in sections[skip:skip + limit]
+    ]
+
+def count_sections(law_id: str) -> int:
+    if db.db is not None:
+        return db.sections.count_documents({"law_id": law_id})
+    return sum(1 for s in load_json(SECTIONS_FILE) if s["law_id"] == law_id)
+
+def get_sections(law_id: str) -> List[Dict[str, Any]]:
+    """Sections of a law in document order, with a string "id" in both modes"""
+    if db.db is not None:
+        sections = list(db.sections.find({"law_id": law_id}))
+        for sec in sections:
+            sec["id"] = str(sec["_id"])
+    else:
+        sections = [s for s in load_json(SECTIONS_FILE) if s["law_id"] == law_id]
+    return sorted(sections, key=lambda s: s.get("order", 0))
+
+def plan_section_update(old_sections: List[Dict[str, Any]], new_sections: List[Dict[str, Any]]) -> Dict[str, list]:
+    """Diff parsed sections against stored ones by content hash.
+
+    Unchanged content keeps its id (only order/number/title may move). Changed
+    content is matched to the old section with the same number so its id
+    stays stable, and only those plus brand-new sections need embedding.
+    """
+    by_hash: Dict[str, List[Dict[str, Any]]] = {}
+    for old in old_sections:
+        old_hash = old.get("content_hash") or content_hash(old.get("content", ""))
+        by_hash.setdefault(old_hash, []).append(old)
+
+    plan = {"keep": [], "update": [], "insert": [], "delete": []}
+    matched = set()
+    unmatched_new = []
+    for order, section in enumerate(new_sections):
+        new_hash = content_hash(section['content'])
+        candidates = by_hash.get(new_hash)
+        if candidates:
+            old = candidates.pop(0)
+            matched.add(old["id"])
+            plan["keep"].append((old["id"], section, order, new_hash))
+        else:
+            unmatched_new.append((section, order, new_hash))
+
+    by_number = {}
+    for old in old_sections:
+        if old["id"] not in matched:
+            by_number.setdefault(old.get("section_number"), []).append(old)
+    for section, order, new_hash in unmatched_new:
+        candidates = by_number.get(section.get('section_number'))
+        if candidates:
+            old = candidates.pop(0)
+            matched.add(old["id"])
+            plan["update"].append((old["id"], section, order, new_hash))
+        else:
+            plan["insert"].append((section, order, new_hash))
+
+    plan["delete"] = [old["id"] for old in old_sections if old["id"] not in matched]
+    return plan
+
+@store_write
+def apply_section_update(law_id: str, plan: Dict[str, list], update_vectors: List[List[float]],
+                         insert_vectors: List[List[float]], law_fields: Dict[str, Any],
+                         revision: Optional[int] = None) -> List[str]:
+    """Write a plan from plan_section_update. Returns ids of inserted sections.
+
+    Updated and inserted sections always get their own vector. Duplicates of a
+    rewritten or deleted section are handed its old vector first. `revision`
+    is the law's revision the plan was computed against: StaleUpdate is raised,
+    before anything is written, when another update has landed since.
+    """
+    def section_fields(section, order):
+        return {
+            "section_number": section.get('section_number', str(order + 1)),
+            "title": section.get('title', f"Section {order + 1}"),
+            "order": order
+        }
+
+    rewritten = [section_id for section_id, _, _, _ in plan["update"]] + plan["delete"]
+    update_hashes = [dedup.simhash(section['content']) for _, section, _, _ in plan["update"]]
+    insert_hashes = [dedup.simhash(section['content']) for section, _, _ in plan["insert"]]
+
+    if db.db is not None:
+        # Claim the next revision first, so a concurrent update of the same law fails instead of interleaving
+        claim = {"_id": ObjectId(law_id)}
+        if revision is not None:
+            claim["revision"] = revision if revision else {"$in": [0, None]}
+        claimed = db.laws.update_one(claim, {"$set": {**law_fields, "updated_at": datetime.utcnow()}, "$inc": {"revision": 1}})
+        if not claimed.matched_count:
+            raise StaleUpdate(law_id)
+
+        promoted = _promote_duplicates(rewritten, excluded_section_ids=set(rewritten))
+        section_ops, vector_ops = [], []
+        for section_id, section, order, new_hash in plan["keep"]:
+            section_ops.append(UpdateOne({"_id": ObjectId(section_id)}, {"$set": {
+                **section_fields(section, order), "content_hash": new_hash
+            }}))
+        for (section_id, section, order, new_hash), vector, simhash_value in zip(plan["update"], update_vectors, update_hashes):
+            section_ops.append(UpdateOne({"_id": ObjectId(section_id)}, {"$set": {
+                **section_fields(section, order),
+                "content": section['content'], "content_hash": new_hash,
+                "simhash": dedup.to_hex(simhash_value), "duplicate_of": None
+            }}))
+            # Upsert: a section that was a duplicate had no vector of its own
+            vector_ops.append(UpdateOne({"section_id": section_id}, {"$set": {
+                "law_id": law_id, "vector": vector, "created_at": datetime.utcnow()
+            }}, upsert=True))
+
+        inserted_ids = []
+        if plan["insert"]:
+            result = db.sections.insert_many([
+                {
+                    "law_id": law_id,
+                    **section_fields(section, order),
+                    "content": section['content'],
+                    "content_hash": new_hash,
+                    "simhash": dedup.to_hex(simhash_value),
+                    "duplicate_of": None,
+                    "created_at": datetime.utcnow()
+                }
+                for (section, order, new_hash), simhash_value in zip(plan["insert"], insert_hashes)
+            ])
+            inserted_ids = [str(i) for i in result.inserted_ids]
+            vector_ops.extend(
+                InsertOne({"section_id": section_id, "law_id": law_id, "vector": vector, "created_at": datetime.utcnow()})
+                for section_id, vector in zip(inserted_ids, insert_vectors)
+            )
+        if plan["delete"]:
+            section_ops.append(DeleteMany({"_id": {"$in": [ObjectId(i) for i in plan["delete"]]}}))
+            vector_ops.append(DeleteMany({"section_id": {"$in": plan["delete"]}}))
+
+        if section_ops:
+            db.sections.bulk_write(section_ops, ordered=False)
+        if vector_ops:
+            db.vectors.bulk_write(vector_ops, ordered=False)
+    else:
+        laws_data = load_json(LAWS_FILE)
+        law = next((d for d in laws_data if d["id"] == law_id), None)
+        if law is None or (revision is not None and law.get("revision", 0) != revision):
+            raise StaleUpdate(law_id)
+        sections_data = load_json(SECTIONS_FILE)
+        vectors_data = load_json(VECTORS_FILE)
+        promoted = _promote_duplicates(
+            rewritten, excluded_section_ids=set(rewritten), sections_data=sections_data, vectors_data=vectors_data
+        )
+        sections_by_id = {s["id"]: s for s in sections_data}
+        vectors_by_section = {v["section_id"]: v for v in vectors_data}
+        section_seq, vector_seq = next_id(sections_data), next_id(vectors_data)
+
+        for section_id, section, order, new_hash in plan["keep"]:
+            sections_by_id[section_id].update(section_fields(section, order), content_hash=new_hash)
+        for (section_id, section, order, new_hash), vector, simhash_value in zip(plan["update"], update_vectors, update_hashes):
+            sections_by_id[section_id].update(
+                section_fields(section, order), content=section['content'], content_hash=new_hash,
+                simhash=dedup.to_hex(simhash_value), duplicate_of=None
+            )
+            if section_id in vectors_by_section:
+                vectors_by_section[section_id]["vector"] = vector
+            else:
+                vectors_data.append({"id": str(vector_seq), "section_id": section_id, "law_id": law_id, "vector": vector})
+                vector_seq += 1
+
+        inserted_ids = []
+        for (section, order, new_hash), vector, simhash_value in zip(plan["insert"], insert_vectors, insert_hashes):
+            section_id = str(section_seq)
+            section_seq += 1
+            inserted_ids.append(section_id)
+            sections_data.append({
+                "id": section_id,
+                "law_id": law_id,
+                **section_fields(section, order),
+                "content": section['content'],
+                "content_hash": new_hash,
+                "simhash": dedup.to_hex(simhash_value),
+                "duplicate_of": None
+            })
+            vectors_data.append({"id": str(vector_seq), "section_id": section_id, "law_id": law_id, "vector": vector})
+            vector_seq += 1
+
+        deleted = set(plan["delete"])
+        law.update(law_fields, updated_at=datetime.utcnow().isoformat(), revision=law.get("revision", 0) + 1)
+        save_json(LAWS_FILE, laws_data)
+        save_json(SECTIONS_FILE, [s for s in sections_data if s["id"] not in deleted])
+        save_json(VECTORS_FILE, [v for v in vectors_data if v["section_id"] not in deleted])
+
+    index = dedup.get_index()
+    index.remove(rewritten)
+    for (section_id, _, _, _), simhash_value in zip(plan["update"], update_hashes):
+        if simhash_value is not None:
+            index.add(section_id, simhash_value)
+    for section_id, simhash_value in zip(inserted_ids, insert_hashes):
+        if simhash_value is not None:
+            index.add(section_id, simhash_value)
+    _publish_section_update(law_id, plan, update_vectors, inserted_ids, insert_vectors, promoted)
+    return inserted_ids
+
+def _publish_section_update(law_id, plan, update_vectors, inserted_ids, insert_vectors, promoted):
+    promoted_rows, promoted_map = promoted
+    added = [(section_id, law_id, vector) for (section_id, _, _, _), vector in zip(plan["update"], update_vectors)]
+    added += [(section_id, law_id, vector) for section_id, vector in zip(inserted_ids, insert_vectors)]
+    law = get_law(law_id) or {}
+    publish_index(added=added + promoted_rows, removed_sections=[(section_id, law_id) for section_id in plan["delete"]],
+                  laws={law_id: law_metadata(law)}, duplicates=promoted_map)
+    sections = [entry[1] for entry in plan["keep"] + plan["update"]] + [section for section, _, _ in plan["insert"]]
+    update_autocomplete(added=[(law_id, law.get("title", ""), sections)], removed_law_ids=[law_id])
+
+def iter_vector_rows():
+    """Stream (section_id, law_id, vector) for every stored vector"""
+    if db.db is not None:
+        for vec_doc in db.vectors.find({}, {"section_id": 1, "law_id": 1, "vector": 1}):
+            yield vec_doc["section_id"], vec_doc["law_id"], vec_doc["vector"]
+    else:
+        for vec_doc in load_json(VECTORS_FILE):
+            yield vec_doc["section_id"], vec_doc["law_id"], vec_doc["vector"]
+
+def iter_duplicate_sections():
+    """Stream (section_id, law_id, canonical section_id) for every near-duplicate section"""
+    if db.db is not None:
+        for sec in db.sections.find({"duplicate_of": {"$ne": None}}, {"law_id": 1, "duplicate_of": 1}):
+            yield str(sec["_id"]), sec["law_id"], sec["duplicate_of"]
+    else:
+        for sec in load_json(SECTIONS_FILE):
+            if sec.get("duplicate_of"):
+                yield sec["id"], sec["law_id"], sec["duplicate_of"]
+
+def iter_simhashes():
+    """Stream (section_id, simhash hex) for canonical sections"""
+    if db.db is not None:
+        query = {"simhash": {"$ne": None}, "duplicate_of": None}
+        for sec in db.sections.find(query, {"simhash": 1}):
+            yield str(sec["_id"]), sec["simhash"]
+    else:
+        for sec in load_json(SECTIONS_FILE):
+            if sec.get("simhash") and not sec.get("duplicate_of"):
+                yield sec["id"], sec["simhash"]
+
+def get_vectors_by_section_ids(section_ids: List[str], vectors_data=None) -> Dict[str, List[float]]:
+    """section id -> stored vector (duplicates have none)"""
+    if not section_ids:
+        return {}
+    if db.db is not None:
+        found = db.vectors.find({"section_id": {"$in": section_ids}}, {"section_id": 1, "vector": 1})
+        return {vec_doc["section_id"]: vec_doc["vector"] for vec_doc in found}
+    wanted = set(section_ids)
+    if vectors_data is None:
+        vectors_data = load_json(VECTORS_FILE)
+    return {vec_doc["section_id"]: vec_doc["vector"] for vec_doc in vectors_data if vec_doc["section_id"] in wanted}
+
+def dedup_stats() -> Dict[str, int]:
+    """Near-duplicate sections and the embeddings they did not need"""
+    if db.db is not None:
+        duplicates = db.sections.count_documents({"duplicate_of": {"$ne": None}})
+    else:
+        duplicates = sum(1 for _ in iter_duplicate_sections())
+    return {
+        "duplicate_sections": duplicates,
+        "embeddings_saved": duplicates,
+        "vector_bytes_saved": duplicates * VECTOR_SIZE * 4
+    }
+
+def iter_autocomplete_sources():
+    """Stream (law_id, title, sections) with the fields autocomplete indexes"""
+    if db.db is not None:
+        headings: Dict[str, List[Dict[str, Any]]] = {}
+        for sec in db.sections.find({}, {"law_id": 1, "section_number": 1}):
+            headings.setdefault(sec["law_id"], []).append(sec)
+        for law in db.laws.find({}, {"title": 1}):
+            law_id = str(law["_id"])
+            yield law_id, law.get("title", ""), headings.get(law_id, [])
+    else:
+        headings = {}
+        for sec in load_json(SECTIONS_FILE):
+            headings.setdefault(sec["law_id"], []).append(sec)
+        for law in load_json(LAWS_FILE):
+            yield law["id"], law.get("title", ""), headings.get(law["id"], [])
+
+def frequent_queries(min_count: int, limit: int) -> List[tuple]:
+    """(query, times searched) for logged queries searched at least min_count times"""
+    if db.db is None:
+        # Queries are only logged with MongoDB
+        return []
+    pipeline = [
+        {"$group": {"_id": {"$toLower": "$query"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gte": min_count}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    return [(doc["_id"], doc["count"]) for doc in db.queries.aggregate(pipeline)]
+
+def law_metadata(law: Dict[str, Any]) -> Dict[str, Any]:
+    """Law fields copied onto every section row of the vector index"""
+    return {"category": law.get("category"), "jurisdiction": law.get("jurisdiction"), "year": law.get("year")}
+
+def get_law_metadata() -> Dict[str, Dict[str, Any]]:
+    """law id -> filterable metadata for every law"""
+    if db.db is not None:
+        found = db.laws.find({}, {"category": 1, "jurisdiction": 1, "year": 1})
+        return {str(law["_id"]): law_metadata(law) for law in found}
+    return {law["id"]: law_metadata(law) for law in load_json(LAWS_FILE)}
+
+def find_law_ids(category: Optional[str] = None, jurisdiction: Optional[str] = None,
+                 year_from: Optional[int] = None, year_to: Optional[int] = None,
+                 limit: Optional[int] = None) -> Optional[List[str]]:
+    """Ids of laws matching every given metadata filter (None when more than `limit` match)"""
+    if db.db is not None:
+        query: Dict[str, Any] = {}
+        if category:
+            query["category"] = category
+        if jurisdiction:
+            query["jurisdiction"] = jurisdiction
+        if year_from is not None or year_to is not None:
+            query["year"] = {}
+            if year_from is not None:
+                query["year"]["$gte"] = year_from
+            if year_to is not None:
+                query["year"]["$lte"] = year_to
+        cursor = db.laws.find(query, {"_id": 1})
+        if limit is not None:
+            cursor = cursor.limit(limit + 1)
+        law_ids = [str(law["_id"]) for law in cursor]
+    else:
+        law_ids = [law["id"] for law in load_json(LAWS_FILE) if law_matches(law, category, jurisdiction, year_from, year_to)]
+    if limit is not None and len(law_ids) > limit:
+        return None
+    return law_ids
+
+def law_matches(law: Optional[Dict[str, Any]], category: Optional[str] = None, jurisdiction: Optional[str] = None,
+                year_from: Optional[int] = None, year_to: Optional[int] = None) -> bool:
+    if not law:
+        return not (category or jurisdiction or year_from is not None or year_to is not None)
+    if category and law.get("category") != category:
+        return False
+    if jurisdiction and law.get("jurisdiction") != jurisdiction:
+        return False
+    if year_from is not None and (law.get("year") or 0) < year_from:
+        return False
+    if year_to is not None and (law.get("year") or 0) > year_to:
+        return False
+    return True
+
+def get_sections_by_ids(section_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Batch hydration: section id -> section (one query instead of one per hit)"""
+    if not section_ids:
+        return {}
+    if db.db is not None:
+        found = db.sections.find({"_id": {"$in": [ObjectId(i) for i in section_ids]}})
+        return {str(sec["_id"]): sec for sec in found}
+    wanted = set(section_ids)
+    return {sec["id"]: sec for sec in load_json(SECTIONS_FILE) if sec["id"] in wanted}
+
+def get_laws_by_ids(law_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not law_ids:
+        return {}
+    if db.db is not None:
+        found = db.laws.find({"_id": {"$in": [ObjectId(i) for i in set(law_ids)]}}, {"full_text": 0})
+        return {str(law["_id"]): law for law in found}
+    wanted = set(law_ids)
+    return {law["id"]: law for law in load_json(LAWS_FILE) if law["id"] in wanted}
+
+def get_summaries(keys: List[str]) -> Dict[str, str]:
+    """Cached summaries by key (chunk content hash or per-law final key)"""
+    if not keys:
+        return {}
+    if db.db is not None:
+        return {doc["key"]: doc["summary"] for doc in db.summaries.find({"key": {"$in": keys}})}
+    cached = {}
+    if os.path.exists(SUMMARIES_FILE):
+        with open(SUMMARIES_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    return {key: cached[key]["summary"] for key in keys if key in cached}
+
+def save_summaries(entries: Dict[str, str], law_id: str, level: int):
+    if not entries:
+        return
+    if db.db is not None:
+        db.summaries.bulk_write([
+            UpdateOne({"key": key}, {"$set": {
+                "key": key, "law_id": law_id, "level": level, "summary": summary, "created_at": datetime.utcnow()
+            }}, upsert=True)
+            for key, summary in entries.items()
+        ], ordered=False)
+        return
+    cached = {}
+    if os.path.exists(SUMMARIES_FILE):
+        with open(SUMMARIES_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    for key, summary in entries.items():
+        cached[key] = {"law_id": law_id, "level": level, "summary": summary, "created_at": datetime.utcnow().isoformat()}
+    save_json(SUMMARIES_FILE, cached)
+
+def delete_law_summaries(law_ids: List[str]):
+    """Drop the cached whole-document summaries ("law:{id}:...") of deleted laws
+    (chunk summaries are keyed by content and may be shared with other laws)"""
+    prefixes = tuple(f"law:{law_id}:" for law_id in law_ids)
+    if not prefixes:
+        return
+    if db.db is not None:
+        db.summaries.delete_many({"key": {"$regex": "^law:(" + "|".join(re.escape(i) for i in law_ids) + "):"}})
+        return
+    if not os.path.exists(SUMMARIES_FILE):
+        return
+    with open(SUMMARIES_FILE, 'r', encoding='utf-8') as f:
+        cached = json.load(f)
+    remaining = {key: entry for key, entry in cached.items() if not key.startswith(prefixes)}
+    if len(remaining) != len(cached):
+        save_json(SUMMARIES_FILE, remaining)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+from typing import List, Dict, Any, Tuple
+from .nlp import query_summary, content_hash
+from .metrics import timed
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Input size per summarization call (the model truncates long inputs)
+SUMMARY_CHUNK_CHARS = 3000
+# Average sections per chunk; boundaries are placed by section id
+SECTIONS_PER_CHUNK = 4
+MAX_CONCURRENT_SUMMARIES = 4
+MAX_LEVELS = 6
+
+def _closes_chunk(section: Dict[str, Any]) -> bool:
+    """Whether a chunk ends after this section: decided by its id, never by lengths"""
+    key = str(section.get("id") or section.get("section_number") or "")
+    return int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % SECTIONS_PER_CHUNK == 0
+
+def chunk_sections(sections: List[Dict[str, Any]], max_chars: int = SUMMARY_CHUNK_CHARS) -> List[str]:
+    """Group consecutive sections into chunks of at most max_chars (long sections are split).
+
+    A chunk closes after a section whose id hashes to a boundary (about one in
+    SECTIONS_PER_CHUNK), or early when the next section does not fit. Section
+    ids survive amendments, so an amendment that touches one section only
+    changes the hash of the chunk containing it; if it overflows that chunk,
+    only the chunks up to the next boundary change.
+    """
+    chunks, current = [], ""
+    for section in sections:
+        text = f"{section.get('title', '')}\n{section.get('content', '')}".strip()
+        pieces = [text[i:i + max_chars] for i in range(0, len(text), max_chars)] or [""]
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+        if current and _closes_chunk(section):
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+def group_texts(texts: List[str], max_chars: int = SUMMARY_CHUNK_CHARS) -> List[str]:
+    """Join partial summaries into reduce inputs of at most max_chars"""
+    groups, current = [], ""
+    for text in texts:
+        if current and len(current) + len(text) + 1 > max_chars:
+            groups.append(current)
+            current = ""
+        current = f"{current}\n{text}" if current else text
+    if current:
+        groups.append(current)
+    return groups
+
+async def summarize_level(texts: List[str], law_id: str, level: int, semaphore: asyncio.Semaphore) -> Tuple[List[str], int, int]:
+    """Summarize texts concurrently, reusing cached summaries. Returns (summaries, cache hits, failures)."""
+    keys = [content_hash(text) for text in texts]
+    cached = storage.get_summaries(list(set(keys)))
+    fresh: Dict[str, str] = {}
+    failures = 0
+
+    async def summarize_one(key: str, text: str) -> str:
+        nonlocal failures
+        if key in cached:
+            return cached[key]
+        async with semaphore:
+            summary = await query_summary(text)
+        if summary is None:
+            # Not cached: a later request should retry the model
+            failures += 1
+            return text[:200] + "..."
+        fresh[key] = summary
+        return summary
+
+    summaries = await asyncio.gather(*(summarize_one(key, text) for key, text in zip(keys, texts)))
+    storage.save_summaries(fresh, law_id, level)
+    return list(summaries), sum(1 for key in keys if key in cached), failures
+
+async def summarize_long_document(law_id: str, sections: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Map-reduce summary: summarize section chunks, then summarize the summaries until one remains"""
+    chunks = chunk_sections(sections)
+    if not chunks:
+        return {"summary": "", "chunks": 0, "cached_chunks": 0, "levels": 0, "cached": False}
+
+    # The final summary is keyed by the law and the hashes of all its chunks
+    final_key = "law:{}:{}".format(law_id, hashlib.sha256("".join(content_hash(c) for c in chunks).encode()).hexdigest())
+    cached_final = storage.get_summaries([final_key])
+    if final_key in cached_final:
+        return {"summary": cached_final[final_key], "chunks": len(chunks), "cached_chunks": len(chunks), "levels": 0, "cached": True}
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+    with timed("summarize_map"):
+        partials, cached_chunks, failures = await summarize_level(chunks, law_id, 0, semaphore)
+
+    levels = 1
+    with timed("summarize_reduce"):
+        while len(partials) > 1 and levels < MAX_LEVELS:
+            partials, _, level_failures = await summarize_level(group_texts(partials), law_id, levels, semaphore)
+            failures += level_failures
+            levels += 1
+    summary = partials[0] if len(partials) == 1 else "\n".join(partials)
+
+    if not failures:
+        storage.save_summaries({final_key: summary}, law_id, levels)
+    return {"summary": summary, "chunks": len(chunks), "cached_chunks": cached_chunks, "levels": levels, "cached": False}
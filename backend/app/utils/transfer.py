@@ -0,0 +1,286 @@
+"""Corpus export/import as NDJSON.
+
+One JSON object per line: a header, every law, every section, every vector,
+then a footer with the record counts. Lines are {"type": ..., "data": ...}.
+Records are streamed from and to MongoDB in batches, so memory stays flat
+however large the corpus (file-based storage holds its JSON files in
+memory, as it always does). Imported records get fresh ids in the target
+store, so a corpus can be imported next to existing documents.
+"""
+import json
+import gzip
+import zlib
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, Dict, Any, Optional, List, BinaryIO
+
+from bson import ObjectId
+from .. import database as db
+from .nlp import VECTOR_SIZE
+from . import storage, vector_index
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+RECORD_TYPES = ("law", "section", "vector")
+BATCH_SIZE = 1000
+# Bytes per chunk of the streamed export
+CHUNK_BYTES = 64 * 1024
+# Law fields kept only in MongoDB (file-based laws are listed whole)
+MONGO_ONLY_LAW_FIELDS = ("full_text", "text_preview")
+DATE_FIELDS = ("created_at", "updated_at")
+
+class TransferError(ValueError):
+    """The stream is not a complete, compatible export"""
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _line(record_type: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"type": record_type, "data": data}, ensure_ascii=False, default=_default) + "\n"
+
+def _iter_store():
+    """(type, record) for every law, section and vector, ids as strings"""
+    if db.db is not None:
+        for collection, record_type in ((db.laws, "law"), (db.sections, "section")):
+            for record in collection.find({}, batch_size=BATCH_SIZE):
+                record["id"] = str(record.pop("_id"))
+                yield record_type, record
+        fields = {"_id": 0, "section_id": 1, "law_id": 1, "vector": 1}
+        for record in db.vectors.find({}, fields, batch_size=BATCH_SIZE):
+            yield "vector", record
+    else:
+        for path, record_type in ((storage.LAWS_FILE, "law"), (storage.SECTIONS_FILE, "section")):
+            for record in storage.load_json(path):
+                yield record_type, record
+        for record in storage.load_json(storage.VECTORS_FILE):
+            yield "vector", {"section_id": record["section_id"], "law_id": record["law_id"], "vector": record["vector"]}
+
+def export_lines() -> Iterator[str]:
+    """The whole corpus as NDJSON lines"""
+    yield _line("header", {
+        "format": FORMAT_VERSION,
+        "vector_size": VECTOR_SIZE,
+        "source": "mongodb" if db.db is not None else "files",
+        "exported_at": datetime.utcnow().isoformat()
+    })
+    counts = {record_type: 0 for record_type in RECORD_TYPES}
+    for record_type, record in _iter_store():
+        counts[record_type] += 1
+        yield _line(record_type, record)
+    yield _line("footer", {"counts": counts})
+
+def encode_chunks(lines: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """Join lines into chunks of about CHUNK_BYTES, gzip-compressed on the fly if asked"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+def decode_lines(stream: BinaryIO) -> Iterator[str]:
+    """NDJSON lines from a binary stream, gunzipped when it starts with the gzip magic"""
+    compressed = stream.read(2) == b"\x1f\x8b"
+    stream.seek(0)
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    for raw in stream:
+        if raw.strip():
+            yield raw.decode("utf-8")
+
+class Importer:
+    """Writes imported records to the active store in batches, assigning new ids"""
+
+    def __init__(self):
+        self.law_ids: Dict[str, str] = {}
+        self.section_ids: Dict[str, str] = {}
+        self.seen_sections = set()
+        self.written = {record_type: 0 for record_type in RECORD_TYPES}
+        self.skipped = {record_type: 0 for record_type in RECORD_TYPES}
+        if db.db is not None:
+            self.batches: Dict[str, List[Dict[str, Any]]] = {record_type: [] for record_type in RECORD_TYPES}
+            self.collections = {"law": db.laws, "section": db.sections, "vector": db.vectors}
+        else:
+            self.data = {
+                "law": storage.load_json(storage.LAWS_FILE),
+                "section": storage.load_json(storage.SECTIONS_FILE),
+                "vector": storage.load_json(storage.VECTORS_FILE)
+            }
+            self.seq = {record_type: storage.next_id(self.data[record_type]) for record_type in RECORD_TYPES}
+
+    def new_id(self, record_type: str) -> str:
+        if db.db is not None:
+            return str(ObjectId())
+        value = str(self.seq[record_type])
+        self.seq[record_type] += 1
+        return value
+
+    def section_id(self, old_id: str) -> str:
+        """New id for an exported section id (duplicates may reference a section exported after them)"""
+        if old_id not in self.section_ids:
+            self.section_ids[old_id] = self.new_id("section")
+        return self.section_ids[old_id]
+
+    def add(self, record_type: str, record: Dict[str, Any]):
+        record = dict(record)
+        record.pop("_id", None)
+        if record_type == "law":
+            old_id = str(record.pop("id"))
+            record["id"] = self.law_ids[old_id] = self.new_id("law")
+            if db.db is None:
+                for field in MONGO_ONLY_LAW_FIELDS:
+                    record.pop(field, None)
+        else:
+            law_id = self.law_ids.get(str(record.get("law_id")))
+            if law_id is None:
+                # Its law was deleted while the export was running
+                self.skipped[record_type] += 1
+                return
+            record["law_id"] = law_id
+            if record_type == "section":
+                old_id = str(record.pop("id"))
+                record["id"] = self.section_id(old_id)
+                self.seen_sections.add(old_id)
+                if record.get("duplicate_of"):
+                    record["duplicate_of"] = self.section_id(record["duplicate_of"])
+            else:
+                old_id = str(record["section_id"])
+                if old_id not in self.seen_sections:
+                    self.skipped[record_type] += 1
+                    return
+                record["section_id"] = self.section_ids[old_id]
+                if db.db is None:
+                    record = {"id": self.new_id("vector"), **record}
+
+        if db.db is not None:
+            if "id" in record:
+                record["_id"] = ObjectId(record.pop("id"))
+            for field in DATE_FIELDS:
+                if isinstance(record.get(field), str):
+                    record[field] = datetime.fromisoformat(record[field])
+            record.setdefault("created_at", datetime.utcnow())
+            self.batches[record_type].append(record)
+            if len(self.batches[record_type]) >= BATCH_SIZE:
+                self.flush(record_type)
+        else:
+            self.data[record_type].append(record)
+        self.written[record_type] += 1
+
+    def flush(self, record_type: str):
+        batch = self.batches[record_type]
+        if batch:
+            self.collections[record_type].insert_many(batch, ordered=False)
+            self.batches[record_type] = []
+
+    def finish(self):
+        """Write what is left"""
+        if db.db is not None:
+            for record_type in RECORD_TYPES:
+                self.flush(record_type)
+        else:
+            storage.save_json(storage.LAWS_FILE, self.data["law"])
+            storage.save_json(storage.SECTIONS_FILE, self.data["section"])
+            storage.save_json(storage.VECTORS_FILE, self.data["vector"])
+
+    def count_stored(self) -> Dict[str, int]:
+        """Imported records now in the store, counted back by law id"""
+        law_ids = list(self.law_ids.values())
+        counts = {record_type: 0 for record_type in RECORD_TYPES}
+        if db.db is not None:
+            for i in range(0, len(law_ids), BATCH_SIZE):
+                chunk = law_ids[i:i + BATCH_SIZE]
+                counts["law"] += db.laws.count_documents({"_id": {"$in": [ObjectId(law_id) for law_id in chunk]}})
+                counts["section"] += db.sections.count_documents({"law_id": {"$in": chunk}})
+                counts["vector"] += db.vectors.count_documents({"law_id": {"$in": chunk}})
+            return counts
+        wanted = set(law_ids)
+        counts["law"] = sum(1 for law in storage.load_json(storage.LAWS_FILE) if law["id"] in wanted)
+        counts["section"] = sum(1 for sec in storage.load_json(storage.SECTIONS_FILE) if sec["law_id"] in wanted)
+        counts["vector"] = sum(1 for vec in storage.load_json(storage.VECTORS_FILE) if vec["law_id"] in wanted)
+        return counts
+
+    def dangling_duplicates(self) -> int:
+        """Duplicates whose canonical section was not in the export"""
+        return len(set(self.section_ids) - self.seen_sections)
+
+def import_lines(lines: Iterable[str]) -> Dict[str, Any]:
+    """Import an export into the active store and verify the counts.
+
+    Raises TransferError for an incompatible or truncated stream; nothing is
+    kept when the import fails.
+    """
+    lines = iter(lines)
+    # 1. Header: only vectors of the embedding size in use can be searched
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, json.JSONDecodeError):
+        raise TransferError("Not an NDJSON corpus export")
+    if header.get("type") != "header" or header["data"].get("format") != FORMAT_VERSION:
+        raise TransferError("Missing or unsupported export header")
+    if header["data"].get("vector_size") != VECTOR_SIZE:
+        raise TransferError(f"Export has {header['data'].get('vector_size')}-dimensional vectors, this store uses {VECTOR_SIZE}")
+
+    # 2. Records, written in batches
+    importer: Optional[Importer] = None
+    read = {record_type: 0 for record_type in RECORD_TYPES}
+    footer: Optional[Dict[str, Any]] = None
+    try:
+        # A re-index must not switch the store halfway through the import
+        with storage.write_lock():
+            importer = Importer()
+            for number, line in enumerate(lines, start=2):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    raise TransferError(f"Line {number} is not valid JSON")
+                if footer is not None:
+                    raise TransferError(f"Line {number} follows the footer")
+                if entry.get("type") == "footer":
+                    footer = entry["data"]
+                    continue
+                if entry.get("type") not in RECORD_TYPES:
+                    raise TransferError(f"Line {number} has unknown record type {entry.get('type')!r}")
+                read[entry["type"]] += 1
+                importer.add(entry["type"], entry["data"])
+            importer.finish()
+
+            # 3. Verify: the stream is complete and every record written landed in the store
+            if footer is None:
+                raise TransferError("Export is truncated (no footer)")
+            if footer.get("counts") != read:
+                raise TransferError(f"Export is incomplete: footer lists {footer.get('counts')}, read {read}")
+            stored = importer.count_stored()
+            if stored != importer.written:
+                raise TransferError(f"Store holds {stored} imported records, expected {importer.written}")
+    except Exception:
+        # After the lock is released: delete_documents takes it itself
+        rolled_back = storage.delete_documents(list(importer.law_ids.values()) if importer else [], publish=False)
+        logger.error(f"Import failed, removed {rolled_back} partially imported laws")
+        raise
+
+    # 4. Refresh the derived indexes (SimHash, vector, autocomplete)
+    storage.bump_store_generation()
+    version = vector_index.rebuild()
+    return {
+        "imported": importer.written,
+        "skipped": importer.skipped,
+        "dangling_duplicates": importer.dangling_duplicates(),
+        "vector_index_version": version
+    }
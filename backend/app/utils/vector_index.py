@@ -0,0 +1,1001 @@
+import os
+import re
+import json
+import heapq
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import List, Tuple, Optional, Iterable, Dict, Any, Callable, ContextManager
+
+try:
+    import numpy as np
+except ImportError:  # optional: search falls back to the per-request vector scan
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: publishing is not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The index is sharded by jurisdiction. Each shard is a base snapshot
+# (data/vector_index/shards/<jurisdiction>/v000042/{vectors,section_ids,...}.npy)
+# plus the delta segments appended by later writes (.../s000043/, same layout,
+# with tombstones hiding the rows of lower layers they replace or delete).
+# Each published version is a manifest naming the layers of every shard
+# (data/vector_index/v000042/manifest.json); CURRENT names the live manifest
+# and is swapped atomically. A shard is compacted into a new base once its
+# segments grow large.
+INDEX_DIR = "data/vector_index"
+SHARDS_DIR = "shards"
+# Scratch space of full builds in progress
+BUILDS_DIR = os.path.join(INDEX_DIR, "builds")
+CURRENT_FILE = os.path.join(INDEX_DIR, "CURRENT")
+LOCK_FILE = os.path.join(INDEX_DIR, ".lock")
+KEEP_VERSIONS = 3
+COPY_CHUNK_ROWS = 65536
+# Rows buffered per shard before a full build spills them to disk
+SPILL_ROWS = 1024
+# A shard is compacted past this many segments, or once segment rows plus
+# hidden rows reach this fraction of all its rows
+MAX_SEGMENTS = 16
+COMPACT_FRACTION = 0.25
+# Without flock, scratch space of a build is reclaimed only after this long
+STALE_BUILD_SECONDS = 86400
+# Bumped when the snapshot layout changes; older snapshots are rebuilt at startup
+FORMAT_VERSION = 5
+# Unfiltered searches score shards on parallel threads once the index is this large
+PARALLEL_MIN_ROWS = 50000
+MAX_SEARCH_THREADS = 8
+
+# (section_id, law_id, vector)
+VectorRow = Tuple[str, str, List[float]]
+# law_id -> {"category": ..., "jurisdiction": ..., "year": ...}
+LawMetadata = Dict[str, Dict[str, Any]]
+# near-duplicate section_id -> canonical section_id whose vector it shares
+DuplicateMap = Dict[str, str]
+# (near-duplicate section_id, law_id, canonical section_id)
+DuplicateRow = Tuple[str, str, str]
+
+# Per-section metadata columns stored next to the vectors (jurisdiction is the shard)
+CODED_COLUMNS = ("category",)
+
+class VectorSnapshot:
+    """Read-only memory-mapped view of one shard layer (a base or a segment).
+
+    Rows are L2-normalized float32, so cosine similarity is a single
+    matrix-vector product. Every worker maps the same files and shares the
+    page cache instead of holding its own copy of the vectors.
+
+    Categories are stored as integer codes (one boolean bitmap per value is
+    built on first use) and years with a precomputed sort order, so metadata
+    filters select rows before any scoring happens.
+
+    Near-duplicate sections keep their own row (so filters stay exact) with
+    the canonical section's vector; "groups" holds the canonical id of every
+    row, letting searches collapse copies of the same text.
+
+    A segment also lists the rows of lower layers it hides: replaced or
+    deleted sections as (section_id, law_id) pairs, and whole laws.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = self._load("vectors")
+        self.section_ids = self._load("section_ids")
+        self.law_ids = self._load("law_ids")
+        self.groups = self._load("groups")
+        self.codes = {column: self._load(column) for column in CODED_COLUMNS}
+        self.years = self._load("years")
+        self.year_order = self._load("year_order")
+        self.years_sorted = self._load("years_sorted")
+        with open(os.path.join(self.path, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.format = meta.get("format", 1)
+        self.vocab = meta.get("vocab", {column: [] for column in CODED_COLUMNS})
+        self.removed_sections = [tuple(pair) for pair in meta.get("removed_sections", [])]
+        self.removed_laws = meta.get("removed_laws", [])
+        self._bitmaps: Dict[Tuple[str, str], Any] = {}
+        self._canonical_rows = None
+        self._law_index = None
+
+    def _load(self, name: str):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def bitmap(self, column: str, value: str):
+        """Boolean row mask for column == value (cached per snapshot)"""
+        key = (column, value)
+        if key not in self._bitmaps:
+            vocab = self.vocab.get(column, [])
+            if value in vocab:
+                self._bitmaps[key] = np.asarray(self.codes[column]) == vocab.index(value)
+            else:
+                self._bitmaps[key] = np.zeros(len(self), dtype=bool)
+        return self._bitmaps[key]
+
+    def year_range(self, year_from: Optional[int], year_to: Optional[int]):
+        """Boolean row mask for year_from <= year <= year_to via binary search on the sorted years"""
+        lo = 0 if year_from is None else int(np.searchsorted(self.years_sorted, year_from, side="left"))
+        hi = len(self) if year_to is None else int(np.searchsorted(self.years_sorted, year_to, side="right"))
+        mask = np.zeros(len(self), dtype=bool)
+        if hi > lo:
+            mask[self.year_order[lo:hi]] = True
+        return mask
+
+    def canonical_rows(self):
+        """Row numbers of sections that own their vector (cached per snapshot)"""
+        if self._canonical_rows is None:
+            self._canonical_rows = np.flatnonzero(np.asarray(self.groups) == np.asarray(self.section_ids))
+        return self._canonical_rows
+
+    def law_rows(self, law_ids: Iterable[str]):
+        """Row numbers of the given laws (the law index is built on first use)"""
+        if self._law_index is None:
+            uniques, inverse = np.unique(np.asarray(self.law_ids), return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.searchsorted(inverse[order], np.arange(len(uniques) + 1))
+            self._law_index = ({str(law_id): i for i, law_id in enumerate(uniques)}, order, bounds)
+        positions, order, bounds = self._law_index
+        parts = [order[bounds[i]:bounds[i + 1]] for i in (positions.get(law_id) for law_id in law_ids) if i is not None]
+        return np.concatenate(parts) if parts else np.arange(0)
+
+    def filter_rows(self, category: Optional[str] = None, year_from: Optional[int] = None, year_to: Optional[int] = None):
+        """Row numbers passing every filter, or None when no filter is set"""
+        mask = None
+        if category:
+            mask = self.bitmap("category", category).copy()
+        if year_from is not None or year_to is not None:
+            bits = self.year_range(year_from, year_to)
+            mask = bits if mask is None else mask & bits
+        return None if mask is None else np.flatnonzero(mask)
+
+    def search(self, query_vector: List[float], k: int, threshold: float = 0.0, collapse: bool = False,
+               with_groups: bool = False, filtered: bool = False, live=None, **filters) -> List[Tuple]:
+        """Top-k (section_id, law_id, cosine score[, group]) above threshold among rows passing the filters.
+
+        With collapse, near-duplicates of the same text count once: unfiltered
+        searches score canonical rows only, filtered ones (including a search
+        of this shard alone, filtered=True) keep the best row of each group.
+        live is a boolean row mask hiding rows replaced by a later segment.
+        """
+        if len(self) == 0 or len(query_vector) != self.dim:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        rows = self.filter_rows(**filters)
+        grouped = collapse and (rows is not None or filtered)
+        if rows is None and collapse and not filtered:
+            rows = self.canonical_rows()
+        if live is not None:
+            rows = np.flatnonzero(live) if rows is None else rows[live[rows]]
+        if rows is None:
+            rows = np.arange(len(self))
+            scores = self.vectors @ query
+        elif len(rows) == 0:
+            return []
+        else:
+            # Only the selected rows are read from the mapping
+            scores = self.vectors[rows] @ query
+        if grouped:
+            hits = self._top_groups(scores, rows, k, threshold)
+        else:
+            hits = self._top_k(scores, rows, k, threshold)
+        if with_groups:
+            return [(str(self.section_ids[row]), str(self.law_ids[row]), score, str(self.groups[row])) for row, score in hits]
+        return [(str(self.section_ids[row]), str(self.law_ids[row]), score) for row, score in hits]
+
+    def _ranked(self, scores, k: int):
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top])]
+
+    def _top_k(self, scores, rows, k: int, threshold: float) -> List[Tuple[int, float]]:
+        return [(rows[i], float(scores[i])) for i in self._ranked(scores, k) if scores[i] > threshold]
+
+    def _top_groups(self, scores, rows, k: int, threshold: float) -> List[Tuple[int, float]]:
+        """Best row of each of the top-k groups; widens the candidate pool until k groups are found"""
+        pool = k * 4
+        while True:
+            results, seen = [], set()
+            for i in self._ranked(scores, pool):
+                if scores[i] <= threshold:
+                    break
+                group = str(self.groups[rows[i]])
+                if group in seen:
+                    continue
+                seen.add(group)
+                results.append((rows[i], float(scores[i])))
+                if len(results) == k:
+                    return results
+            if pool >= len(scores):
+                return results
+            pool *= 4
+
+def _merge(hit_lists: List[List[Tuple]], k: int, collapse: bool, with_groups: bool = False) -> List[Tuple]:
+    """Merge best-first (section_id, law_id, score, group) lists; a near-duplicate group may span lists"""
+    results, seen = [], set()
+    for hit in heapq.merge(*hit_lists, key=lambda hit: -hit[2]):
+        if collapse:
+            if hit[3] in seen:
+                continue
+            seen.add(hit[3])
+        results.append(hit if with_groups else hit[:3])
+        if len(results) == k:
+            break
+    return results
+
+class LayeredShard:
+    """One shard of a published version: its base snapshot plus the delta
+    segments written since, with the rows each segment hides masked out of
+    the layers below it."""
+
+    def __init__(self, base: Optional[VectorSnapshot], segments: List[VectorSnapshot]):
+        self.base = base
+        self.segments = segments
+        self.layers = ([base] if base is not None else []) + segments
+        self.live = self._live_masks()
+        self.rows = sum(len(layer) for layer in self.layers)
+        self._len = sum(len(layer) if live is None else int(live.sum()) for layer, live in zip(self.layers, self.live))
+
+    def _live_masks(self) -> List[Any]:
+        masks: List[Any] = [None] * len(self.layers)
+        dead_laws: set = set()
+        dead_sections: Dict[str, set] = {}
+        for i in range(len(self.layers) - 1, -1, -1):
+            layer = self.layers[i]
+            if (dead_laws or dead_sections) and len(layer):
+                mask = np.ones(len(layer), dtype=bool)
+                mask[layer.law_rows(dead_laws)] = False
+                for law_id, section_ids in dead_sections.items():
+                    rows = layer.law_rows([law_id])
+                    if len(rows):
+                        mask[rows[np.isin(layer.section_ids[rows], list(section_ids))]] = False
+                masks[i] = None if mask.all() else mask
+            dead_laws.update(layer.removed_laws)
+            for section_id, law_id in layer.removed_sections:
+                dead_sections.setdefault(law_id, set()).add(section_id)
+        return masks
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def dim(self) -> int:
+        return next((layer.dim for layer in self.layers if len(layer)), self.layers[0].dim if self.layers else 0)
+
+    def rows_of_law(self, law_id: str) -> List[Tuple[VectorSnapshot, Any]]:
+        """(layer, live row numbers) holding rows of a law"""
+        found = []
+        for layer, live in zip(self.layers, self.live):
+            rows = layer.law_rows([law_id]) if len(layer) else np.arange(0)
+            if live is not None and len(rows):
+                rows = rows[live[rows]]
+            if len(rows):
+                found.append((layer, rows))
+        return found
+
+    def needs_compaction(self) -> bool:
+        segment_rows = sum(len(segment) for segment in self.segments)
+        hidden = self.rows - len(self)
+        return len(self.segments) > MAX_SEGMENTS or segment_rows + hidden > COMPACT_FRACTION * max(self.rows, 1)
+
+    def search(self, query_vector: List[float], k: int, threshold: float = 0.0, collapse: bool = False,
+               with_groups: bool = False, filtered: bool = False, **filters) -> List[Tuple]:
+        if len(self.layers) == 1 and self.live[0] is None:
+            return self.layers[0].search(query_vector, k, threshold, collapse, with_groups, filtered, **filters)
+        hit_lists = [
+            layer.search(query_vector, k, threshold, collapse, True, filtered, live=live, **filters)
+            for layer, live in zip(self.layers, self.live) if len(layer)
+        ]
+        return _merge(hit_lists, k, collapse, with_groups)
+
+class ShardedSnapshot:
+    """One published index version: a LayeredShard per jurisdiction.
+
+    A search filtered to a jurisdiction reads only that shard; an unfiltered
+    one scores every shard (in parallel when the index is large) and merges
+    their top-k lists.
+    """
+
+    def __init__(self, version: int, manifest: Dict[str, Any], shards: Dict[str, LayeredShard]):
+        self.version = version
+        self.format = manifest.get("format", 1)
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards.values())
+
+    def search(self, query_vector: List[float], k: int, threshold: float = 0.0, collapse: bool = False,
+               category: Optional[str] = None, jurisdiction: Optional[str] = None,
+               year_from: Optional[int] = None, year_to: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        filters = {"category": category, "year_from": year_from, "year_to": year_to}
+        if jurisdiction:
+            shard = self.shards.get(jurisdiction)
+            if shard is None:
+                return []
+            # The canonical copy of a duplicate may live in another shard
+            return shard.search(query_vector, k, threshold, collapse, filtered=True, **filters)
+
+        shards = [shard for shard in self.shards.values() if len(shard)]
+
+        def scan(shard):
+            return shard.search(query_vector, k, threshold, collapse, with_groups=True, **filters)
+
+        if len(shards) > 1 and len(self) >= PARALLEL_MIN_ROWS:
+            # numpy releases the GIL in the matrix-vector products
+            shard_hits = list(_search_pool().map(scan, shards))
+        else:
+            shard_hits = [scan(shard) for shard in shards]
+
+        return _merge(shard_hits, k, collapse)
+
+_snapshot: Optional[ShardedSnapshot] = None
+_current_stat: Optional[Tuple[int, int, str]] = None
+_snapshot_lock = threading.Lock()
+# Layer path -> mapped snapshot, reused by later versions that did not change it
+_shard_cache: Dict[str, VectorSnapshot] = {}
+# Layer paths of a shard -> its layered view
+_view_cache: Dict[Tuple[str, ...], LayeredShard] = {}
+_pool: Optional[ThreadPoolExecutor] = None
+
+def _search_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _snapshot_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=min(MAX_SEARCH_THREADS, os.cpu_count() or 1),
+                                           thread_name_prefix="shard-search")
+    return _pool
+
+def available() -> bool:
+    return np is not None
+
+def version_dir(version: int) -> str:
+    return os.path.join(INDEX_DIR, f"v{version:06d}")
+
+def shard_dir(jurisdiction: str, version: int, kind: str = "v") -> str:
+    """Relative path of a shard base ("v") or segment ("s") written by a version
+    (readable name plus a hash so distinct jurisdictions never collide)"""
+    slug = re.sub(r"[^a-z0-9]+", "-", jurisdiction.lower()).strip("-")[:40] or "none"
+    digest = hashlib.md5(jurisdiction.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(SHARDS_DIR, f"{slug}-{digest}", f"{kind}{version:06d}")
+
+def read_current_version() -> Optional[int]:
+    try:
+        with open(CURRENT_FILE, 'r', encoding='utf-8') as f:
+            return int(f.read().strip().lstrip("v"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _store_identity() -> str:
+    from .storage import store_identity
+    return store_identity()
+
+def _store_generation() -> int:
+    from .storage import store_generation
+    return store_generation()
+
+def read_manifest(version: int) -> Optional[Dict[str, Any]]:
+    """Manifest of a version ({"format", "store", "shards": {jurisdiction: {"path", "segments"}}, "log"}),
+    None when missing, outdated or built from another store (its section ids would not resolve).
+
+    "log" lists the segments of recent publishes ({"version", "segments": {jurisdiction: path}})
+    that a full build in progress may still have to replay.
+    """
+    try:
+        with open(os.path.join(version_dir(version), "manifest.json"), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("format") != FORMAT_VERSION or manifest.get("store") != _store_identity():
+        return None
+    return manifest
+
+def _open_shard(path: str) -> VectorSnapshot:
+    shard = _shard_cache.get(path)
+    if shard is None:
+        shard = _shard_cache[path] = VectorSnapshot(os.path.join(INDEX_DIR, path))
+    return shard
+
+def _layer_paths(entry: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(([entry["path"]] if entry.get("path") else []) + entry.get("segments", []))
+
+def _open_entry(entry: Dict[str, Any]) -> LayeredShard:
+    paths = _layer_paths(entry)
+    view = _view_cache.get(paths)
+    if view is None:
+        base = _open_shard(entry["path"]) if entry.get("path") else None
+        view = _view_cache[paths] = LayeredShard(base, [_open_shard(path) for path in entry.get("segments", [])])
+    return view
+
+def _open_version(version: int) -> Optional[ShardedSnapshot]:
+    manifest = read_manifest(version)
+    if manifest is None:
+        return None
+    shards = {jurisdiction: _open_entry(entry) for jurisdiction, entry in manifest["shards"].items()}
+    # Layers no longer named by the live version are unmapped once their last search finishes
+    live = {_layer_paths(entry) for entry in manifest["shards"].values()}
+    for paths in [paths for paths in list(_view_cache) if paths not in live]:
+        _view_cache.pop(paths, None)
+    live_paths = {path for paths in live for path in paths}
+    for path in [path for path in list(_shard_cache) if path not in live_paths]:
+        _shard_cache.pop(path, None)
+    return ShardedSnapshot(version, manifest, shards)
+
+def get_snapshot() -> Optional[ShardedSnapshot]:
+    """Current snapshot, remapped when another process has published a new version"""
+    global _snapshot, _current_stat
+    if np is None:
+        return None
+    try:
+        st = os.stat(CURRENT_FILE)
+    except FileNotFoundError:
+        return None
+
+    # CURRENT is replaced (new inode) on every publish, so a stat is enough to detect a swap
+    stat_key = (st.st_ino, st.st_mtime_ns, _store_identity())
+    if stat_key != _current_stat:
+        with _snapshot_lock:
+            if stat_key != _current_stat:
+                version = read_current_version()
+                try:
+                    _snapshot = _open_version(version) if version is not None else None
+                except FileNotFoundError:
+                    _snapshot = None
+                if _snapshot is None and version is not None:
+                    logger.error(f"Vector index version {version} is missing, outdated or built from another store")
+                _current_stat = stat_key
+    return _snapshot
+
+def _normalize(rows):
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return rows / norms
+
+def _year(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _jurisdiction(laws: LawMetadata, law_id: str) -> str:
+    return laws.get(law_id, {}).get("jurisdiction") or ""
+
+def _write_shard(path: str, count: int, dim: int, id_width: int, vocab: Dict[str, List[str]], fill,
+                 tombstones: Optional[Dict[str, list]] = None) -> str:
+    """Create a shard layer directory; fill(columns) populates the memmapped columns"""
+    path = os.path.join(INDEX_DIR, path)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    def create(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    columns = {
+        "vectors": create("vectors", np.float32, (count, dim)),
+        "section_ids": create("section_ids", f"<U{id_width}", (count,)),
+        "law_ids": create("law_ids", f"<U{id_width}", (count,)),
+        "groups": create("groups", f"<U{id_width}", (count,)),
+        "years": create("years", np.int32, (count,)),
+    }
+    for column in CODED_COLUMNS:
+        columns[column] = create(column, np.int32, (count,))
+    fill(columns)
+
+    # Sorted-array index for year range filters
+    year_order = np.argsort(columns["years"], kind="stable")
+    create("year_order", np.int64, (count,))[:] = year_order
+    create("years_sorted", np.int32, (count,))[:] = columns["years"][year_order]
+    for array in columns.values():
+        array.flush()
+    with open(os.path.join(path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format": FORMAT_VERSION, "count": count, "dim": dim,
+            "vocab": vocab, "created_at": datetime.utcnow().isoformat(), **(tombstones or {})
+        }, f)
+    return path
+
+def _write_manifest(version: int, shards: Dict[str, Dict[str, Any]], log: List[Dict[str, Any]]):
+    path = version_dir(version)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    with open(os.path.join(path, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": version, "format": FORMAT_VERSION, "store": _store_identity(), "shards": shards,
+            "log": log, "created_at": datetime.utcnow().isoformat()
+        }, f)
+
+def _swap_current(version: int):
+    tmp_path = f"{CURRENT_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(f"v{version:06d}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_FILE)
+
+    # Workers still mapping an old version keep their pages until they remap
+    versions = sorted(int(name[1:]) for name in os.listdir(INDEX_DIR) if name.startswith("v") and name[1:].isdigit())
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(version_dir(old), ignore_errors=True)
+
+    # Shard layers not named by any kept version (or by its log)
+    referenced = set()
+    for kept in versions[-KEEP_VERSIONS:]:
+        manifest = read_manifest(kept)
+        if manifest is not None:
+            for entry in manifest["shards"].values():
+                referenced.update(os.path.normpath(path) for path in _layer_paths(entry))
+            for change in manifest.get("log", []):
+                referenced.update(os.path.normpath(path) for path in change["segments"].values())
+    shards_root = os.path.join(INDEX_DIR, SHARDS_DIR)
+    for name in os.listdir(shards_root) if os.path.isdir(shards_root) else []:
+        for snapshot_name in os.listdir(os.path.join(shards_root, name)):
+            path = os.path.join(SHARDS_DIR, name, snapshot_name)
+            if path not in referenced:
+                shutil.rmtree(os.path.join(INDEX_DIR, path), ignore_errors=True)
+
+@contextmanager
+def _publish_lock():
+    """Serialize publishers across worker processes"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(LOCK_FILE, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+@contextmanager
+def _build_slot():
+    """Scratch directory of a full build and the version current when it began.
+
+    While it is held, publishers keep every change published after that
+    version in the manifest log, for the build to replay.
+    """
+    os.makedirs(BUILDS_DIR, exist_ok=True)
+    with _publish_lock():
+        started = read_current_version() or 0
+        scratch = tempfile.mkdtemp(prefix=f"v{started:06d}-", dir=BUILDS_DIR)
+        marker = open(os.path.join(scratch, ".lock"), 'w')
+        if fcntl is not None:
+            fcntl.flock(marker, fcntl.LOCK_EX)
+    try:
+        yield scratch, started
+    finally:
+        marker.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def _build_running(path: str) -> bool:
+    if fcntl is None:
+        return time.time() - os.path.getmtime(path) < STALE_BUILD_SECONDS
+    try:
+        with open(os.path.join(path, ".lock"), 'a') as marker:
+            fcntl.flock(marker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(marker, fcntl.LOCK_UN)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+def _live_builds(exclude: Optional[str] = None) -> List[int]:
+    """Start versions of full builds in progress; scratch space of builds that died is removed"""
+    started = []
+    for name in os.listdir(BUILDS_DIR) if os.path.isdir(BUILDS_DIR) else []:
+        path = os.path.join(BUILDS_DIR, name)
+        if path == exclude:
+            continue
+        if not _build_running(path):
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        try:
+            started.append(int(name[1:7]))
+        except ValueError:
+            continue
+    return started
+
+def _trim_log(log: List[Dict[str, Any]], exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Log entries some build in progress may have missed"""
+    started = _live_builds(exclude)
+    if not started:
+        return []
+    return [change for change in log if change["version"] > min(started)]
+
+def _current_log() -> List[Dict[str, Any]]:
+    version = read_current_version()
+    manifest = read_manifest(version) if version is not None else None
+    return manifest.get("log", []) if manifest is not None else []
+
+def _encode(vocab: Dict[str, List[str]], column: str, value: Any) -> int:
+    """Code for a metadata value, extending the vocabulary when it is new"""
+    values = vocab[column]
+    value = value or ""
+    if value not in values:
+        values.append(value)
+    return values.index(value)
+
+def _fill_metadata(columns, at: slice, section_ids: List[str], law_ids: List[str], groups: List[str],
+                   laws: LawMetadata, vocab: Dict[str, List[str]]):
+    columns["section_ids"][at] = section_ids
+    columns["law_ids"][at] = law_ids
+    columns["groups"][at] = groups
+    metadata = [laws.get(l, {}) for l in law_ids]
+    columns["years"][at] = [_year(m.get("year")) for m in metadata]
+    for column in CODED_COLUMNS:
+        columns[column][at] = [_encode(vocab, column, m.get(column)) for m in metadata]
+
+def _fill_added(columns, offset: int, rows: List[VectorRow], laws: LawMetadata, vocab: Dict[str, List[str]],
+                duplicates: DuplicateMap):
+    for start in range(0, len(rows), COPY_CHUNK_ROWS):
+        chunk = rows[start:start + COPY_CHUNK_ROWS]
+        at = slice(offset + start, offset + start + len(chunk))
+        columns["vectors"][at] = _normalize(np.asarray([v for _, _, v in chunk], dtype=np.float32))
+        _fill_metadata(columns, at, [s for s, _, _ in chunk], [l for _, l, _ in chunk],
+                       [duplicates.get(s, s) for s, _, _ in chunk], laws, vocab)
+
+class _ShardBuilder:
+    """Rows of one shard during a full build.
+
+    Vectors are normalized and spilled to a scratch file SPILL_ROWS at a
+    time, so a rebuild holds ids but never the whole set of vectors.
+    Near-duplicates are written last with a copy of their canonical's row.
+    """
+
+    def __init__(self, spill_path: str, dim: int):
+        self.spill_path = spill_path
+        self.spill = open(spill_path, 'wb')
+        self.buffer = np.empty((SPILL_ROWS, dim), dtype=np.float32)
+        self.pending = 0
+        self.dim = dim
+        self.section_ids: List[str] = []
+        self.law_ids: List[str] = []
+        # (section_id, law_id, canonical section_id, builder holding the canonical, its row there)
+        self.duplicates: List[Tuple[str, str, str, "_ShardBuilder", int]] = []
+        self.vectors = None
+
+    def add(self, section_id: str, law_id: str, vector) -> int:
+        self.buffer[self.pending] = vector
+        self.pending += 1
+        if self.pending == SPILL_ROWS:
+            self._spill()
+        self.section_ids.append(section_id)
+        self.law_ids.append(law_id)
+        return len(self.section_ids) - 1
+
+    def _spill(self):
+        if self.pending:
+            _normalize(self.buffer[:self.pending]).tofile(self.spill)
+            self.pending = 0
+
+    def close(self):
+        """Finish spilling and map the spilled vectors for copying"""
+        self._spill()
+        self.spill.close()
+        self.buffer = None
+        if self.section_ids:
+            self.vectors = np.memmap(self.spill_path, dtype=np.float32, mode="r", shape=(len(self.section_ids), self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.section_ids) + len(self.duplicates)
+
+    def write(self, path: str, laws: LawMetadata):
+        canonical = len(self.section_ids)
+        ids = self.section_ids + self.law_ids + [d[0] for d in self.duplicates] + [d[1] for d in self.duplicates]
+        id_width = max((len(i) for i in ids), default=1)
+        vocab = {column: [] for column in CODED_COLUMNS}
+
+        def fill(columns):
+            for start in range(0, canonical, COPY_CHUNK_ROWS):
+                at = slice(start, min(start + COPY_CHUNK_ROWS, canonical))
+                columns["vectors"][at] = self.vectors[at]
+                _fill_metadata(columns, at, self.section_ids[at], self.law_ids[at], self.section_ids[at], laws, vocab)
+            for start in range(0, len(self.duplicates), COPY_CHUNK_ROWS):
+                chunk = self.duplicates[start:start + COPY_CHUNK_ROWS]
+                offset = canonical + start
+                for i, (_, _, _, source, row) in enumerate(chunk):
+                    columns["vectors"][offset + i] = source.vectors[row]
+                _fill_metadata(columns, slice(offset, offset + len(chunk)), [d[0] for d in chunk],
+                               [d[1] for d in chunk], [d[2] for d in chunk], laws, vocab)
+
+        _write_shard(path, len(self), self.dim, id_width, vocab, fill)
+
+def _build_shards(scratch: str, rows: Iterable[VectorRow], duplicate_rows: Iterable[DuplicateRow],
+                  laws: LawMetadata) -> Dict[str, str]:
+    """Write every shard from scratch into a build's scratch directory.
+
+    rows are streamed once; their dimension is that of the first row (rows of
+    another size, left by a replaced embedding model, are skipped). Returns
+    jurisdiction -> shard path (relative to INDEX_DIR).
+    """
+    builders: Dict[str, _ShardBuilder] = {}
+    # Canonical section id -> (builder, row) for its near-duplicates
+    located: Dict[str, Tuple[_ShardBuilder, int]] = {}
+    dim = None
+
+    def builder_for(jurisdiction: str) -> _ShardBuilder:
+        if jurisdiction not in builders:
+            builders[jurisdiction] = _ShardBuilder(os.path.join(scratch, f"{len(builders)}.f32"), dim)
+        return builders[jurisdiction]
+
+    try:
+        for section_id, law_id, vector in rows:
+            if dim is None:
+                dim = len(vector)
+            if len(vector) != dim:
+                continue
+            builder = builder_for(_jurisdiction(laws, law_id))
+            located[section_id] = (builder, builder.add(section_id, law_id, vector))
+        for builder in builders.values():
+            builder.close()
+        for section_id, law_id, canonical_id in duplicate_rows:
+            if canonical_id in located:
+                source, row = located[canonical_id]
+                builder_for(_jurisdiction(laws, law_id)).duplicates.append((section_id, law_id, canonical_id, source, row))
+
+        shards = {}
+        for i, (jurisdiction, builder) in enumerate(builders.items()):
+            if builder.vectors is None:
+                # Holds only duplicates of rows in other shards
+                builder.close()
+            path = os.path.relpath(os.path.join(scratch, f"shard-{i}"), INDEX_DIR)
+            builder.write(path, laws)
+            shards[jurisdiction] = path
+        return shards
+    finally:
+        for builder in builders.values():
+            if not builder.spill.closed:
+                builder.spill.close()
+            builder.vectors = None
+            if os.path.exists(builder.spill_path):
+                os.remove(builder.spill_path)
+
+def _build_from_store(scratch: str) -> Dict[str, str]:
+    """Full build streamed from the active store: every stored vector plus
+    one row per near-duplicate carrying its canonical's vector"""
+    from .storage import iter_vector_rows, iter_duplicate_sections, get_law_metadata
+    return _build_shards(scratch, iter_vector_rows(), iter_duplicate_sections(), get_law_metadata())
+
+def _missing_law_metadata(law_ids: Iterable[str]) -> LawMetadata:
+    from .storage import get_laws_by_ids, law_metadata
+    return {law_id: law_metadata(law) for law_id, law in get_laws_by_ids(list(law_ids)).items()}
+
+def rebuild(rows: Optional[Iterable[VectorRow]] = None, laws: Optional[LawMetadata] = None,
+            duplicate_rows: Optional[Iterable[DuplicateRow]] = None,
+            before_swap: Optional[Callable[[], None]] = None,
+            swap_lock: Optional[Callable[[], ContextManager]] = None) -> Optional[int]:
+    """Publish a full snapshot, streamed from the active store unless rows are given.
+
+    The shards are written without holding the publish lock; the lock is
+    only taken to move them into place and swap CURRENT. A build from the
+    store then replays the segments published while it ran, so concurrent
+    writes are kept. Given rows (the stored canonical vectors, with
+    duplicate_rows the near-duplicates sharing them) describe a store about
+    to replace the active one, so nothing is replayed: before_swap runs
+    under the publish lock once the new version is in place, so a caller
+    replacing the store (app.reindex) switches data and index together.
+    swap_lock is held around that final step and taken before the publish
+    lock, as store writers take theirs (see storage.write_lock).
+    """
+    swap_lock = swap_lock or nullcontext
+    if np is None:
+        if before_swap is not None:
+            with swap_lock():
+                before_swap()
+        return None
+    with _build_slot() as (scratch, started):
+        if rows is None:
+            built = _build_from_store(scratch)
+        else:
+            built = _build_shards(scratch, rows, duplicate_rows or (), laws or {})
+
+        with swap_lock(), _publish_lock():
+            version = (read_current_version() or 0) + 1
+            shards: Dict[str, Dict[str, Any]] = {}
+            for jurisdiction, built_path in built.items():
+                path = shard_dir(jurisdiction, version)
+                target = os.path.join(INDEX_DIR, path)
+                shutil.rmtree(target, ignore_errors=True)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(os.path.join(INDEX_DIR, built_path), target)
+                shards[jurisdiction] = {"path": path, "segments": []}
+            log = _current_log()
+            if rows is None:
+                for change in log:
+                    if change["version"] > started:
+                        for jurisdiction, segment in change["segments"].items():
+                            shards.setdefault(jurisdiction, {"path": None, "segments": []})["segments"].append(segment)
+            _write_manifest(version, shards, _trim_log(log, exclude=scratch))
+            if before_swap is not None:
+                before_swap()
+            _swap_current(version)
+    logger.info(f"Published vector index v{version} with {sum(len(_open_entry(entry)) for entry in shards.values())} sections")
+    return version
+
+def publish_changes(added: Iterable[VectorRow] = (), removed_sections: Iterable[Tuple[str, str]] = (),
+                    removed_law_ids: Iterable[str] = (), laws: Optional[LawMetadata] = None,
+                    duplicates: Optional[DuplicateMap] = None, generation: Optional[int] = None) -> Optional[int]:
+    """Publish a new version = current snapshot - removed rows + added rows.
+
+    Re-added section ids replace their old row; removed_sections are
+    (section_id, law_id) pairs. `laws` gives metadata for the added rows and
+    refreshes the existing rows of those laws (moving them to another shard
+    when their jurisdiction changed); `duplicates` names the canonical section
+    of added near-duplicate rows. Each touched shard gets one delta segment
+    with the new rows and tombstones for the rows they replace, so a publish
+    costs the size of the change rather than of the shard. Without a current
+    snapshot the index is rebuilt from the store, which already contains
+    the change. `generation` is the store generation the change was written
+    to: once app.reindex has switched the store since, the change is dropped
+    (its rows would not resolve, and the re-index repairs the law).
+    """
+    if np is None:
+        return None
+    added = list(added)
+    with _publish_lock():
+        if generation is not None and generation != _store_generation():
+            logger.info("Skipped publishing a change written before the store was re-indexed")
+            return None
+        version = read_current_version()
+        manifest = read_manifest(version) if version is not None else None
+        if manifest is not None:
+            return _publish_segments(version + 1, manifest, added, list(removed_sections), set(removed_law_ids),
+                                     dict(laws or {}), dict(duplicates or {}))
+    return rebuild()
+
+def _publish_segments(version: int, manifest: Dict[str, Any], added: List[VectorRow], removed_sections: List[Tuple[str, str]],
+                      removed_law_ids: set, laws: LawMetadata, duplicates: DuplicateMap) -> int:
+    views = {jurisdiction: _open_entry(entry) for jurisdiction, entry in manifest["shards"].items()}
+    dim = next((view.dim for view in views.values() if len(view)), max((len(v) for _, _, v in added), default=384))
+    # Rows re-added without metadata (promoted duplicates of another law) keep their law's shard
+    laws.update(_missing_law_metadata({l for _, l, _ in added if l not in laws}))
+
+    # Rows are found through their law: section id -> law id of every replaced or removed row
+    dropped: Dict[str, set] = {}
+    for section_id, law_id in removed_sections + [(s, l) for s, l, _ in added]:
+        dropped.setdefault(law_id, set()).add(section_id)
+    added_by_shard: Dict[str, List[VectorRow]] = {}
+    for row in added:
+        if len(row[2]) == dim:
+            added_by_shard.setdefault(_jurisdiction(laws, row[1]), []).append(row)
+
+    tombstones: Dict[str, Dict[str, list]] = {}
+    for jurisdiction, view in views.items():
+        hidden = {"removed_sections": [], "removed_laws": []}
+        for law_id in sorted(removed_law_ids):
+            if view.rows_of_law(law_id):
+                hidden["removed_laws"].append(law_id)
+        for law_id, section_ids in dropped.items():
+            if law_id not in removed_law_ids and view.rows_of_law(law_id):
+                hidden["removed_sections"].extend([section_id, law_id] for section_id in sorted(section_ids))
+
+        # Rows of a law whose metadata changed are re-added with it (in its new shard if the jurisdiction changed)
+        for law_id, metadata in laws.items():
+            found = view.rows_of_law(law_id) if law_id not in removed_law_ids else []
+            target = _jurisdiction(laws, law_id)
+            if not found or (target == jurisdiction and not _metadata_changed(found, metadata)):
+                continue
+            hidden["removed_laws"].append(law_id)
+            skip = dropped.get(law_id, set())
+            for layer, rows in found:
+                for row in rows:
+                    section_id, group = str(layer.section_ids[row]), str(layer.groups[row])
+                    if section_id in skip:
+                        continue
+                    added_by_shard.setdefault(target, []).append((section_id, law_id, layer.vectors[row]))
+                    if group != section_id:
+                        duplicates[section_id] = group
+        if hidden["removed_sections"] or hidden["removed_laws"]:
+            tombstones[jurisdiction] = hidden
+
+    shards = dict(manifest["shards"])
+    segments = {}
+    for jurisdiction in sorted(set(tombstones) | set(added_by_shard)):
+        entry = shards.get(jurisdiction, {"path": None, "segments": []})
+        path = shard_dir(jurisdiction, version, kind="s")
+        _write_segment(path, added_by_shard.get(jurisdiction, []), dim, laws, duplicates, tombstones.get(jurisdiction))
+        segments[jurisdiction] = path
+        entry = {"path": entry.get("path"), "segments": entry.get("segments", []) + [path]}
+        view = _open_entry(entry)
+        if view.needs_compaction():
+            base = shard_dir(jurisdiction, version)
+            _compact(base, view)
+            entry = {"path": base, "segments": []}
+        shards[jurisdiction] = entry
+
+    _write_manifest(version, shards, _trim_log(manifest.get("log", []) + [{"version": version, "segments": segments}]))
+    _swap_current(version)
+    logger.info(f"Published vector index v{version}: {len(added)} rows added to {len(segments)} shards")
+    return version
+
+def _metadata_changed(found: List[Tuple[VectorSnapshot, Any]], metadata: Dict[str, Any]) -> bool:
+    year = _year(metadata.get("year"))
+    for layer, rows in found:
+        if np.any(np.asarray(layer.years[rows]) != year):
+            return True
+        for column in CODED_COLUMNS:
+            vocab = layer.vocab.get(column, [])
+            if any(vocab[code] != (metadata.get(column) or "") for code in np.unique(np.asarray(layer.codes[column][rows]))):
+                return True
+    return False
+
+def _write_segment(path: str, rows: List[VectorRow], dim: int, laws: LawMetadata, duplicates: DuplicateMap,
+                   tombstones: Optional[Dict[str, list]]):
+    id_width = max([1] + [max(len(s), len(l), len(duplicates.get(s, s))) for s, l, _ in rows])
+    vocab = {column: [] for column in CODED_COLUMNS}
+    _write_shard(path, len(rows), dim, id_width, vocab,
+                 lambda columns: _fill_added(columns, 0, rows, laws, vocab, duplicates), tombstones)
+
+def _compact(path: str, view: LayeredShard):
+    """Fold the layers of a shard into one base holding only its live rows"""
+    id_width = max([1] + [
+        max(layer.section_ids.dtype.itemsize, layer.law_ids.dtype.itemsize, layer.groups.dtype.itemsize) // 4
+        for layer in view.layers
+    ])
+    vocab = {column: [] for column in CODED_COLUMNS}
+
+    def fill(columns):
+        at = 0
+        for layer, live in zip(view.layers, view.live):
+            rows = np.arange(len(layer)) if live is None else np.flatnonzero(live)
+            # Each layer has its own vocabulary
+            remap = {
+                column: np.asarray([_encode(vocab, column, value) for value in layer.vocab.get(column, [])] or [0], dtype=np.int32)
+                for column in CODED_COLUMNS
+            }
+            for start in range(0, len(rows), COPY_CHUNK_ROWS):
+                chunk = rows[start:start + COPY_CHUNK_ROWS]
+                span = slice(at, at + len(chunk))
+                columns["vectors"][span] = layer.vectors[chunk]
+                columns["section_ids"][span] = layer.section_ids[chunk]
+                columns["law_ids"][span] = layer.law_ids[chunk]
+                columns["groups"][span] = layer.groups[chunk]
+                columns["years"][span] = layer.years[chunk]
+                for column in CODED_COLUMNS:
+                    columns[column][span] = remap[column][np.asarray(layer.codes[column][chunk])]
+                at += len(chunk)
+
+    _write_shard(path, len(view), view.dim, id_width, vocab, fill)
+
+def ensure_snapshot():
+    """Build the first snapshot for a store that predates the index (or its current format),
+    or whose index was built from another store (file-based vs MongoDB, another database)"""
+    if np is None:
+        return
+    snapshot = get_snapshot()
+    if snapshot is None or snapshot.format != FORMAT_VERSION:
+        rebuild()
+
+def status() -> Dict[str, Any]:
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return {"enabled": np is not None, "version": None, "sections": 0, "shards": {}}
+    return {
+        "enabled": True,
+        "version": snapshot.version,
+        "sections": len(snapshot),
+        "shards": {jurisdiction or "(none)": len(shard) for jurisdiction, shard in snapshot.shards.items()}
+    }
@@ -0,0 +1,80 @@
+"""Local stand-in for the Hugging Face inference endpoints.
+
+Serves the three models used by app/utils/nlp.py with configurable latency
+and failure rate. Point the app at it with HF_API_BASE=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_hf --port 8765 --latency-ms 80 --failure-rate 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+VECTOR_SIZE = 384
+
+def fake_embedding(text: str):
+    """Deterministic unit vector derived from the token hashes (similar texts overlap)"""
+    vector = [0.0] * VECTOR_SIZE
+    for token in text.lower().split():
+        digest = hashlib.md5(token.encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % VECTOR_SIZE
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def create_app(latency_ms: float = 50.0, jitter_ms: float = 10.0, failure_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Fake HF Inference")
+    rng = random.Random(seed)
+    app.state.calls = 0
+
+    @app.post("/{model:path}")
+    async def infer(model: str, request: Request) -> Any:
+        app.state.calls += 1
+        await asyncio.sleep(max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000)
+        if rng.random() < failure_rate:
+            return JSONResponse({"error": "Model is overloaded"}, status_code=503)
+
+        payload = await request.json()
+        inputs = payload.get("inputs")
+        if "MiniLM" in model:
+            texts = inputs if isinstance(inputs, list) else [inputs]
+            return [fake_embedding(t) for t in texts]
+        if "squad" in model:
+            context = inputs.get("context", "")
+            start = rng.randint(0, max(0, len(context) - 40))
+            return {"answer": context[start:start + 40], "score": rng.random(), "start": start, "end": start + 40}
+        if "bart" in model:
+            text = inputs if isinstance(inputs, str) else " ".join(inputs)
+            return [{"summary_text": text[:160]}]
+        return JSONResponse({"error": f"Unknown model {model}"}, status_code=404)
+
+    return app
+
+def serve_in_thread(port: int, **kwargs) -> uvicorn.Server:
+    """Start the fake server on a daemon thread and wait until it accepts requests"""
+    server = uvicorn.Server(uvicorn.Config(create_app(**kwargs), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Hugging Face inference server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed),
+        host="127.0.0.1", port=args.port, log_level="warning"
+    )
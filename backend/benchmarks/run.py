@@ -0,0 +1,220 @@
+"""Ingest and query latency benchmark.
+
+Generates a synthetic statute corpus, ingests it through /api/documents/upload
+and measures p50/p95/p99 latency of the search and RAG endpoints at a target
+concurrency. Inference calls go to the local fake in benchmarks/fake_hf.py, so
+runs are reproducible and free. Results are written as JSON for comparison
+across commits.
+
+    cd backend
+    python -m benchmarks.run --documents 50 --sections 40 --concurrency 8 --output bench.json
+    python -m benchmarks.run --store mongo --mongo-url mongodb://localhost:27017/
+
+File-based storage rewrites the JSON files on every upload, so keep
+--ingest-concurrency at 1 for that store.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from .synth import make_corpus, make_queries
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_latencies(latencies: List[float], errors: int, wall: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round((len(latencies) + errors) / wall, 2) if wall else 0.0,
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+async def run_ingest(client, args) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(args.ingest_concurrency)
+    sections_total = 0
+    errors = 0
+
+    async def upload(filename: str, title: str, pdf: bytes):
+        nonlocal sections_total, errors
+        async with semaphore:
+            response = await client.post(
+                "/api/documents/upload",
+                files={"file": (filename, pdf, "application/pdf")},
+                data={"title": title, "jurisdiction": "Pakistan"},
+            )
+            if response.status_code == 200:
+                sections_total += response.json().get("sections", 0)
+            else:
+                errors += 1
+
+    corpus = list(make_corpus(args.seed, args.documents, args.sections))
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(*doc) for doc in corpus))
+    wall = time.perf_counter() - start
+    return {
+        "documents": len(corpus),
+        "sections": sections_total,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "docs_per_sec": round(len(corpus) / wall, 2),
+        "sections_per_sec": round(sections_total / wall, 2),
+    }
+
+async def run_scenario(client, path: str, params_for, queries: List[str], args) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            response = await client.get(path, params=params_for(query))
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    # Warm up caches and connections outside the measured window
+    for query in queries[:args.warmup]:
+        await client.get(path, params=params_for(query))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return summarize_latencies(latencies, errors, time.perf_counter() - start)
+
+SCENARIOS = {
+    "search_text": ("/api/search", lambda q: {"q": q, "search_type": "text"}),
+    "search_vector": ("/api/search", lambda q: {"q": q, "search_type": "vector"}),
+    "search_hybrid": ("/api/search", lambda q: {"q": q, "search_type": "hybrid"}),
+    "search_advanced": ("/api/search/advanced", lambda q: {"q": q, "jurisdiction": "Pakistan", "year_from": 1990}),
+    "rag_ask": ("/api/rag/ask", lambda q: {"question": q}),
+}
+
+async def wait_until_ready(client, timeout: float) -> float:
+    """Poll /api/ready until the background warm-up has finished; returns the seconds waited"""
+    start = time.perf_counter()
+    while True:
+        response = await client.get("/api/ready")
+        if response.status_code == 200:
+            return round(time.perf_counter() - start, 2)
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError(f"App not ready after {timeout:.0f}s: {response.text}")
+        await asyncio.sleep(0.1)
+
+async def main(args) -> Dict:
+    import httpx
+
+    from .fake_hf import serve_in_thread
+    fake = serve_in_thread(
+        args.fake_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate, seed=args.seed
+    )
+
+    # Configuration is read at import time, so the environment must be set first
+    os.environ["HF_API_BASE"] = f"http://127.0.0.1:{args.fake_port}"
+    os.environ.setdefault("HF_TOKEN", "benchmark-token")
+    if args.store == "mongo":
+        os.environ["MONGO_URL"] = args.mongo_url
+    else:
+        # Unreachable server -> connect_db falls back to file storage after its ping timeout
+        os.environ["MONGO_URL"] = "mongodb://127.0.0.1:1/"
+    sys.path.insert(0, BACKEND_DIR)
+    from app.main import app
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+            # The lifespan returns before the warm-up has connected the database
+            results["warm_up_seconds"] = await wait_until_ready(client, args.ready_timeout)
+
+            from app import database as db
+            results["store"] = "mongo" if db.db is not None else "file"
+            if db.db is not None and args.drop:
+                for name in ("laws", "sections", "vectors", "queries"):
+                    db.db[name].delete_many({})
+
+            results["ingest"] = await run_ingest(client, args)
+            queries = make_queries(args.seed, max(args.requests, 1))
+            results["queries"] = {}
+            for name in args.scenarios:
+                path, params_for = SCENARIOS[name]
+                results["queries"][name] = await run_scenario(client, path, params_for, queries, args)
+                print(f"  {name}: {results['queries'][name]}", file=sys.stderr)
+    fake.should_exit = True
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Legal RAG ingest and query benchmark")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic statutes to ingest")
+    parser.add_argument("--sections", type=int, default=30, help="Sections per statute")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent query clients")
+    parser.add_argument("--ingest-concurrency", type=int, default=1, help="Concurrent uploads")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per scenario")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--store", choices=["file", "mongo"], default="file")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017/")
+    parser.add_argument("--drop", action="store_true", help="Empty the Mongo collections before ingest")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="Seconds to wait for the app warm-up")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean fake inference latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of fake calls returning 503")
+    parser.add_argument("--fake-port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Directory for uploads/ and data/ (default: fresh temp dir)")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="legal_rag_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    # The app prints its startup banner; keep stdout clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(main(args))
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,79 @@
+"""Synthetic statute text and PDF generation for benchmarks."""
+import random
+from typing import List
+
+VOCABULARY = [
+    "court", "appeal", "offence", "penalty", "contract", "property", "tenant", "landlord",
+    "federal", "provincial", "government", "authority", "commission", "tribunal", "evidence",
+    "witness", "bail", "sentence", "fine", "imprisonment", "license", "registration", "tax",
+    "revenue", "customs", "company", "director", "shareholder", "employee", "employer",
+    "wages", "inheritance", "succession", "marriage", "divorce", "guardian", "minor",
+    "land", "acquisition", "compensation", "notice", "hearing", "order", "decree", "rules",
+]
+
+BOILERPLATE = [
+    "This Act may be called the {title}.",
+    "It extends to the whole of Pakistan.",
+    "It shall come into force at once.",
+    "In this Act, unless there is anything repugnant in the subject or context,",
+]
+
+def make_sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+def make_statute_lines(rng: random.Random, title: str, sections: int, lines_per_section: int = 4) -> List[str]:
+    """Lines of a statute whose headings match parse_legal_document's rules"""
+    lines = [title.upper(), "An Act to provide for " + " ".join(rng.sample(VOCABULARY, 4)) + "."]
+    for n in range(1, sections + 1):
+        lines.append(f"Section {n}. " + rng.choice(VOCABULARY).capitalize())
+        if n == 1:
+            lines.extend(b.format(title=title) for b in BOILERPLATE[:3])
+        elif n == 2:
+            lines.append(BOILERPLATE[3])
+        lines.extend(make_sentence(rng) for _ in range(lines_per_section))
+    return lines
+
+def make_pdf(lines: List[str], lines_per_page: int = 50) -> bytes:
+    """Minimal multi-page PDF with Helvetica text that pypdf can extract"""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    font_id = 3 + 2 * len(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages)),
+    ]
+    for i, page_lines in enumerate(pages):
+        stream = "BT /F1 9 Tf 12 TL 36 806 Td " + " ".join(f"({escape(l)}) '" for l in page_lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def make_corpus(seed: int, documents: int, sections_per_doc: int):
+    """Yield (filename, title, pdf bytes) for a reproducible synthetic corpus"""
+    rng = random.Random(seed)
+    for i in range(documents):
+        title = f"{rng.choice(VOCABULARY).capitalize()} {rng.choice(VOCABULARY).capitalize()} Act {1950 + i % 75}"
+        lines = make_statute_lines(rng, title, sections_per_doc)
+        yield f"statute_{i:05d}.pdf", title, make_pdf(lines)
+
+def make_queries(seed: int, count: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [" ".join(rng.sample(VOCABULARY, rng.randint(2, 4))) for _ in range(count)]
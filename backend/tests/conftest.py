@@ -0,0 +1,31 @@
+import pytest
+from app import database as db
+from app.utils import autocomplete, dedup, vector_index
+
+@pytest.fixture
+def file_store(tmp_path, monkeypatch):
+    """Empty file-based store (data/*.json) in a temporary working directory"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(db, "db", None)
+    monkeypatch.setattr(vector_index, "_snapshot", None)
+    monkeypatch.setattr(vector_index, "_current_stat", None)
+    monkeypatch.setattr(autocomplete, "_index", None)
+    monkeypatch.setattr(autocomplete, "_checked_at", 0.0)
+    vector_index._shard_cache.clear()
+    vector_index._view_cache.clear()
+    dedup.reset_index()
+    yield tmp_path
+    vector_index._shard_cache.clear()
+    vector_index._view_cache.clear()
+    dedup.reset_index()
+
+@pytest.fixture
+def mongo_store(file_store, monkeypatch):
+    """Empty in-memory MongoDB store (needs mongomock)"""
+    mongomock = pytest.importorskip("mongomock")
+    database = mongomock.MongoClient()["legal_rag_test"]
+    monkeypatch.setattr(db, "db", database)
+    for name in ("users", "laws", "sections", "queries", "vectors", "summaries"):
+        monkeypatch.setattr(db, name, database[name])
+    yield database
@@ -0,0 +1,39 @@
+from app.utils import autocomplete, storage, vector_index
+
+def store_law(title):
+    return storage.insert_documents([{
+        "law": {"title": title, "category": "criminal", "jurisdiction": "Federal", "year": 1860},
+        "text": "",
+        "sections": [{"section_number": "1", "content": "Short title."}],
+        "vectors": [[1.0, 0.0]]
+    }])[0]
+
+def test_requests_reload_an_index_another_worker_made_stale(file_store, monkeypatch):
+    store_law("Pakistan Penal Code")
+    index = autocomplete.get_index()
+    reloads = []
+    monkeypatch.setattr(autocomplete, "_reload_in_background", lambda: reloads.append(True))
+
+    assert autocomplete.current() is index
+    assert reloads == []
+
+    # Another worker publishes a new version
+    vector_index.rebuild()
+    monkeypatch.setattr(autocomplete, "_checked_at", 0.0)
+    assert autocomplete.current() is index
+    assert reloads == [True]
+    # Checks are throttled between requests
+    autocomplete.current()
+    assert reloads == [True]
+
+def test_own_writes_keep_the_index_current(file_store, monkeypatch):
+    store_law("Pakistan Penal Code")
+    index = autocomplete.get_index()
+    reloads = []
+    monkeypatch.setattr(autocomplete, "_reload_in_background", lambda: reloads.append(True))
+
+    store_law("Code of Criminal Procedure")
+
+    assert autocomplete.current() is index
+    assert reloads == []
+    assert [s["text"] for s in index.suggest("code")] == ["Code of Criminal Procedure", "Pakistan Penal Code"]
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from app.utils import dedup, storage
+
+TEXT = "Whoever contravenes any provision of this Act shall be punishable with fine which may extend to ten thousand rupees"
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def test_band_lookup_finds_hashes_within_max_distance():
+    index = dedup.SimHashIndex()
+    value = dedup.simhash(TEXT)
+    index.add("a", value)
+    # Flipped bits spread over every band: no band is left intact for a wider match
+    assert index.query(flip(value, [0, 17, 40])) == "a"
+    assert index.query(flip(value, [0, 17, 40, 60])) is None
+    index.remove(["a"])
+    assert index.query(value) is None and len(index) == 0
+
+def test_band_lookup_prefers_the_closest_section():
+    index = dedup.SimHashIndex()
+    value = dedup.simhash(TEXT)
+    index.add("far", flip(value, [1, 2, 3]))
+    index.add("near", flip(value, [1]))
+    assert index.query(value) == "near"
+
+def test_short_texts_are_not_hashed():
+    assert dedup.simhash("Omitted.") is None
+
+def fake_embeddings(monkeypatch, calls):
+    async def embed(texts, batch_size=None):
+        calls.extend(texts)
+        return [[float(len(text))] + [0.0] * 383 for text in texts]
+    monkeypatch.setattr(dedup, "create_vector_embeddings", embed)
+
+def document(contents):
+    return {"law": {"title": "Act", "jurisdiction": "Federal"}, "text": "",
+            "sections": [{"section_number": str(i + 1), "content": c} for i, c in enumerate(contents)]}
+
+def test_duplicates_of_a_stored_section_share_its_vector(file_store, monkeypatch):
+    calls = []
+    fake_embeddings(monkeypatch, calls)
+    first = document([TEXT])
+    first.update(asyncio.run(dedup.embed_sections(first["sections"])))
+    asyncio.run(dedup.store_documents([first]))
+
+    second = document([TEXT + "."])
+    second.update(asyncio.run(dedup.embed_sections(second["sections"])))
+    law_id = asyncio.run(dedup.store_documents([second]))[0]
+
+    assert calls == [TEXT]
+    section = storage.get_sections(law_id)[0]
+    assert section["duplicate_of"] is not None
+
+def test_duplicate_of_a_deleted_section_is_embedded(file_store, monkeypatch):
+    calls = []
+    fake_embeddings(monkeypatch, calls)
+    first = document([TEXT])
+    first.update(asyncio.run(dedup.embed_sections(first["sections"])))
+    first_id = asyncio.run(dedup.store_documents([first]))[0]
+
+    second = document([TEXT + "."])
+    second.update(asyncio.run(dedup.embed_sections(second["sections"])))
+    # The canonical goes away between the duplicate check and the write
+    storage.delete_documents([first_id])
+    with pytest.raises(dedup.CanonicalMissing):
+        storage.insert_documents([dict(second, duplicates=list(second["duplicates"]), vectors=list(second["vectors"]))])
+    law_id = asyncio.run(dedup.store_documents([second]))[0]
+
+    section = storage.get_sections(law_id)[0]
+    vectors = storage.get_vectors_by_section_ids([section["id"]])
+    assert section["duplicate_of"] is None
+    assert vectors[section["id"]] == [float(len(TEXT + "."))] + [0.0] * 383
+    assert calls == [TEXT, TEXT + "."]
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import documents
+from app.utils import storage
+
+@pytest.fixture
+def client(file_store):
+    app = FastAPI()
+    app.include_router(documents.router)
+    return TestClient(app)
+
+@pytest.fixture
+def law_id(file_store):
+    return storage.insert_documents([{
+        "law": {"title": "Contract Act", "category": "civil", "jurisdiction": "Punjab", "year": 1872},
+        "text": "",
+        "sections": [{"section_number": str(i + 1), "content": f"Section {i + 1} of the act."} for i in range(3)],
+        "vectors": [[float(i + 1), 0.0] for i in range(3)]
+    }], publish=False)[0]
+
+def test_unchanged_document_answers_304(client, law_id):
+    first = client.get(f"/api/documents/{law_id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get(f"/api/documents/{law_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+    assert client.get(f"/api/documents/{law_id}", headers={"If-None-Match": "*"}).status_code == 304
+
+def test_each_page_has_its_own_etag(client, law_id):
+    etag = client.get(f"/api/documents/{law_id}?limit=2").headers["etag"]
+    other_page = client.get(f"/api/documents/{law_id}?limit=2&page=2", headers={"If-None-Match": etag})
+    assert other_page.status_code == 200
+    assert [section["section_number"] for section in other_page.json()["sections"]] == ["3"]
+
+def test_reindex_invalidates_the_etag(client, law_id):
+    etag = client.get(f"/api/documents/{law_id}").headers["etag"]
+    storage.bump_store_generation()
+    response = client.get(f"/api/documents/{law_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_if_modified_since(client, law_id):
+    modified = client.get(f"/api/documents/{law_id}").headers["last-modified"]
+    assert client.get(f"/api/documents/{law_id}", headers={"If-Modified-Since": modified}).status_code == 304
+    stale = client.get(f"/api/documents/{law_id}", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+    assert stale.status_code == 200
+
+def test_update_with_no_extracted_sections_keeps_the_law(client, law_id, file_store, monkeypatch):
+    monkeypatch.setattr(documents, "extract_text_from_pdf", lambda path: "")
+    (file_store / "uploads").mkdir()
+    response = client.put(f"/api/documents/{law_id}", files={"file": ("scan.pdf", b"%PDF-1.4", "application/pdf")})
+    assert response.status_code == 400
+    assert len(storage.get_sections(law_id)) == 3
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from app.utils import nlp
+
+@pytest.fixture
+def failing_api(monkeypatch):
+    async def post(url, payload):
+        raise nlp.InferenceError("HF API Error 503: model loading")
+    monkeypatch.setattr(nlp, "HF_TOKEN", "token")
+    monkeypatch.setattr(nlp, "post_hf_api", post)
+
+def test_embeddings_fall_back_to_hashing(failing_api):
+    vectors = asyncio.run(nlp.create_vector_embeddings(["a", "b"]))
+    assert vectors == [nlp.hash_embedding("a"), nlp.hash_embedding("b")]
+
+def test_strict_embeddings_raise_instead_of_falling_back(failing_api):
+    with pytest.raises(nlp.InferenceError):
+        asyncio.run(nlp.create_vector_embeddings(["a", "b"], strict=True))
+
+def test_strict_embeddings_reject_malformed_responses(monkeypatch):
+    async def post(url, payload):
+        return [[0.1, 0.2]]
+    monkeypatch.setattr(nlp, "HF_TOKEN", "token")
+    monkeypatch.setattr(nlp, "post_hf_api", post)
+    with pytest.raises(nlp.InferenceError):
+        asyncio.run(nlp.create_vector_embeddings(["a", "b"], strict=True))
+
+def test_strict_embeddings_hash_without_a_token(monkeypatch):
+    monkeypatch.setattr(nlp, "HF_TOKEN", None)
+    assert asyncio.run(nlp.create_vector_embeddings(["a"], strict=True)) == [nlp.hash_embedding("a")]
+
+def test_query_embedding_falls_back_on_errors_but_not_when_shed(failing_api, monkeypatch):
+    assert asyncio.run(nlp.create_vector_embedding("a")) == nlp.hash_embedding("a")
+
+    async def shed(url, payload):
+        raise nlp.InferenceOverloaded("interactive inference call shed: 64 calls already queued")
+    monkeypatch.setattr(nlp, "post_hf_api", shed)
+    with pytest.raises(nlp.InferenceOverloaded):
+        asyncio.run(nlp.create_vector_embedding("a"))
@@ -0,0 +1,51 @@
+import threading
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.reindex import ShadowStore
+from app.utils import storage, vector_index
+
+def law(title, vector):
+    return {
+        "law": {"title": title, "category": "civil", "jurisdiction": "Federal", "year": 2000},
+        "text": "",
+        "sections": [{"section_number": "1", "content": f"{title} applies."}],
+        "vectors": [vector]
+    }
+
+def indexed_law_ids():
+    snapshot = vector_index.get_snapshot()
+    return {str(law_id) for shard in snapshot.shards.values() for layer in shard.layers for law_id in layer.law_ids}
+
+def test_upload_during_the_switch_lands_in_the_new_set(file_store):
+    old_id = storage.insert_documents([law("Old Act", [1.0, 0.0])])[0]
+    shadow = ShadowStore()
+    shadow.write(old_id, ["100"], [{"section_number": "1", "content": "Old Act, re-parsed."}], [None], [None], [[1.0, 0.0]])
+    uploaded = []
+    upload = threading.Thread(target=lambda: uploaded.extend(storage.insert_documents([law("New Act", [0.0, 1.0])])))
+
+    def switch():
+        # The upload waits for the switch instead of writing to the set being replaced
+        upload.start()
+        upload.join(0.2)
+        assert upload.is_alive()
+        shadow.switch()
+
+    vector_index.rebuild(shadow.iter_vector_rows(), storage.get_law_metadata(), shadow.iter_duplicate_sections(),
+                         before_swap=switch, swap_lock=lambda: storage.write_lock(exclusive=True))
+    upload.join()
+
+    assert [sec["content"] for sec in storage.get_sections(old_id)] == ["Old Act, re-parsed."]
+    assert [sec["content"] for sec in storage.get_sections(uploaded[0])] == ["New Act applies."]
+    assert {law["id"] for law in storage.load_json(storage.LAWS_FILE)} == {old_id, uploaded[0]}
+    assert indexed_law_ids() == {old_id, uploaded[0]}
+
+def test_changes_written_before_a_switch_are_not_published(file_store):
+    storage.insert_documents([law("Old Act", [1.0, 0.0])])
+    version = vector_index.read_current_version()
+    generation = storage.store_generation()
+    storage.bump_store_generation()
+
+    assert vector_index.publish_changes(added=[("99", "9", [0.0, 1.0])], generation=generation) is None
+    assert vector_index.read_current_version() == version
@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from app.utils import scheduler as sched
+from app.utils.scheduler import InferenceScheduler, InferenceOverloaded, INTERACTIVE, INGEST, MAINTENANCE
+
+def blocked_scheduler():
+    """No tokens and a slow refill: every acquire has to queue"""
+    scheduler = InferenceScheduler(rate=0.001, burst=3, max_concurrency=1)
+    scheduler.tokens = 0.0
+    return scheduler
+
+def test_interactive_calls_are_shed_past_the_queue_depth(monkeypatch):
+    monkeypatch.setitem(sched.SHED_DEPTH, INTERACTIVE, 2)
+
+    async def run():
+        scheduler = blocked_scheduler()
+        waiters = [asyncio.create_task(scheduler.acquire(INTERACTIVE)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(InferenceOverloaded):
+            await scheduler.acquire(INTERACTIVE)
+        for waiter in waiters:
+            waiter.cancel()
+        return scheduler.stats[INTERACTIVE].shed
+
+    assert asyncio.run(run()) == 1
+
+def test_cancelled_waiters_do_not_count_towards_the_depth(monkeypatch):
+    monkeypatch.setitem(sched.SHED_DEPTH, INTERACTIVE, 2)
+
+    async def run():
+        scheduler = blocked_scheduler()
+        waiters = [asyncio.create_task(scheduler.acquire(INTERACTIVE)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.sleep(0)
+        late = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        queued = scheduler.status()["classes"][INTERACTIVE]["queued"]
+        late.cancel()
+        return queued, scheduler.stats[INTERACTIVE].shed
+
+    assert asyncio.run(run()) == (1, 0)
+
+@pytest.mark.parametrize("cls", [INGEST, MAINTENANCE])
+def test_stored_embeddings_are_never_shed(cls):
+    async def run():
+        scheduler = blocked_scheduler()
+        waiters = [asyncio.create_task(scheduler.acquire(cls)) for _ in range(200)]
+        await asyncio.sleep(0)
+        queued = scheduler.status()["classes"][cls]["queued"]
+        for waiter in waiters:
+            waiter.cancel()
+        return queued, scheduler.stats[cls].shed
+
+    assert asyncio.run(run()) == (200, 0)
+
+def test_interactive_calls_are_granted_first():
+    async def run():
+        scheduler = blocked_scheduler()
+        granted = []
+
+        async def call(cls):
+            await scheduler.acquire(cls)
+            granted.append(cls)
+            scheduler.release()
+
+        tasks = [asyncio.create_task(call(cls)) for cls in (MAINTENANCE, INGEST, INTERACTIVE)]
+        await asyncio.sleep(0)
+        scheduler.tokens = 3.0
+        scheduler._dispatch()
+        await asyncio.gather(*tasks)
+        return granted
+
+    assert asyncio.run(run()) == [INTERACTIVE, INGEST, MAINTENANCE]
+
+def test_cli_budget_is_carved_out_of_the_workers_share(monkeypatch):
+    monkeypatch.setattr(sched, "HF_RATE_LIMIT", 10.0)
+    monkeypatch.setattr(sched, "HF_BURST", 20)
+    monkeypatch.setattr(sched, "HF_MAX_CONCURRENCY", 8)
+    assert sched._share(0.2) == (2.0, 4, 1)
+    assert sched._share(0.8, 2) == (4.0, 8, 3)
+
+def test_zero_rate_means_unlimited():
+    async def run():
+        scheduler = InferenceScheduler(rate=0.0, burst=1, max_concurrency=2)
+        await scheduler.acquire(INTERACTIVE)
+        await scheduler.acquire(INTERACTIVE)
+        queued = asyncio.create_task(scheduler.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        # Only the concurrency cap holds the third call back
+        assert not queued.done()
+        scheduler.release()
+        await asyncio.wait_for(queued, 1)
+        scheduler.throttled()
+        return scheduler.status()["classes"][INTERACTIVE]["admitted"]
+
+    assert asyncio.run(run()) == 3
+
+def test_cli_budget_without_a_rate_limit(monkeypatch):
+    monkeypatch.setattr(sched, "HF_RATE_LIMIT", 0.0)
+    scheduler = InferenceScheduler(*sched._share(1.0))
+    scheduler.set_budget(*sched._share(0.0))
+    assert scheduler.rate == 0.0
+    asyncio.run(scheduler.acquire(INGEST))
@@ -0,0 +1,47 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import search
+from app.utils import storage, vector_index
+from app.utils.scheduler import InferenceOverloaded
+
+def test_shed_query_embedding_answers_503(file_store, monkeypatch):
+    async def shed(text):
+        raise InferenceOverloaded("interactive inference call shed: 64 calls already queued")
+
+    monkeypatch.setattr(search, "create_vector_embedding", shed)
+    app = FastAPI()
+    app.include_router(search.router)
+    response = TestClient(app).get("/api/search", params={"q": "short title"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+def store_law(category, seed):
+    return storage.insert_documents([{
+        "law": {"title": "Act", "category": category, "jurisdiction": "Federal", "year": 2000},
+        "text": "",
+        "sections": [{"section_number": "1", "content": f"Provision {seed}."}],
+        "vectors": [[1.0, float(seed)]]
+    }])[0]
+
+async def embed(text):
+    return [1.0, 0.0]
+
+def test_empty_filters_are_ignored(file_store, monkeypatch):
+    monkeypatch.setattr(search, "create_vector_embedding", embed)
+    law_id = store_law("civil", 0)
+    vector_index.rebuild()
+
+    response = asyncio.run(search.perform_search("provision", "vector", category="", jurisdiction=" "))
+    assert [result["law_id"] for result in response["results"]] == [law_id]
+
+def test_broad_filters_are_applied_to_the_results(mongo_store, monkeypatch):
+    monkeypatch.setattr(search, "create_vector_embedding", embed)
+    monkeypatch.setattr(vector_index, "get_snapshot", lambda: None)
+    civil = store_law("civil", 0)
+    store_law("criminal", 0)
+
+    for max_ids in (10, 0):
+        monkeypatch.setattr(storage, "MAX_FILTER_LAW_IDS", max_ids)
+        response = asyncio.run(search.perform_search("provision", "vector", category="civil"))
+        assert [result["law_id"] for result in response["results"]] == [civil]
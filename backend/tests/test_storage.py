@@ -0,0 +1,128 @@
+import pytest
+from app.utils import storage
+
+def section(number, content):
+    return {"section_number": number, "title": f"Section {number}", "content": content}
+
+def vector(seed):
+    return [float(seed)] + [0.0] * 383
+
+OLD = [
+    section("1", "Short title and commencement."),
+    section("2", "Definitions of the words used."),
+    section("3", "Penalty of ten rupees."),
+    section("4", "Repeal of the earlier act."),
+]
+
+def store_law(sections):
+    law_id = storage.insert_documents([{
+        "law": {"title": "Act", "category": "civil", "jurisdiction": "Federal", "year": 2000},
+        "text": "",
+        "sections": sections,
+        "vectors": [vector(i + 1) for i in range(len(sections))]
+    }])[0]
+    return law_id, storage.get_sections(law_id)
+
+def stored_vectors():
+    return {v["section_id"]: v["vector"] for v in storage.load_json(storage.VECTORS_FILE)}
+
+def test_plan_reorders_moved_sections_without_embedding(file_store):
+    _, old = store_law(OLD)
+    new = [OLD[2], OLD[0], OLD[3], OLD[1]]
+
+    plan = storage.plan_section_update(old, new)
+
+    assert plan["update"] == [] and plan["insert"] == [] and plan["delete"] == []
+    assert [(section_id, order) for section_id, _, order, _ in plan["keep"]] == [
+        (old[2]["id"], 0), (old[0]["id"], 1), (old[3]["id"], 2), (old[1]["id"], 3)
+    ]
+
+def test_plan_matches_changed_content_by_section_number(file_store):
+    _, old = store_law(OLD)
+    new = [OLD[0], section("2", "Definitions, amended."), OLD[2], section("5", "Appeals lie to the court.")]
+
+    plan = storage.plan_section_update(old, new)
+
+    assert [section_id for section_id, _, _, _ in plan["keep"]] == [old[0]["id"], old[2]["id"]]
+    assert [(section_id, order) for section_id, _, order, _ in plan["update"]] == [(old[1]["id"], 1)]
+    assert [(sec["section_number"], order) for sec, order, _ in plan["insert"]] == [("5", 3)]
+    assert plan["delete"] == [old[3]["id"]]
+
+def test_plan_matches_repeated_content_once(file_store):
+    repeated = [section("1", "Omitted."), section("2", "Omitted.")]
+    _, old = store_law(repeated)
+
+    plan = storage.plan_section_update(old, repeated + [section("3", "Omitted.")])
+
+    assert sorted(section_id for section_id, _, _, _ in plan["keep"]) == sorted(sec["id"] for sec in old)
+    assert [sec["section_number"] for sec, _, _ in plan["insert"]] == ["3"]
+
+def test_apply_keeps_ids_and_vectors_of_unchanged_sections(file_store):
+    law_id, old = store_law(OLD)
+    before = stored_vectors()
+    new = [OLD[2], OLD[0], section("2", "Definitions, amended."), section("5", "Appeals lie to the court.")]
+    plan = storage.plan_section_update(old, new)
+
+    inserted = storage.apply_section_update(law_id, plan, [vector(20)], [vector(50)], {"sections_count": len(new)})
+
+    after = storage.get_sections(law_id)
+    vectors = stored_vectors()
+    assert [sec["id"] for sec in after] == [old[2]["id"], old[0]["id"], old[1]["id"], inserted[0]]
+    assert [sec["order"] for sec in after] == [0, 1, 2, 3]
+    # Moved sections keep their stored vector; the amended one is re-embedded in place
+    assert vectors[old[2]["id"]] == before[old[2]["id"]]
+    assert vectors[old[0]["id"]] == before[old[0]["id"]]
+    assert vectors[old[1]["id"]] == vector(20)
+    assert vectors[inserted[0]] == vector(50)
+    assert old[3]["id"] not in vectors
+    assert after[2]["content"] == "Definitions, amended."
+    assert storage.get_law(law_id)["sections_count"] == 4
+
+def test_apply_rejects_a_plan_of_an_older_revision(file_store):
+    law_id, old = store_law(OLD)
+    first = storage.plan_section_update(old, [section("1", "Short title, amended.")] + OLD[1:])
+    second = storage.plan_section_update(old, OLD[:3])
+
+    storage.apply_section_update(law_id, first, [vector(10)], [], {"sections_count": 4}, revision=0)
+    with pytest.raises(storage.StaleUpdate):
+        storage.apply_section_update(law_id, second, [], [], {"sections_count": 3}, revision=0)
+
+    assert storage.get_law(law_id)["revision"] == 1
+    assert len(storage.get_sections(law_id)) == 4
+
+def test_mongo_update_claims_the_revision_before_writing(mongo_store):
+    law_id, old = store_law(OLD)
+    plan = storage.plan_section_update(old, OLD[:3])
+
+    with pytest.raises(storage.StaleUpdate):
+        storage.apply_section_update(law_id, plan, [], [], {"sections_count": 3}, revision=1)
+    assert storage.count_sections(law_id) == 4
+
+    storage.apply_section_update(law_id, plan, [], [], {"sections_count": 3}, revision=0)
+    assert storage.count_sections(law_id) == 3
+    assert storage.get_law(law_id)["revision"] == 1
+
+def test_malformed_mongo_id_is_not_found(mongo_store):
+    assert storage.get_law("not-an-object-id") is None
+
+@pytest.mark.parametrize("store", ["file_store", "mongo_store"])
+def test_deleting_a_law_drops_its_cached_summaries(store, request):
+    request.getfixturevalue(store)
+    law_id, _ = store_law(OLD)
+    other_id, _ = store_law(OLD)
+    storage.save_summaries({"chunk-hash": "Shared chunk."}, law_id, 0)
+    storage.save_summaries({f"law:{law_id}:abc": "Whole act."}, law_id, 2)
+    storage.save_summaries({f"law:{other_id}:abc": "Other act."}, other_id, 2)
+
+    storage.delete_documents([law_id])
+
+    keys = ["chunk-hash", f"law:{law_id}:abc", f"law:{other_id}:abc"]
+    assert sorted(storage.get_summaries(keys)) == ["chunk-hash", f"law:{other_id}:abc"]
+
+@pytest.mark.parametrize("store", ["file_store", "mongo_store"])
+def test_find_law_ids_gives_up_past_the_limit(store, request):
+    request.getfixturevalue(store)
+    law_ids = sorted(store_law(OLD)[0] for _ in range(3))
+    assert sorted(storage.find_law_ids(category="civil", limit=3)) == law_ids
+    assert storage.find_law_ids(category="civil", limit=2) is None
+    assert storage.find_law_ids(category="criminal", limit=2) == []
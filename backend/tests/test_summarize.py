@@ -0,0 +1,58 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import rag
+from app.utils.nlp import content_hash
+from app.utils.summarize import chunk_sections, SECTIONS_PER_CHUNK
+
+def sections(count, length=300):
+    return [
+        {"id": f"sec-{i}", "title": f"Section {i}", "content": (f"Provision {i} " * length)[:length].strip()}
+        for i in range(1, count + 1)
+    ]
+
+def chunk_keys(secs, max_chars=3000):
+    return [content_hash(chunk) for chunk in chunk_sections(secs, max_chars)]
+
+def test_chunks_follow_section_boundaries():
+    secs = sections(40)
+    chunks = chunk_sections(secs, 3000)
+    assert "\n\n".join(chunks) == "\n\n".join(f"{s['title']}\n{s['content']}" for s in secs)
+    assert 1 < len(chunks) < len(secs)
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+
+def test_amending_one_section_changes_only_its_chunk():
+    secs = sections(40)
+    before = chunk_keys(secs)
+
+    for amended_content in ("Repealed.", "Substituted provision. " * 40):
+        amended = [dict(s) for s in secs]
+        amended[4]["content"] = amended_content
+        after = chunk_keys(amended)
+
+        assert len(after) == len(before)
+        changed = [i for i, (old, new) in enumerate(zip(before, after)) if old != new]
+        assert len(changed) == 1
+
+def test_inserting_a_section_keeps_other_chunks():
+    secs = sections(40)
+    before = set(chunk_keys(secs))
+    inserted = secs[:10] + [{"id": "new", "title": "Section 10A", "content": "Inserted."}] + secs[10:]
+    after = set(chunk_keys(inserted))
+    assert len(before - after) == 1
+
+def test_long_sections_are_split():
+    secs = [{"id": "1", "title": "Section 1", "content": "x" * 7000}]
+    chunks = chunk_sections(secs, 3000)
+    assert [len(chunk) for chunk in chunks] == [3000, 3000, 1010]
+
+def test_boundaries_do_not_depend_on_lengths():
+    short = sections(40, length=50)
+    long = sections(40, length=400)
+    assert len(chunk_sections(short, 100000)) == len(chunk_sections(long, 100000))
+    assert 40 / len(chunk_sections(short, 100000)) < SECTIONS_PER_CHUNK * 2
+
+def test_unknown_summary_mode_is_rejected(file_store):
+    app = FastAPI()
+    app.include_router(rag.router)
+    response = TestClient(app).get("/api/documents/anything/summarize", params={"mode": "fast"})
+    assert response.status_code == 422
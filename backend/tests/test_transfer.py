@@ -0,0 +1,103 @@
+import json
+import pytest
+from app import corpus
+from app.utils import storage, transfer
+
+def vector(seed):
+    return [float(seed)] + [0.0] * 383
+
+def store_laws():
+    return storage.insert_documents([
+        {
+            "law": {"title": title, "category": "civil", "jurisdiction": "Federal", "year": 2000 + i},
+            "text": "",
+            "sections": [{"section_number": str(n + 1), "content": f"{title}, provision {n + 1}."} for n in range(2)],
+            "vectors": [vector(i * 10 + n + 1) for n in range(2)]
+        }
+        for i, title in enumerate(["Contract Act", "Evidence Act"])
+    ])
+
+def corpus_snapshot():
+    """Laws with their sections and vectors, independent of the ids they were given"""
+    records = {record_type: [] for record_type in transfer.RECORD_TYPES}
+    for record_type, record in transfer._iter_store():
+        records[record_type].append(record)
+    vectors = {str(v["section_id"]): tuple(v["vector"]) for v in records["vector"]}
+    return sorted(
+        (law["title"], law["year"], tuple(sorted(
+            (sec["section_number"], sec["content"], vectors.get(str(sec["id"])))
+            for sec in records["section"] if sec["law_id"] == str(law["id"])
+        )))
+        for law in records["law"]
+    )
+
+def exported(tamper=None):
+    lines = list(transfer.export_lines())
+    if tamper:
+        lines = tamper(lines)
+    return lines
+
+def test_corpus_round_trip(file_store):
+    law_ids = store_laws()
+    before = corpus_snapshot()
+    path = str(file_store / "corpus.ndjson.gz")
+
+    assert corpus.export_corpus(path, compress=True) == 0
+    storage.delete_documents(law_ids)
+    assert corpus_snapshot() == []
+    assert corpus.import_corpus(path) == 0
+
+    assert corpus_snapshot() == before
+
+def test_import_next_to_existing_documents(file_store):
+    store_laws()
+    result = transfer.import_lines(exported())
+    assert result["imported"] == {"law": 2, "section": 4, "vector": 4}
+    assert len(corpus_snapshot()) == 4
+
+def footer_lists_one_more_section(lines):
+    footer = json.loads(lines[-1])
+    footer["data"]["counts"]["section"] += 1
+    return lines[:-1] + [json.dumps(footer) + "\n"]
+
+def invalid_line_after_the_laws(lines):
+    return lines[:3] + ["{not json\n"] + lines[3:]
+
+@pytest.mark.parametrize("store", ["file_store", "mongo_store"])
+@pytest.mark.parametrize("tamper, error", [
+    (footer_lists_one_more_section, "Export is incomplete"),
+    (invalid_line_after_the_laws, "Line 4 is not valid JSON"),
+    (lambda lines: lines[:-1], "no footer"),
+])
+def test_failed_import_is_rolled_back(store, tamper, error, request, monkeypatch):
+    request.getfixturevalue(store)
+    # Every record is written as soon as it is read
+    monkeypatch.setattr(transfer, "BATCH_SIZE", 1)
+    store_laws()
+    lines = exported(tamper)
+    before = corpus_snapshot()
+
+    with pytest.raises(transfer.TransferError, match=error):
+        transfer.import_lines(lines)
+
+    assert corpus_snapshot() == before
+
+def test_cli_reports_a_bad_import(file_store, capsys):
+    store_laws()
+    path = file_store / "corpus.ndjson"
+    path.write_text("".join(exported(footer_lists_one_more_section)), encoding="utf-8")
+    before = corpus_snapshot()
+
+    assert corpus.import_corpus(str(path)) == 1
+    assert "Export is incomplete" in capsys.readouterr().out
+    assert corpus_snapshot() == before
+
+def test_export_of_another_vector_size_is_refused(file_store):
+    def resized(lines):
+        header = json.loads(lines[0])
+        header["data"]["vector_size"] = 768
+        return [json.dumps(header) + "\n"] + lines[1:]
+
+    store_laws()
+    with pytest.raises(transfer.TransferError, match="768-dimensional"):
+        transfer.import_lines(exported(resized))
@@ -0,0 +1,193 @@
+import os
+import asyncio
+import threading
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.utils import storage, vector_index
+
+def unit(i, dim=8):
+    vector = [0.0] * dim
+    vector[i % dim] = 1.0
+    return vector
+
+def store_law(jurisdiction, contents):
+    return storage.insert_documents([{
+        "law": {"title": "Act", "category": "civil", "jurisdiction": jurisdiction, "year": 2000},
+        "text": "",
+        "sections": [{"section_number": str(i + 1), "content": c} for i, c in enumerate(contents)],
+        "vectors": [unit(i) for i in range(len(contents))]
+    }])[0]
+
+def test_rebuild_streams_rows_into_shards(file_store, monkeypatch):
+    monkeypatch.setattr(vector_index, "SPILL_ROWS", 2)
+    rows = [(str(i), "a" if i % 2 else "b", unit(i)) for i in range(7)]
+    laws = {"a": {"jurisdiction": "Punjab", "category": "tax", "year": 1999}, "b": {"jurisdiction": "Sindh", "year": 2005}}
+    duplicate_rows = [("d1", "b", "1"), ("gone", "a", "missing")]
+
+    vector_index.rebuild(iter(rows), laws, iter(duplicate_rows))
+
+    snapshot = vector_index.get_snapshot()
+    punjab, sindh = snapshot.shards["Punjab"].base, snapshot.shards["Sindh"].base
+    assert list(punjab.section_ids) == ["1", "3", "5"]
+    assert list(sindh.section_ids) == ["0", "2", "4", "6", "d1"]
+    # The duplicate sits in its own law's shard with a copy of its canonical's vector
+    assert list(sindh.groups)[-1] == "1"
+    assert np.array_equal(sindh.vectors[4], punjab.vectors[0])
+    assert list(punjab.years) == [1999] * 3
+    # Spilled vectors are scratch space
+    assert os.listdir(vector_index.BUILDS_DIR) == []
+
+def test_rebuild_skips_rows_of_another_dimension(file_store):
+    rows = [("1", "a", unit(1)), ("2", "a", [1.0, 0.0]), ("3", "a", unit(3))]
+    vector_index.rebuild(iter(rows), {"a": {"jurisdiction": "Punjab"}}, iter(()))
+    assert list(vector_index.get_snapshot().shards["Punjab"].base.section_ids) == ["1", "3"]
+
+def test_index_of_another_store_is_not_served(file_store, monkeypatch):
+    store_law("Punjab", ["Short title.", "Definitions."])
+    vector_index.ensure_snapshot()
+    built = vector_index.read_current_version()
+    assert vector_index.get_snapshot() is not None
+
+    monkeypatch.setattr(storage, "store_identity", lambda: "mongodb:0123456789ab/legal_rag_db")
+    assert vector_index.get_snapshot() is None
+    vector_index.ensure_snapshot()
+    assert vector_index.read_current_version() == built + 1
+    assert len(vector_index.get_snapshot()) == 2
+
+def test_unfiltered_search_merges_shards_best_first(file_store, monkeypatch):
+    query = [1.0, 0.5, 0.25, 0.0, 0.0, 0.0, 0.0, 0.0]
+    rows = [(str(i), "a" if i < 3 else "b", unit(i)) for i in range(6)]
+    laws = {"a": {"jurisdiction": "Punjab"}, "b": {"jurisdiction": "Sindh"}}
+    # "d0" repeats "0" in the other shard
+    vector_index.rebuild(iter(rows), laws, iter([("d0", "b", "0")]))
+    snapshot = vector_index.get_snapshot()
+    assert sorted(snapshot.shards) == ["Punjab", "Sindh"]
+
+    for parallel_min_rows in (10 ** 9, 0):
+        monkeypatch.setattr(vector_index, "PARALLEL_MIN_ROWS", parallel_min_rows)
+        hits = snapshot.search(query, 3)
+        assert {section_id for section_id, _, _ in hits[:2]} == {"0", "d0"}
+        assert hits[2][:2] == ("1", "a")
+        scores = [score for _, _, score in hits]
+        assert scores == sorted(scores, reverse=True)
+        # One result per near-duplicate group, even across shards
+        assert [section_id for section_id, _, _ in snapshot.search(query, 3, collapse=True)][1:] == ["1", "2"]
+
+    assert [section_id for section_id, _, _ in snapshot.search(query, 3, jurisdiction="Sindh")] == ["d0"]
+    assert snapshot.search(query, 3, jurisdiction="Balochistan") == []
+
+def live_rows(snapshot):
+    """(section_id, law_id, group, jurisdiction, year, category, vector) of every visible row"""
+    rows = set()
+    for jurisdiction, shard in snapshot.shards.items():
+        for layer, live in zip(shard.layers, shard.live):
+            for row in range(len(layer)):
+                if live is None or live[row]:
+                    category = layer.vocab["category"][layer.codes["category"][row]]
+                    rows.add((str(layer.section_ids[row]), str(layer.law_ids[row]), str(layer.groups[row]), jurisdiction,
+                              int(layer.years[row]), category, tuple(np.round(layer.vectors[row], 5))))
+    return rows
+
+def test_delta_segments_match_a_full_rebuild(file_store, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_FRACTION", 10.0)
+    punjab = store_law("Punjab", ["Short title.", "Definitions.", "Penalties."])
+    sindh = store_law("Sindh", ["Extent.", "Repeal."])
+    vector_index.rebuild()
+    base_paths = {shard.base.path for shard in vector_index.get_snapshot().shards.values()}
+
+    old = storage.get_sections(punjab)
+    plan = storage.plan_section_update(old, [
+        {"section_number": "1", "content": "Short title."},
+        {"section_number": "2", "content": "Definitions, amended."},
+        {"section_number": "4", "content": "Appeals."},
+    ])
+    storage.apply_section_update(punjab, plan, [unit(5)], [unit(6)], {"jurisdiction": "Sindh", "year": 2011})
+    storage.delete_documents([sindh])
+    store_law("Balochistan", ["Commencement."])
+
+    incremental = vector_index.get_snapshot()
+    # Writes appended segments; the bases were not rewritten
+    assert any(shard.segments for shard in incremental.shards.values())
+    assert base_paths & {shard.base.path for shard in incremental.shards.values() if shard.base is not None}
+    expected = live_rows(incremental)
+
+    vector_index.rebuild()
+    assert live_rows(vector_index.get_snapshot()) == expected
+    moved = {row[0] for row in expected if row[1] == punjab}
+    assert {row[3] for row in expected if row[1] == punjab} == {"Sindh"} and len(moved) == 3
+
+    query = unit(5)
+    assert vector_index.get_snapshot().search(query, 5) == incremental.search(query, 5)
+
+def test_rebuild_replays_writes_published_while_it_ran(file_store, monkeypatch):
+    store_law("Punjab", ["Short title.", "Definitions."])
+    vector_index.ensure_snapshot()
+    build_from_store = vector_index._build_from_store
+    late = []
+
+    def slow_build(scratch):
+        built = build_from_store(scratch)
+        # Another worker writes (and publishes) after the store was read
+        late.append(store_law("Sindh", ["Extent."]))
+        return built
+
+    monkeypatch.setattr(vector_index, "_build_from_store", slow_build)
+    vector_index.rebuild()
+
+    snapshot = vector_index.get_snapshot()
+    assert {row[1] for row in live_rows(snapshot)} >= set(late)
+    assert len(snapshot) == 3
+    # Once no build is running the log no longer holds the segment
+    assert vector_index.read_manifest(snapshot.version)["log"] == []
+
+def test_shards_are_compacted_once_segments_pile_up(file_store, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_FRACTION", 10.0)
+    monkeypatch.setattr(vector_index, "MAX_SEGMENTS", 2)
+    store_law("Punjab", ["Short title."])
+    vector_index.ensure_snapshot()
+    for i in range(2):
+        store_law("Punjab", [f"Section {i}."])
+        assert len(vector_index.get_snapshot().shards["Punjab"].segments) == i + 1
+    store_law("Punjab", ["Last."])
+
+    shard = vector_index.get_snapshot().shards["Punjab"]
+    assert shard.segments == [] and len(shard) == len(shard.base) == 4
+
+def test_api_writes_publish_off_the_event_loop(file_store, monkeypatch):
+    threads = []
+    monkeypatch.setattr(vector_index, "publish_changes", lambda **changes: threads.append(threading.current_thread().name))
+
+    async def write():
+        store_law("Punjab", ["Short title."])
+        return threading.current_thread().name
+
+    loop_thread = asyncio.run(write())
+    storage.wait_for_publishes()
+    assert threads and threads[0] != loop_thread
+
+def test_vector_search_runs_off_the_event_loop(file_store, monkeypatch):
+    from app.routers import search
+    store_law("Punjab", ["Short title."])
+    vector_index.rebuild()
+    threads = []
+    scan = vector_index.ShardedSnapshot.search
+
+    def recording_search(self, *args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return scan(self, *args, **kwargs)
+
+    async def embed(text):
+        return unit(0)
+
+    monkeypatch.setattr(vector_index.ShardedSnapshot, "search", recording_search)
+    monkeypatch.setattr(search, "create_vector_embedding", embed)
+
+    async def run():
+        response = await search.perform_search("short title", search_type="vector")
+        return response, threading.current_thread().name
+
+    response, loop_thread = asyncio.run(run())
+    assert [result["section_number"] for result in response["results"]] == ["1"]
+    assert threads and threads[0] != loop_thread
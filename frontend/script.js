@@ -10,6 +10,12 @@ let searchType = 'hybrid';
 let filters = {};
 let selectedFiles = [];
 
+// Search suggestions
+let suggestionItems = [];
+let activeSuggestion = -1;
+let suggestionController = null;
+let debouncedFetchSuggestions = null;
+
 // Modal state
 let currentViewData = null;
 let currentAIContext = '';
@@ -111,14 +117,16 @@ function getInitials(name) {
 
 function debounce(func, wait) {
     let timeout;
-    return function executedFunction(...args) {
+    function executedFunction(...args) {
         const later = () => {
             clearTimeout(timeout);
             func(...args);
         };
         clearTimeout(timeout);
         timeout = setTimeout(later, wait);
-    };
+    }
+    executedFunction.cancel = () => clearTimeout(timeout);
+    return executedFunction;
 }
 
 function getTimeAgo(date) {
@@ -762,6 +770,123 @@ function closeAdvancedSearch() {
     }
 }
 
+async function fetchSuggestions() {
+    const searchInput = document.getElementById('searchQuery');
+    if (!searchInput) return;
+    
+    const query = searchInput.value;
+    if (query.trim().length < 2) {
+        hideSuggestions();
+        return;
+    }
+    
+    // Only the latest keystroke's request matters
+    if (suggestionController) {
+        suggestionController.abort();
+    }
+    suggestionController = new AbortController();
+    
+    try {
+        const params = new URLSearchParams({ q: query, limit: '8' });
+        const response = await fetch(`${API_BASE_URL}/api/search/suggest?${params.toString()}`, {
+            signal: suggestionController.signal
+        });
+        if (!response.ok) return;
+        
+        const data = await response.json();
+        renderSuggestions(data.suggestions || []);
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.warn('Suggestions unavailable:', error);
+        }
+    }
+}
+
+function renderSuggestions(items) {
+    const container = document.getElementById('searchSuggestions');
+    if (!container) return;
+    
+    suggestionItems = items;
+    activeSuggestion = -1;
+    
+    if (!items.length) {
+        hideSuggestions();
+        return;
+    }
+    
+    const icons = { title: 'fa-file-alt', heading: 'fa-paragraph', query: 'fa-history' };
+    container.innerHTML = items.map((item, index) => `
+        <div class="search-suggestion" data-index="${index}" onmousedown="selectSuggestion(${index})">
+            <i class="fas ${icons[item.kind] || 'fa-search'}"></i>
+            <span>${escapeHtml(item.text)}</span>
+        </div>
+    `).join('');
+    container.classList.add('active');
+}
+
+function hideSuggestions() {
+    const container = document.getElementById('searchSuggestions');
+    if (container) {
+        container.classList.remove('active');
+        container.innerHTML = '';
+    }
+    suggestionItems = [];
+    activeSuggestion = -1;
+    
+    // Drop the pending keystroke and any in-flight request so stale suggestions never reappear
+    if (debouncedFetchSuggestions) {
+        debouncedFetchSuggestions.cancel();
+    }
+    if (suggestionController) {
+        suggestionController.abort();
+        suggestionController = null;
+    }
+}
+
+function highlightSuggestion(index) {
+    const container = document.getElementById('searchSuggestions');
+    if (!container) return;
+    
+    activeSuggestion = index;
+    container.querySelectorAll('.search-suggestion').forEach((el, i) => {
+        el.classList.toggle('active', i === index);
+    });
+}
+
+function selectSuggestion(index) {
+    const searchInput = document.getElementById('searchQuery');
+    const item = suggestionItems[index];
+    if (!searchInput || !item) return;
+    
+    searchInput.value = item.text;
+    hideSuggestions();
+    performSearch();
+}
+
+function setupSearchSuggestions(searchInput) {
+    searchInput.setAttribute('autocomplete', 'off');
+    debouncedFetchSuggestions = debounce(fetchSuggestions, 150);
+    searchInput.addEventListener('input', debouncedFetchSuggestions);
+    searchInput.addEventListener('blur', () => setTimeout(hideSuggestions, 100));
+    searchInput.addEventListener('keydown', function(e) {
+        if (!suggestionItems.length) return;
+        
+        if (e.key === 'ArrowDown') {
+            e.preventDefault();
+            highlightSuggestion((activeSuggestion + 1) % suggestionItems.length);
+        } else if (e.key === 'ArrowUp') {
+            e.preventDefault();
+            highlightSuggestion(activeSuggestion <= 0 ? suggestionItems.length - 1 : activeSuggestion - 1);
+        } else if (e.key === 'Enter' && activeSuggestion >= 0) {
+            // The keypress handler then searches for the chosen text
+            searchInput.value = suggestionItems[activeSuggestion].text;
+            hideSuggestions();
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+}
+
 // ============================================
 // UPLOAD FUNCTIONS
 // ============================================
@@ -1319,7 +1444,8 @@ async function viewDocument(docId) {
     try {
         showLoading(true, 'Loading document details...');
         
-        const response = await fetch(`${API_BASE_URL}/api/documents/${docId}`);
+        // The modal previews the first sections only
+        const response = await fetch(`${API_BASE_URL}/api/documents/${docId}?limit=5`);
         if (response.ok) {
             const data = await response.json();
             currentViewData = data;
@@ -1373,6 +1499,8 @@ function showDocumentModal(data) {
         const fileSize = formatFileSize(data.file_size || 0);
         const sectionsCount = data.sections_count || 0;
         
+        const sectionsTotal = data.sections_page ? data.sections_page.total : (data.sections || []).length;
+        
         let sectionsHtml = '';
         if (data.sections && data.sections.length > 0) {
             sectionsHtml = `
@@ -1388,7 +1516,7 @@ function showDocumentModal(data) {
                                 <div class="section-content">${escapeHtml(section.content_preview || '')}</div>
                             </div>
                         `).join('')}
-                        ${data.sections.length > 5 ? `<p class="text-center mt-sm">... and ${data.sections.length - 5} more sections</p>` : ''}
+                        ${sectionsTotal > 5 ? `<p class="text-center mt-sm">... and ${sectionsTotal - 5} more sections</p>` : ''}
                     </div>
                 </div>
             `;
@@ -2235,9 +2363,11 @@ async function init() {
     if (searchInput) {
         searchInput.addEventListener('keypress', function(e) {
             if (e.key === 'Enter') {
+                hideSuggestions();
                 performSearch();
             }
         });
+        setupSearchSuggestions(searchInput);
     }
     
     // Setup AI question input enter key listener